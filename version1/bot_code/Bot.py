@@ -10,7 +10,6 @@ import datetime
 from Commander import Answerer
 from Configuration import Configuration as Cfg
 from abc import ABCMeta, abstractmethod, ABC
-import telebot as tb
 import random
 from Settings import *
 
@@ -432,6 +431,8 @@ class TgBot(IBot):
         """
     def __init__(self):
         try:
+            # telebot импортируется только при запуске telegram бота
+            import telebot as tb
             self.tg = tb.TeleBot(Constants.tg_token.value, parse_mode=None)
             self.__last_messages = {}
             self.logs = {'ban_logs': Logs('tg_banned'), 'error_logs': Logs('tg_errors'), 'users_logs': Logs('tg_users'),
@@ -515,7 +516,7 @@ class TgBot(IBot):
             self.logs['error_logs'].update(peer_id, time_, type(e).__name__, str(e), traceback.format_exc())
             print(traceback.format_exc())
 
-    def get_user_first_name(self, event: tb.types.Message) -> str:
+    def get_user_first_name(self, event: "tb.types.Message") -> str:
         """
         Получение имени пользователя
 
@@ -534,7 +535,7 @@ class TgBot(IBot):
         """
         return event.from_user.first_name
 
-    def get_user_last_name(self, event: tb.types.Message) -> str:
+    def get_user_last_name(self, event: "tb.types.Message") -> str:
         """
         Получение фамилии пользователя
 
@@ -552,7 +553,7 @@ class TgBot(IBot):
         """
         return event.from_user.last_name
 
-    def get_username(self, event: tb.types.Message) -> str:
+    def get_username(self, event: "tb.types.Message") -> str:
         """
         Получение никнейма пользователя
 
@@ -606,7 +607,7 @@ class TgBot(IBot):
         """
         return self.logs['users_groups'].data[self.logs['users_groups'].data['user_id'] == peer_id]['user_group'].values[0]
 
-    def get_user(self, event: tb.types.Message) -> None:
+    def get_user(self, event: "tb.types.Message") -> None:
         """
         Запись данных о пользователе в базу данных
 
@@ -635,7 +636,7 @@ class TgBot(IBot):
             self.logs['error_logs'].update(event.from_user.id, time_, type(e).__name__, str(e), traceback.format_exc())
             print(traceback.format_exc())
 
-    def answer(self, event: tb.types.Message) -> None:
+    def answer(self, event: "tb.types.Message") -> None:
         """
         Функция, отправляющая ответ пользователю на его сообщение
 
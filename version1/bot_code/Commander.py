@@ -2,6 +2,7 @@ from Ban import *
 from Interpreter import *
 from Configuration import Configuration
 from Filter import BadWordsFilter
+from Exceptions import ExecutionLimitError
 import datetime
 
 
@@ -417,7 +418,11 @@ class Answerer:
                     language = Configuration.python_version
                     prefix, type_ = 'import sys\n', '.py'
                 executor = Interpreter(language, type_, prefix)
-                result = executor.execute_code(code, args)
+                try:
+                    result = executor.execute_code(code, args, user_id=peer_id)
+                except ExecutionLimitError:
+                    self.__answers[peer_id].clear()
+                    return {"answer": "Дождитесь выполнения предыдущей программы и попробуйте снова"}
                 self.__answers[peer_id].clear()
                 if not result:
                     return {"answer": "Программа вернула пустую строку"}
@@ -25,4 +25,10 @@ class Configuration(NamedTuple):
     QueryResponder = WolframalphaAPI
     GraphBuilder = WolframalphaAPI
     python_version = "python3.9"
+    code_workers = 4
+    code_per_user = 1
+    code_cpu_time = 2
+    code_memory = 256 * 1024 * 1024
+    code_timeout = 5
+    code_output_limit = 4096
     Saver = PandasSaver
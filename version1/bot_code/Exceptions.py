@@ -19,3 +19,7 @@ class GDConnection(GoogleDriveError):
 
 class WolframalphaError(Exception):
     pass
+
+
+class ExecutionLimitError(Exception):
+    pass
@@ -0,0 +1,265 @@
+import json
+import queue
+import subprocess
+import threading
+from Exceptions import ExecutionLimitError
+
+
+# Исходный код процесса-заготовки. Процесс запускается один раз и на каждую задачу делает fork:
+# дочерний процесс ограничивает себе ресурсы и выполняет код (python - прямо в уже запущенном
+# интерпретаторе, другие языки - через exec), поэтому на задачу не тратится время запуска python.
+# Задачи и ответы передаются через stdin/stdout строками json, файлы не используются.
+ZYGOTE_SOURCE = r'''
+import json, os, resource, select, signal, sys, time
+
+CPU_TIME, MEMORY, TIMEOUT, OUTPUT_LIMIT = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4])
+protocol_in = os.fdopen(os.dup(0), "rb")
+protocol_out = os.fdopen(os.dup(1), "wb")
+
+
+def limit():
+    os.setsid()
+    resource.setrlimit(resource.RLIMIT_CPU, (CPU_TIME, CPU_TIME))
+    resource.setrlimit(resource.RLIMIT_AS, (MEMORY, MEMORY))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def child(job, out_w, code_r):
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(code_r if job["stdin"] else devnull, 0)
+    os.dup2(out_w, 1)
+    os.dup2(devnull, 2)
+    os.closerange(3, 256)
+    limit()
+    if job["mode"] == "python":
+        sys.argv = ["main.py"] + job["args"]
+        sys.stdin = open(0, closefd=False)
+        sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+        status = 0
+        try:
+            exec(compile(job["code"], "main.py", "exec"), {"__name__": "__main__"})
+        except SystemExit:
+            pass
+        except BaseException:
+            status = 1
+        try:
+            sys.stdout.flush()
+        finally:
+            os._exit(status)
+    os.execvp(job["argv"][0], job["argv"])
+
+
+def run(job):
+    out_r, out_w = os.pipe()
+    code_r, code_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            child(job, out_w, code_r)
+        finally:
+            os._exit(1)
+    os.close(out_w)
+    os.close(code_r)
+    if job["stdin"]:
+        try:
+            os.write(code_w, job["code"].encode("utf-8"))
+        except OSError:
+            pass
+    os.close(code_w)
+    output = b""
+    deadline = time.monotonic() + TIMEOUT
+    timed_out = False
+    while True:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            timed_out = True
+            break
+        ready, _, _ = select.select([out_r], [], [], left)
+        if not ready:
+            continue
+        chunk = os.read(out_r, 65536)
+        if not chunk:
+            break
+        if len(output) < OUTPUT_LIMIT:
+            output += chunk[:OUTPUT_LIMIT - len(output)]
+    os.close(out_r)
+    # программа могла закрыть stdout и продолжить работу, поэтому срок проверяется и после конца вывода
+    while not timed_out and os.waitpid(pid, os.WNOHANG) == (0, 0):
+        if time.monotonic() >= deadline:
+            timed_out = True
+        else:
+            time.sleep(0.01)
+    if timed_out:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+        os.waitpid(pid, 0)
+    return {"output": output.decode("utf-8", "replace"), "timeout": timed_out}
+
+
+for line in protocol_in:
+    protocol_out.write(json.dumps(run(json.loads(line))).encode("utf-8") + b"\n")
+    protocol_out.flush()
+'''
+
+
+class Zygote:
+    """
+    Процесс-заготовка, выполняющий задачи пула
+
+    Attributes
+    ----------
+    process: subprocess.Popen
+        Процесс интерпретатора с запущенным ZYGOTE_SOURCE
+    """
+    def __init__(self, interpreter: str, limits: list):
+        self.process = subprocess.Popen(
+            [interpreter, "-c", ZYGOTE_SOURCE, *[str(i) for i in limits]],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+
+    def run(self, job: dict) -> dict:
+        """
+        Выполнение задачи
+
+        Parameters
+        ----------
+        job: dict
+            Описание задачи (см. ExecutionPool.execute)
+
+        Returns
+        -------
+        dict
+            Ответ процесса: вывод программы и признак превышения времени
+
+        Raises
+        ------
+        OSError
+            Если процесс-заготовка завершился
+        """
+        self.process.stdin.write(json.dumps(job).encode("utf-8") + b"\n")
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise BrokenPipeError("zygote process exited")
+        return json.loads(line)
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+
+class ExecutionPool:
+    """
+    Пул заранее запущенных процессов для выполнения пользовательского кода с ограничением ресурсов
+
+    Каждая программа выполняется в отдельном дочернем процессе с ограничениями на процессорное время,
+    память, запись файлов и создание процессов, и принудительно завершается по истечении timeout.
+    Количество одновременно выполняемых программ ограничено размером пула,
+    остальные задачи ждут в очереди.
+
+    Attributes
+    ----------
+    interpreter: str
+        Интерпретатор python, в котором запускаются процессы пула
+    size: int
+        Количество процессов в пуле
+    per_user: int
+        Максимальное количество одновременно выполняемых программ одного пользователя
+    limits: list
+        Ограничения: процессорное время (с), память (байт), время выполнения (с), размер вывода (байт)
+    queue_timeout: float
+        Максимальное время ожидания свободного процесса
+    """
+    def __init__(self, interpreter: str, size: int = 4, per_user: int = 1, cpu_time: int = 2,
+                 memory: int = 256 * 1024 * 1024, timeout: float = 5, output_limit: int = 4096,
+                 queue_timeout: float = 30):
+        self.interpreter = interpreter
+        self.size = size
+        self.per_user = per_user
+        self.limits = [cpu_time, memory, timeout, output_limit]
+        self.queue_timeout = queue_timeout
+        self.__idle = queue.Queue()
+        self.__running = {}
+        self.__lock = threading.Lock()
+        for _ in range(size):
+            self.__idle.put(Zygote(self.interpreter, self.limits))
+
+    def __acquire_user(self, user_id) -> None:
+        if user_id is None:
+            return
+        with self.__lock:
+            if self.__running.get(user_id, 0) >= self.per_user:
+                raise ExecutionLimitError(f"user {user_id} already runs {self.per_user} programs")
+            self.__running[user_id] = self.__running.get(user_id, 0) + 1
+
+    def __release_user(self, user_id) -> None:
+        if user_id is None:
+            return
+        with self.__lock:
+            self.__running[user_id] -= 1
+            if not self.__running[user_id]:
+                del self.__running[user_id]
+
+    def execute(self, mode: str, code: str = "", args: list = None, argv: list = None, user_id: int = None) -> str:
+        """
+        Выполнение программы в свободном процессе пула
+
+        Parameters
+        ----------
+        mode: str
+            "python" - выполнить code в процессе пула, "exec" - запустить команду argv
+        code: str, default ""
+            Текст программы. В режиме "exec" передается команде через stdin, если не пустой
+        args: list, default None
+            Аргументы программы (sys.argv[1:]) в режиме "python"
+        argv: list, default None
+            Команда с аргументами в режиме "exec"
+        user_id: int, default None
+            id пользователя для ограничения количества одновременно выполняемых программ
+
+        Returns
+        -------
+        str
+            Вывод программы
+
+        Raises
+        ------
+        ExecutionLimitError
+            Если пользователь уже выполняет per_user программ или свободный процесс не дождались
+        """
+        job = {"mode": mode, "code": code, "args": args or [], "argv": argv or [],
+               "stdin": mode == "exec" and bool(code)}
+        self.__acquire_user(user_id)
+        try:
+            try:
+                zygote = self.__idle.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                raise ExecutionLimitError("no free workers")
+            try:
+                return zygote.run(job)["output"]
+            except (OSError, ValueError):
+                zygote.kill()
+                zygote = Zygote(self.interpreter, self.limits)
+                return ""
+            finally:
+                self.__idle.put(zygote)
+        finally:
+            self.__release_user(user_id)
+
+    def close(self) -> None:
+        """
+        Завершение процессов пула
+
+        Returns
+        -------
+        None
+        """
+        while not self.__idle.empty():
+            self.__idle.get().kill()
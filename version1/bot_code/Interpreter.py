@@ -1,9 +1,17 @@
+import shlex
 import subprocess
+import sys
+from ExecutionPool import ExecutionPool
+from Configuration import Configuration
 
 
 class Interpreter:
     """Класс для получения результата выполнения кода
 
+    Код пользователей выполняется в общем для всех экземпляров пуле процессов ExecutionPool:
+    без записи во временные файлы, с ограничением ресурсов и времени выполнения.
+    Файлы самого бота (например, filter.php) запускаются напрямую, без ограничений пула.
+
     Attributes
     ----------
     language: str
@@ -12,14 +20,69 @@ class Interpreter:
         Расширение файла с кодом
     prefix: str, default ""
         Префикс кода
-    default_filename: str
-        Название файла с которым сохраняется код по умолчанию
+    pools: dict
+        Пулы процессов по интерпретатору python, в котором они запущены
     """
+    pools = {}
+
     def __init__(self, language: str, type_: str, prefix: str = ""):
         self.language = language
         self.type_ = type_
         self.prefix = prefix
-        self.default_filename = f'{self.language}_code{self.type_}'
+
+    @classmethod
+    def get_pool(cls, interpreter: str) -> ExecutionPool:
+        """
+        Получение пула процессов, запущенных в интерпретаторе interpreter
+
+        Пул создается при первом обращении
+
+        Parameters
+        ----------
+        interpreter: str
+            Интерпретатор python
+
+        Returns
+        -------
+        ExecutionPool
+            Пул процессов
+
+        Raises
+        ------
+        OSError
+            Если интерпретатор не найден
+        """
+        if interpreter not in cls.pools:
+            cls.pools[interpreter] = ExecutionPool(
+                interpreter=interpreter,
+                size=Configuration.code_workers,
+                per_user=Configuration.code_per_user,
+                cpu_time=Configuration.code_cpu_time,
+                memory=Configuration.code_memory,
+                timeout=Configuration.code_timeout,
+                output_limit=Configuration.code_output_limit
+            )
+        return cls.pools[interpreter]
+
+    @staticmethod
+    def split_args(args: str) -> list:
+        """
+        Разбиение строки аргументов на список так же, как это делает командная строка
+
+        Parameters
+        ----------
+        args: str
+            Строка с аргументами
+
+        Returns
+        -------
+        list
+            Список аргументов
+        """
+        try:
+            return shlex.split(args)
+        except ValueError:  # незакрытая кавычка
+            return args.split()
 
     @staticmethod
     def replace_out(text: str) -> str:
@@ -57,25 +120,31 @@ class Interpreter:
         text = text.replace('\\t', '\t').replace('\\n', '\n')
         return text
 
-    def save_as_file(self, code: str) -> None:
+    def run_file(self, filename: str, args: list) -> str:
         """
-        Сохранение строки кода как файл
+        Выполнение файла бота без ограничений пула
 
         Parameters
         ----------
-        code: str
-            Строка с кодом
+        filename: str
+            Имя файла
+        args: list
+            Аргументы программы
 
         Returns
         -------
-        None
+        str
+            Вывод программы, пустая строка если интерпретатор не найден
         """
-        with open(f'{self.language}_code{self.type_}', 'w', encoding='utf-8') as file:
-            file.write(code)
+        try:
+            proc = subprocess.run([self.language, filename, *args], stdout=subprocess.PIPE)
+        except OSError:
+            return ""
+        return proc.stdout.decode("utf-8")
 
-    def submit(self, code: str, args: str, filename: str) -> subprocess.Popen:
+    def submit(self, code: str, args: str, filename: str, user_id: int = None) -> str:
         """
-        Создание процесса выполнения кода
+        Выполнение кода в пуле процессов
 
         Parameters
         ----------
@@ -84,23 +153,34 @@ class Interpreter:
         args: str
             Строка с аргументами для кода
         filename: str
-            Имя файла, который нужно выполнить
+            Имя файла, который нужно выполнить (если code не передан)
+        user_id: int, default None
+            id пользователя, запустившего код
 
         Returns
         -------
-        subprocess.Popen
-            Процесс командной строки
+        str
+            Вывод программы, пустая строка если интерпретатор не найден
+
+        Raises
+        ------
+        ExecutionLimitError
+            Если пользователь уже выполняет код или все процессы пула заняты
         """
-        if code is not None:
-            code = self.prefix + code
-            code = self.reformat_code(code)
-            self.save_as_file(code)
-        if filename is None:
-            filename = self.default_filename
-        proc = subprocess.Popen(f'{self.language} ' + filename + ' ' + args, shell=True, stdout=subprocess.PIPE)
-        return proc
-
-    def execute_code(self, code: str = None, args: str = '', filename: str = None) -> str:
+        args = self.split_args(args)
+        if code is None:
+            return self.run_file(filename, args)
+        code = self.reformat_code(self.prefix + code)
+        try:
+            if self.language.startswith("python"):
+                return self.get_pool(self.language).execute("python", code=code, args=args, user_id=user_id)
+            pool = self.get_pool(sys.executable)
+        except OSError:
+            return ""
+        # код передается интерпретатору через stdin, "--" отделяет аргументы программы
+        return pool.execute("exec", code=code, argv=[self.language, "--", *args], user_id=user_id)
+
+    def execute_code(self, code: str = None, args: str = '', filename: str = None, user_id: int = None) -> str:
         """
         Выполнение кода
 
@@ -113,6 +193,9 @@ class Interpreter:
             Строка с аргументами для кода
         filename: str, default None
             Имя файла с кодом
+        user_id: int, default None
+            id пользователя, запустившего код. Одновременно пользователь может выполнять ограниченное
+            количество программ
 
         Returns
         -------
@@ -170,7 +253,6 @@ class Interpreter:
         "'meme'"
 
         """
-        proc = self.submit(code, args, filename)
-        script_response = proc.stdout.read()
-        return self.replace_out(script_response.decode("utf-8"))
+        script_response = self.submit(code, args, filename, user_id)
+        return self.replace_out(script_response)
 
@@ -1,6 +1,5 @@
 import json
 import enum
-import telebot as tb
 import ast
 from abc import ABC, abstractmethod
 
@@ -123,6 +122,8 @@ class TgKeyboard(IKeyboard):
         Если True, то клавиатура будет подана внутри сообщения
     """
     def __init__(self, labels=None, inline=False):
+        # telebot импортируется при первом создании клавиатуры, чтобы не загружать его при работе только с vk
+        import telebot as tb
         if inline:
             self.keyboard = tb.types.InlineKeyboardMarkup()
         else:
@@ -147,6 +148,7 @@ class TgKeyboard(IKeyboard):
         None
         """
         if inline:
+            import telebot as tb
             for i in labels:
                 if type(i) == str:
                     self.keyboard.add(tb.types.InlineKeyboardButton(text=i, callback_data=i))
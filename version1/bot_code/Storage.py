@@ -1,9 +1,5 @@
-from google.oauth2 import service_account
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
-from googleapiclient.discovery import build
 import io
 import json
-from httplib2 import ServerNotFoundError
 from Exceptions import *
 from abc import ABCMeta, abstractmethod, ABC
 from Settings import *
@@ -70,6 +66,10 @@ class GoogleAPI(IStorage):
         GDConnection
             Если соединение с Google не будет установлено
         """
+        # клиент Google API импортируется при первом подключении к диску
+        from google.oauth2 import service_account
+        from googleapiclient.discovery import build
+        from httplib2 import ServerNotFoundError
         try:
             with open(self.__key_file_name, "w", encoding="utf-8") as key_file:
                 json.dump(self.__google_key, key_file)
@@ -171,6 +171,7 @@ class GoogleAPI(IStorage):
             files_ids.append(files_dict[i]['id'])
             files_names.append(files_dict[i]['name'])
             request = self.__service.files().get_media(fileId=files_ids[i])
+            from googleapiclient.http import MediaIoBaseDownload
             fh = io.FileIO(files_names[i], 'wb')
             downloader = MediaIoBaseDownload(fh, request)
             done = False
@@ -193,6 +194,7 @@ class GoogleAPI(IStorage):
         """
         file_id = self.get_id(file_name)
         request = self.__service.files().get_media(fileId=file_id)
+        from googleapiclient.http import MediaIoBaseDownload
         fh = io.FileIO(file_name, 'wb')
         downloader = MediaIoBaseDownload(fh, request)
         done = False
@@ -217,6 +219,7 @@ class GoogleAPI(IStorage):
         """
         file_id = self.get_id(file_name)
         file_metadata = {'name': file_name}
+        from googleapiclient.http import MediaFileUpload
         media = MediaFileUpload(file_name,
                                 mimetype=mime_type)
         self.__service.files().update(fileId=file_id,
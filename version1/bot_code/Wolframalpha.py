@@ -1,4 +1,3 @@
-import wolframalpha
 import requests
 from Settings import *
 
@@ -15,6 +14,8 @@ class WolframalphaAPI:
 
     """
     def __init__(self):
+        # клиент wolframalpha импортируется при первом создании объекта
+        import wolframalpha
         self.app_id = Constants.w_appid.value
         self.client = wolframalpha.Client(self.app_id)
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# модули бота импортируются по имени из папки bot_code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot_code"))
@@ -0,0 +1,75 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from ExecutionPool import ExecutionPool
+from Exceptions import ExecutionLimitError
+
+
+@pytest.fixture
+def pool():
+    pool = ExecutionPool(interpreter=sys.executable, size=1, timeout=1, output_limit=16, queue_timeout=0.1)
+    yield pool
+    pool.close()
+
+
+def test_python_code_and_args(pool):
+    assert pool.execute("python", code="import sys; print(sys.argv[1:])", args=["1", "2"]) == "['1', '2']\n"
+
+
+def test_exec_passes_code_through_stdin(pool):
+    output = pool.execute("exec", code="print(2 + 2)", argv=[sys.executable, "-"])
+    assert output == "4\n"
+
+
+def test_output_is_limited(pool):
+    assert pool.execute("python", code="print('x' * 100)") == "x" * 16
+
+
+def test_timeout_kills_program(pool):
+    assert pool.execute("python", code="import time; print('start', flush=True); time.sleep(10)") == "start\n"
+    assert pool.execute("python", code="print('next')") == "next\n"
+
+
+def test_timeout_after_closed_stdout(pool):
+    started = time.monotonic()
+    assert pool.execute("python", code="import os, time; print('a', flush=True); os.close(1); time.sleep(30)") == "a\n"
+    assert time.monotonic() - started < 3
+    assert pool.execute("python", code="print('next')") == "next\n"
+
+
+def test_failing_program_returns_output_before_error(pool):
+    assert pool.execute("python", code="print('a'); 1 / 0") == "a\n"
+
+
+def run_in_background(pool, **kwargs) -> threading.Thread:
+    thread = threading.Thread(target=pool.execute, args=("python",),
+                              kwargs={"code": "import time; time.sleep(0.5)", **kwargs})
+    thread.start()
+    time.sleep(0.1)
+    return thread
+
+
+def test_one_program_per_user(pool):
+    thread = run_in_background(pool, user_id=1)
+    try:
+        with pytest.raises(ExecutionLimitError):
+            pool.execute("python", code="print(1)", user_id=1)
+    finally:
+        thread.join()
+
+
+def test_no_free_workers(pool):
+    thread = run_in_background(pool)
+    try:
+        with pytest.raises(ExecutionLimitError):
+            pool.execute("python", code="print(1)")
+    finally:
+        thread.join()
+
+
+def test_missing_interpreter():
+    with pytest.raises(OSError):
+        ExecutionPool(interpreter="no-such-python", size=1)
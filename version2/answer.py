@@ -1,5 +1,7 @@
-from settings import FileName, UserStatus, UserCallbackKey, AnswerKey, AnswerValue, TextToAnswer
+from settings import FileName, UserStatus, UserCallbackKey, AnswerKey, AnswerValue, TextToAnswer, ProfilerSettings
+from settings import StatsSettings, FuzzySettings
 from settings import logger
+from metrics import measure_handler
 
 
 class Answerer:
@@ -11,11 +13,15 @@ class Answerer:
         self.RequestHandler = answer_config.request_handler
         self.GraphBuilder = answer_config.graph_builder
         self.Filter = answer_config.filter
+        self.Broadcast = answer_config.broadcast
+        self.Profiler = answer_config.profiler
+        self.Stats = answer_config.stats
         self.Keyboard = platform_config.keyboard
         self.TableName = platform_config.table_name
         self.KeyboardName = platform_config.keyboard_name
         self.admins = platform_config.settings.ADMINS
 
+    @measure_handler
     def registration(self, peer_id: int, text: str) -> dict:
         text = text.lower()
 
@@ -71,6 +77,7 @@ class Answerer:
         logger.debug("registration(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def answer_teacher_info(self, peer_id: int, text: str) -> dict:
         if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
             logger.debug("answer_teacher_info(): user_id %s, status %s, return empty", peer_id, user_status)
@@ -93,6 +100,7 @@ class Answerer:
         logger.debug("answer_teacher_info(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def get_answer_text(self, peer_id: int, text: str) -> dict:
         if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
             logger.debug("get_answer_text(): user_id %s, status %s, return empty", peer_id, user_status)
@@ -111,6 +119,22 @@ class Answerer:
         logger.debug("get_answer_text(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
+    def get_answer_similar(self, peer_id: int, text: str) -> dict:
+        if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
+            logger.debug("get_answer_similar(): user_id %s, status %s, return empty", peer_id, user_status)
+            return {}
+
+        text = text.lower().strip()
+
+        if len(text) >= FuzzySettings.MIN_LENGTH and (answer := self.Messages(self.TableName).get_answer_similar(text)):
+            logger.debug("get_answer_similar(): user_id %s, message '%s', return similar", peer_id, text)
+            return {AnswerKey.TEXT_ANSWER: answer}
+
+        logger.debug("get_answer_similar(): user_id %s, message '%s', return empty", peer_id, text)
+        return {}
+
+    @measure_handler
     def get_answer_photo(self, peer_id: int, text: str) -> dict:
         if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
             logger.debug("get_answer_photo(): user_id %s, status %s, return empty", peer_id, user_status)
@@ -125,6 +149,7 @@ class Answerer:
         logger.debug("get_answer_photo(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def get_answer_links(self, peer_id: int, text: str) -> dict:
         text = text.lower()
 
@@ -152,6 +177,7 @@ class Answerer:
         logger.debug("get_answer_links(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def get_answer_schedule(self, peer_id: int, text: str) -> dict:
         text = text.lower()
 
@@ -178,6 +204,7 @@ class Answerer:
         logger.debug("get_answer_schedule(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def delete_answer(self, peer_id: int, text: str) -> dict:
         if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
             logger.debug("delete_answer(): user_id %s, status %s, return empty", peer_id, user_status)
@@ -199,6 +226,7 @@ class Answerer:
         logger.debug("delete_answer(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def get_other_materials(self, peer_id, text):
         if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
             logger.debug("get_other_materials(): user_id %s, status %s, return empty", peer_id, user_status)
@@ -213,6 +241,7 @@ class Answerer:
         logger.debug("get_other_materials(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def switch_menu(self, peer_id, text):
         if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
             logger.debug("switch_menu(): user_id %s, status %s, return empty", peer_id, user_status)
@@ -237,6 +266,7 @@ class Answerer:
         logger.debug("switch_menu(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def get_answer_query(self, peer_id: int, text: str) -> dict:
         if text.lower() == TextToAnswer.QUERY and self.User(self.TableName, peer_id).get_status() == UserStatus.ANY:
             self.User(self.TableName, peer_id).set_status(status=UserStatus.QUERY)
@@ -256,6 +286,7 @@ class Answerer:
         logger.debug("get_answer_query(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def get_answer_graph(self, peer_id: int, text: str) -> dict:
         if text.lower() == TextToAnswer.GRAPH and self.User(self.TableName, peer_id).get_status() == UserStatus.ANY:
             self.User(self.TableName, peer_id).set_status(status=UserStatus.VAR_NUM)
@@ -280,10 +311,10 @@ class Answerer:
 
         if self.User(self.TableName, peer_id).get_status() == UserStatus.FUNC:
             var_num = self.User(self.TableName, peer_id).get_callback().get(UserCallbackKey.VAR_NUM)
-            if self.GraphBuilder().save_plot(func=text, var_num=var_num, graph_name=FileName.GRAPH):
+            if graph := self.GraphBuilder().get_plot(func=text, var_num=var_num):
                 self.User(self.TableName, peer_id).set_status(status=UserStatus.ANY)
                 logger.debug("get_answer_graph(): user_id %s, message '%s', return graph", peer_id, text)
-                return {AnswerKey.PHOTO_FILE: FileName.GRAPH}
+                return {AnswerKey.PHOTO_DATA: graph}
 
             self.User(self.TableName, peer_id).set_status(status=UserStatus.ANY)
             logger.debug("get_answer_graph(): user_id %s, message '%s', return graph failed", peer_id, text)
@@ -292,6 +323,7 @@ class Answerer:
         logger.debug("get_answer_graph(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def ban(self, peer_id: int, text: str) -> dict:
         if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
             logger.debug("ban(): user_id %s, status %s, return empty", peer_id, user_status)
@@ -308,14 +340,15 @@ class Answerer:
         logger.debug("ban(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def unban(self, peer_id, text):
         if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
             logger.debug("unban(): user_id %s, status %s, return empty", peer_id, user_status)
             return {}
 
         text = text.lower()
-        prefix_size = len("unban ")
-        if text[:prefix_size] == "unban " and peer_id in self.admins:
+        prefix_size = len(TextToAnswer.UNBAN)
+        if text[:prefix_size] == TextToAnswer.UNBAN and peer_id in self.admins:
             user_id = text[prefix_size:]
             if self.User(self.TableName, user_id).ban_check():
                 self.User(self.TableName, user_id).unban()
@@ -328,6 +361,7 @@ class Answerer:
         logger.debug("ban(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
     def teach_bot(self, peer_id: int, text: str) -> dict:
         if text.lower() == TextToAnswer.TEACH and self.User(self.TableName, peer_id).get_status() == UserStatus.ANY:
             self.User(self.TableName, peer_id).set_status(UserStatus.CUSTOM_TO_ANSWER)
@@ -375,6 +409,94 @@ class Answerer:
         logger.debug("teach_bot(): user_id %s, message '%s', return empty", peer_id, text)
         return {}
 
+    @measure_handler
+    def broadcast(self, peer_id: int, text: str) -> dict:
+        if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
+            logger.debug("broadcast(): user_id %s, status %s, return empty", peer_id, user_status)
+            return {}
+
+        first_line, _, message = text.partition("\n")
+        first_line = first_line.strip().lower()
+        prefix_size = len(TextToAnswer.BROADCAST)
+        if first_line[:prefix_size] == TextToAnswer.BROADCAST and peer_id in self.admins:
+            target = first_line[prefix_size:].strip()
+            message = message.strip()
+            if not target or not message:
+                logger.debug("broadcast(): user_id %s, message '%s', return usage", peer_id, text)
+                return {AnswerKey.TEXT_ANSWER: AnswerValue.BROADCAST_USAGE}
+
+            course, group = None, None
+            courses = self.Messages().get_courses()
+            if target in courses:
+                course = target
+            elif target != "все":
+                if not any(target in self.Messages().get_groups(course_name) for course_name in courses):
+                    logger.debug("broadcast(): user_id %s, message '%s', return wrong target", peer_id, text)
+                    return {AnswerKey.TEXT_ANSWER: AnswerValue.BROADCAST_WRONG_TARGET}
+                group = target
+
+            broadcast = self.Broadcast(self.TableName)
+            broadcast_id = broadcast.create(author_id=peer_id, text=message, course=course, group=group)
+            logger.debug("broadcast(): user_id %s, message '%s', return broadcast %s", peer_id, text, broadcast_id)
+            return {
+                AnswerKey.TEXT_ANSWER: AnswerValue.BROADCAST_STARTED.format(broadcast_id),
+                AnswerKey.BACKGROUND_TASK: lambda bot: broadcast.run(broadcast_id, bot)
+            }
+
+        logger.debug("broadcast(): user_id %s, message '%s', return empty", peer_id, text)
+        return {}
+
+    @measure_handler
+    def profile(self, peer_id: int, text: str) -> dict:
+        if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
+            logger.debug("profile(): user_id %s, status %s, return empty", peer_id, user_status)
+            return {}
+
+        text = text.lower().strip()
+        command, _, seconds = text.partition(" ")  # "профиль" или "профиль 60", но не "профильный"
+        if command == TextToAnswer.PROFILE and peer_id in self.admins:
+            seconds = seconds.strip() or str(ProfilerSettings.DEFAULT_SECONDS)
+            if not seconds.isdigit() or not 0 < int(seconds) <= ProfilerSettings.MAX_SECONDS:
+                logger.debug("profile(): user_id %s, message '%s', return usage", peer_id, text)
+                return {AnswerKey.TEXT_ANSWER: AnswerValue.PROFILE_USAGE.format(ProfilerSettings.MAX_SECONDS)}
+
+            profiler = self.Profiler()
+            logger.debug("profile(): user_id %s, message '%s', return profiler", peer_id, text)
+            return {
+                AnswerKey.TEXT_ANSWER: AnswerValue.PROFILE_STARTED.format(seconds),
+                AnswerKey.BACKGROUND_TASK: lambda bot: profiler.run(int(seconds), bot, peer_id)
+            }
+
+        logger.debug("profile(): user_id %s, message '%s', return empty", peer_id, text)
+        return {}
+
+    @measure_handler
+    def stats(self, peer_id: int, text: str) -> dict:
+        if (user_status := self.User(self.TableName, peer_id).get_status()) != UserStatus.ANY:
+            logger.debug("stats(): user_id %s, status %s, return empty", peer_id, user_status)
+            return {}
+
+        text = text.lower().strip()
+        command, *args = text.split() or [""]  # "статистика" или "статистика 7", но не "статистикаа"
+        if command == TextToAnswer.STATS and peer_id in self.admins:
+            days = args[0] if args else str(StatsSettings.DEFAULT_DAYS)
+            if len(args) > 1 or not days.isdigit() or not 0 < int(days) <= StatsSettings.MAX_DAYS:
+                logger.debug("stats(): user_id %s, message '%s', return usage", peer_id, text)
+                return {AnswerKey.TEXT_ANSWER: AnswerValue.STATS_USAGE.format(StatsSettings.MAX_DAYS)}
+
+            stats = self.Stats(self.TableName)
+            daily = "\n".join(AnswerValue.STATS_DAY.format(day.strftime("%d.%m"), users, messages)
+                              for day, users, messages in stats.get_daily(int(days)))
+            commands = "\n".join(f"{command}: {count}" for command, count in stats.get_top_commands(int(days)))
+            logger.debug("stats(): user_id %s, message '%s', return stats", peer_id, text)
+            return {
+                AnswerKey.TEXT_ANSWER: AnswerValue.STATS_ANSWER.format(
+                    days, daily or AnswerValue.STATS_EMPTY, commands or AnswerValue.STATS_EMPTY)
+            }
+
+        logger.debug("stats(): user_id %s, message '%s', return empty", peer_id, text)
+        return {}
+
     def get_answer(self, peer_id, text):
         if self.User(self.TableName, peer_id).get_status() is None:
             self.User(self.TableName, peer_id).set_status(status=UserStatus.ANY)
@@ -421,4 +543,17 @@ class Answerer:
         if answer_delete_text := self.delete_answer(peer_id, text):
             return answer_delete_text
 
+        if answer_broadcast := self.broadcast(peer_id, text):
+            return answer_broadcast
+
+        if answer_profile := self.profile(peer_id, text):
+            return answer_profile
+
+        if answer_stats := self.stats(peer_id, text):
+            return answer_stats
+
+        # поиск похожего ответа только после всех точных совпадений, чтобы не перехватывать кнопки и команды
+        if answer_similar := self.get_answer_similar(peer_id, text):
+            return answer_similar
+
         return {}
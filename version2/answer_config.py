@@ -4,8 +4,11 @@ from user import SQLUser
 from messages import SQLMessages
 from records_links import PandasLink
 from schedule import PandasSchedule
-from request_handler import WolframalphaAPI
+from request_handler import WolframalphaAPI, LocalGraphBuilder
 from filter import PHPFilter
+from broadcast import SQLBroadcast
+from profiler import SamplingProfiler
+from stats import SQLStats
 
 
 class Config(NamedTuple):
@@ -14,6 +17,9 @@ class Config(NamedTuple):
     links = PandasLink
     schedule = PandasSchedule
     request_handler = WolframalphaAPI
-    graph_builder = WolframalphaAPI
+    graph_builder = LocalGraphBuilder
     filter = PHPFilter
+    broadcast = SQLBroadcast
+    profiler = SamplingProfiler
+    stats = SQLStats
 
@@ -0,0 +1,112 @@
+import hashlib
+from abc import ABCMeta, abstractmethod, ABC
+
+from psycopg2 import sql
+
+from cache import MemoryCache
+from postgres import PostgreSQL as pSQL
+
+
+class IAttachments(ABC):
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def get_attachment(self, key: str) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_attachment(self, key: str, attachment: str) -> None:
+        raise NotImplementedError
+
+
+class SQLAttachments(IAttachments):
+    """Класс для хранения уже загруженных на сервер платформы изображений
+
+    Ключ - ссылка на изображение или хэш его содержимого (см. url_key, data_key),
+    значение - строка вложения вида photo{owner_id}_{id}, которую можно повторно
+    передавать в messages.send без новой загрузки.
+
+    Attributes
+    ----------
+    memory: MemoryCache
+        Общий для всех экземпляров кэш, чтобы не обращаться к базе данных на каждое изображение.
+        Ключи кэша содержат имя таблицы (см. memory_key): вложения одной платформы недействительны на другой
+    """
+    memory = MemoryCache(max_size=1000)
+
+    def __init__(self, table_name):
+        self.SQL = pSQL
+        self.TableName = table_name
+
+    @staticmethod
+    def url_key(url: str) -> str:
+        return f"url:{url}"
+
+    @staticmethod
+    def data_key(data: bytes) -> str:
+        return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+    def memory_key(self, key: str) -> str:
+        return f"{self.TableName.PHOTO_ATTACHMENTS}:{key}"
+
+    def get_attachment(self, key: str) -> str:
+        if (attachment := self.memory.get(self.memory_key(key))) is not None:
+            return attachment
+        query = sql.SQL("""
+        SELECT attachment FROM {table_name}
+        WHERE key = {key};
+        """).format(
+            table_name=sql.Identifier(self.TableName.PHOTO_ATTACHMENTS),
+            key=sql.Literal(key)
+        )
+        res = self.SQL().execute_read_query(query, one=True)
+        if res:
+            self.memory.set(self.memory_key(key), res[0])
+            return res[0]
+
+    def preload(self) -> int:
+        """
+        Загрузка сохраненных вложений в общий кэш (при прогреве бота)
+
+        Returns
+        -------
+        int
+            Количество загруженных вложений
+        """
+        query = sql.SQL("""
+        SELECT key, attachment FROM {table_name}
+        LIMIT {limit};
+        """).format(
+            table_name=sql.Identifier(self.TableName.PHOTO_ATTACHMENTS),
+            limit=sql.Literal(self.memory.max_size)
+        )
+        rows = self.SQL().execute_read_query(query) or []
+        for key, attachment in rows:
+            self.memory.set(self.memory_key(key), attachment)
+        return len(rows)
+
+    def add_attachment(self, key: str, attachment: str) -> None:
+        query = sql.SQL("""
+        INSERT INTO {table_name}
+        VALUES ({key}, {attachment})
+        ON CONFLICT (key) DO
+        UPDATE
+        SET attachment = {attachment};
+        """).format(
+            table_name=sql.Identifier(self.TableName.PHOTO_ATTACHMENTS),
+            key=sql.Literal(key),
+            attachment=sql.Literal(attachment)
+        )
+        self.SQL().execute_query(query)
+        self.memory.set(self.memory_key(key), attachment)
+
+    def delete_attachment(self, key: str) -> None:
+        query = sql.SQL("""
+        DELETE FROM {table_name}
+        WHERE key = {key};
+        """).format(
+            table_name=sql.Identifier(self.TableName.PHOTO_ATTACHMENTS),
+            key=sql.Literal(key)
+        )
+        self.SQL().execute_query(query)
+        self.memory.delete(self.memory_key(key))
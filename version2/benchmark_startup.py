@@ -0,0 +1,177 @@
+"""
+Замер времени запуска бота
+
+Время импорта измеряется в отдельном процессе (python -X importtime), поэтому уже загруженные
+в текущий процесс модули не влияют на результат. Для каждой версии выводятся общее время импорта,
+самые долгие импорты и список необязательных подсистем (telegram, Google диск, pandas, wolframalpha),
+которые загрузились при запуске, хотя должны загружаться только при первом использовании.
+Время до первого ответа - от запуска процесса до ответа Answerer на первое сообщение,
+для него нужны база данных и файлы, указанные в переменных окружения.
+
+Запуск: python benchmark_startup.py [--repeat 5] [--text привет] [--peer-id 1] [--no-reply]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+VERSION2_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+VERSION1_DIRECTORY = os.path.join(os.path.dirname(VERSION2_DIRECTORY), "version1", "bot_code")
+
+OPTIONAL_MODULES = ("telebot", "googleapiclient", "pandas", "wolframalpha", "matplotlib")
+
+# (название, папка, модуль точки входа, код получения первого ответа)
+VERSIONS = (
+    ("version1", VERSION1_DIRECTORY, "Bot",
+     "from Commander import Answerer\n"
+     "answer = Answerer(answers={{}}).get_answer_text({peer_id}, {text!r})"),
+    ("version2", VERSION2_DIRECTORY, "main",
+     "from answer import Answerer\n"
+     "from answer_config import Config\n"
+     "from settings import PlatformVK\n"
+     "answer = Answerer(Config, PlatformVK).get_answer({peer_id}, {text!r})"),
+)
+
+IMPORT_CODE = """
+import sys
+import {module}
+print(",".join(name for name in {optional!r} if name in sys.modules))
+"""
+
+REPLY_CODE = """
+import time
+start = time.perf_counter()
+{reply}
+print(time.perf_counter() - start)
+print(bool(answer))
+"""
+
+
+def run_python(directory: str, code: str, *options) -> subprocess.CompletedProcess:
+    # бот читает файлы и пишет журналы относительно текущей папки, поэтому процесс запускается в папке версии
+    environment = dict(os.environ, PYTHONPATH=directory, PYTHONDONTWRITEBYTECODE="1")
+    return subprocess.run([sys.executable, *options, "-c", code], cwd=directory, env=environment,
+                          capture_output=True, text=True)
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Разбор вывода python -X importtime
+
+    Returns
+    -------
+    list
+        Кортежи (глубина вложенности, название модуля, собственное время в мкс, общее время в мкс)
+        в порядке вывода (вложенные модули перед модулем, который их импортирует)
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not own.strip().isdigit():  # заголовок таблицы
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(own), int(cumulative)))
+    return imports
+
+
+def measure_import(directory: str, module: str, repeat: int) -> dict:
+    """
+    Время импорта модуля точки входа
+
+    Parameters
+    ----------
+    directory: str
+        Папка версии бота
+    module: str
+        Модуль точки входа
+    repeat: int
+        Количество запусков, результат - медиана
+
+    Returns
+    -------
+    dict
+        total - время импорта в мс, top - самые долгие прямые импорты модуля (название, мс),
+        optional - загруженные необязательные подсистемы, error - ошибка импорта
+    """
+    code = IMPORT_CODE.format(module=module, optional=OPTIONAL_MODULES)
+    totals, children = [], {}
+    optional = []
+    for _ in range(repeat):
+        process = run_python(directory, code, "-X", "importtime")
+        if process.returncode:
+            return {"error": process.stderr.strip().splitlines()[-1]}
+        imports = parse_importtime(process.stderr)
+        root = next(index for index, (depth, name, _, _) in enumerate(imports) if depth == 0 and name == module)
+        totals.append(imports[root][3] / 1000)
+        # прямые импорты модуля - строки глубины 1, идущие перед ним до предыдущего модуля верхнего уровня
+        for depth, name, _, cumulative in reversed(imports[:root]):
+            if depth == 0:
+                break
+            if depth == 1:
+                children.setdefault(name, []).append(cumulative / 1000)
+        optional = process.stdout.strip().split(",") if process.stdout.strip() else []
+    top = sorted(((name, statistics.median(times)) for name, times in children.items()), key=lambda item: -item[1])
+    return {"total": statistics.median(totals), "top": top[:5], "optional": optional}
+
+
+def measure_first_reply(directory: str, reply: str, peer_id: int, text: str, repeat: int) -> dict:
+    """
+    Время от запуска процесса до первого ответа
+
+    Returns
+    -------
+    dict
+        process - время от запуска процесса в мс, answer - время импорта и ответа внутри процесса в мс,
+        answered - получен ли непустой ответ, error - ошибка
+    """
+    code = REPLY_CODE.format(reply=reply.format(peer_id=peer_id, text=text))
+    process_times, answer_times = [], []
+    answered = False
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = run_python(directory, code)
+        if process.returncode:
+            return {"error": process.stderr.strip().splitlines()[-1]}
+        process_times.append((time.perf_counter() - start) * 1000)
+        elapsed, result = process.stdout.strip().splitlines()[-2:]
+        answer_times.append(float(elapsed) * 1000)
+        answered = result == "True"
+    return {"process": statistics.median(process_times), "answer": statistics.median(answer_times),
+            "answered": answered}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Startup benchmark: import time and time to first reply")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, median is reported")
+    parser.add_argument("--text", default="привет", help="first message text")
+    parser.add_argument("--peer-id", type=int, default=1, help="first message sender")
+    parser.add_argument("--no-reply", action="store_true", help="measure import time only (no database needed)")
+    args = parser.parse_args()
+
+    for version, directory, module, reply in VERSIONS:
+        print(f"{version} ({module})")
+        imported = measure_import(directory, module, args.repeat)
+        if "error" in imported:
+            print(f"  import failed: {imported['error']}")
+            continue
+        print(f"  import: {imported['total']:.1f} ms")
+        for name, milliseconds in imported["top"]:
+            print(f"    {milliseconds:8.1f} ms  {name}")
+        print(f"  optional subsystems loaded at import: {', '.join(imported['optional']) or 'none'}")
+        if args.no_reply:
+            continue
+        first_reply = measure_first_reply(directory, reply, args.peer_id, args.text, args.repeat)
+        if "error" in first_reply:
+            print(f"  first reply failed: {first_reply['error']}")
+            continue
+        print(f"  first reply: {first_reply['process']:.1f} ms from process start "
+              f"({first_reply['answer']:.1f} ms imports and answer), answered: {first_reply['answered']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
-import requests
+import io
+import threading
+import time
 from abc import ABCMeta, abstractmethod, ABC
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
 
 import vk_api
 from vk_api.longpoll import VkLongPoll, VkEventType
@@ -9,8 +14,17 @@ from vk_api.utils import get_random_id
 from keyboard import VkKeyboard
 from answer import Answerer
 from user import SQLUser
-from messages import SQLMessages
-from settings import PlatformVK, logger, AnswerKey
+from message_log import RecentMessages, MessageLogWriter
+from attachments import SQLAttachments
+from cache import MemoryCache
+from stats import StatsCollector
+from metrics import external_call, THROTTLED_MESSAGES
+from resilience import VK_UPLOAD, DependencyUnavailable, with_timeout
+from tracing import start_trace, current_trace_id
+from rate_limit import TokenBucket, PeerThrottle
+from vk_sender import VkSender
+from warmup import Warmup, mark_ready
+from settings import PlatformVK, PlatformTG, VKSenderSettings, FloodSettings, logger, AnswerKey, AnswerValue
 
 
 class IBot(ABC):
@@ -24,7 +38,11 @@ class IBot(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def send_photo(self, peer_id, image_url=None, file_name=None):
+    def send_photo(self, peer_id, image_url=None, file_name=None, image_data=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def send_bulk(self, peer_ids, text, random_id=None):
         raise NotImplementedError
 
     @abstractmethod
@@ -35,6 +53,33 @@ class IBot(ABC):
     def start(self):
         raise NotImplementedError
 
+    @staticmethod
+    def make_throttle():
+        if not FloodSettings.RATE:
+            return None
+        return PeerThrottle(rate=FloodSettings.RATE, capacity=FloodSettings.BURST, max_peers=FloodSettings.MAX_PEERS)
+
+    def is_throttled(self, peer_id: int, platform: str) -> bool:
+        """
+        Проверка частоты сообщений пользователя до любых запросов к базе данных и API
+
+        Первое отброшенное сообщение пользователя, превысившего ограничение, получает одно уведомление,
+        остальные отбрасываются молча, пока ведро пользователя не пополнится
+
+        Returns
+        -------
+        bool
+            True если сообщение нужно отбросить
+        """
+        if self.throttle is None or (state := self.throttle.check(peer_id)) == PeerThrottle.ALLOW:
+            return False
+        THROTTLED_MESSAGES.inc(platform)
+        if state == PeerThrottle.NOTIFY:
+            logger.info("is_throttled(): %s user %s is over the limit", platform, peer_id)
+            if FloodSettings.NOTICE:
+                self.send_message(peer_id, AnswerValue.SLOW_DOWN)
+        return True
+
 
 class VkBot(IBot):
     """Класс VkBot используется для создания и запуска бота vk
@@ -44,24 +89,40 @@ class VkBot(IBot):
     vk: vk_api.VkApi
         Авторизация вк
     long_poll: VkLongPoll
-        Вызываем longpoll для получения данных о новых событиях
+        Вызываем longpoll для получения данных о новых событиях (создается в start, при работе
+        через ingress события получает другой процесс)
     vk_api: vk.get_api
         Позволяет обращаться к методам API как к обычным классам
     upload: VkUpload
         Модуль для загрузки медиафайлов вк
+    sender: VkSender
+        Очередь отправки запросов к VkAPI с ограничением частоты
+    attachments: SQLAttachments
+        Хранилище уже загруженных изображений
+    throttle: PeerThrottle
+        Ограничение частоты сообщений пользователей, None - без ограничения
+    recent: RecentMessages
+        Id последних сообщений для отбрасывания повторно доставленных
     used: bool
         Переменная для отслеживания произошел ли ответ пользователю
 
     """
-    def __init__(self, config):
+    def __init__(self, config, rate: float = VKSenderSettings.RATE):
         try:
             self.vk = vk_api.VkApi(token=PlatformVK.settings.TOKEN, captcha_handler=self.captcha_handler)
-            self.long_poll = VkLongPoll(self.vk)
+            self.long_poll = None
             self.vk_api = self.vk.get_api()
             self.upload = VkUpload(self.vk_api)
-            self.session = requests.Session()
+            # у запросов vk_api нет таймаута по умолчанию, longpoll передает свой таймаут явно
+            with_timeout(self.vk.http, VK_UPLOAD.timeout)
+            with_timeout(self.upload.http, VK_UPLOAD.timeout)
+            self.session = with_timeout(requests.Session(), VK_UPLOAD.timeout)
             self.default_keyboard = VkKeyboard.json_to_keyboard(PlatformVK.keyboard_name.START["start1"])
             self.answer_config = config
+            self.attachments = SQLAttachments(PlatformVK.table_name)
+            self.sender = VkSender(self.vk, rate)
+            self.throttle = self.make_throttle()
+            self.recent = RecentMessages("vk")
             self.used = False
         except Exception:
             logger.error("VkBot initialization failed", exc_info=True)
@@ -71,13 +132,12 @@ class VkBot(IBot):
     def captcha_handler(captcha):
         """ При возникновении капчи вызывается эта функция и ей передается объект
             капчи. Через метод get_url можно получить ссылку на изображение.
-            Через метод try_again можно попытаться отправить запрос с кодом капчи
-        """
-
-        key = input("Enter captcha code {0}: ".format(captcha.get_url())).strip()
 
-        # Пробуем снова отправить запрос с капчей
-        return captcha.try_again(key)
+            Бот работает без оператора, поэтому капча не вводится: запрос завершается ошибкой,
+            а не блокирует обработку сообщений ожиданием ввода
+        """
+        logger.error("captcha_handler(): captcha required: %s", captcha.get_url())
+        raise captcha
 
     def get_user_first_name(self, event: vk_api.longpoll.Event) -> str:
         """
@@ -98,7 +158,7 @@ class VkBot(IBot):
             Имя пользователя
 
         """
-        return self.vk_api.users.get(user_id=event.peer_id)[0]['first_name']
+        return self.sender.call("users.get", user_id=event.peer_id)[0]['first_name']
 
     def get_user_last_name(self, event: vk_api.longpoll.Event) -> str:
         """
@@ -118,13 +178,13 @@ class VkBot(IBot):
         str
             Фамилия пользователя
         """
-        return self.vk_api.users.get(user_id=event.peer_id)[0]['last_name']
+        return self.sender.call("users.get", user_id=event.peer_id)[0]['last_name']
 
     def send_message(self, peer_id: int, text: str, keyboard=None) -> None:
         """
         Отправка сообщения пользователю
 
-        Функция использует метод VkAPI messages.send
+        Функция ставит вызов метода VkAPI messages.send в очередь отправки
 
         https://vk.com/dev/messages.send
 
@@ -144,15 +204,49 @@ class VkBot(IBot):
         """
         if keyboard is None:
             keyboard = self.default_keyboard
-        self.vk_api.messages.send(
+        with open(keyboard, "r", encoding="UTF-8") as keyboard_file:
+            keyboard = keyboard_file.read()
+        self.sender.send(
+            "messages.send",
             peer_id=peer_id,
             message=text,
             random_id=get_random_id(),
             # уникальный идентификатор, предназначенный для предотвращения повторной отправки одинакового сообщения
-            keyboard=open(keyboard, "r", encoding="UTF-8").read()
+            keyboard=keyboard
         )
 
-    def send_photo(self, peer_id: int, image_url: str = None, file_name: str = None):
+    def send_bulk(self, peer_ids: list, text: str, random_id: int = None) -> None:
+        """
+        Отправка одного сообщения нескольким пользователям
+
+        Функция использует метод VkAPI messages.send с параметром peer_ids (до 100 получателей).
+        Вызов выполняется синхронно с учетом общего ограничения частоты запросов
+
+        https://vk.com/dev/messages.send
+
+        Parameters
+        ----------
+        peer_ids: list
+            id пользователей, которым нужно отправить сообщение
+        text: str
+            Текст сообщения
+        random_id: int, default None
+            Уникальный идентификатор сообщения, None - случайный
+
+        Returns
+        -------
+        None
+        """
+        response = self.sender.call(
+            "messages.send",
+            peer_ids=",".join(str(peer_id) for peer_id in peer_ids),
+            message=text,
+            random_id=get_random_id() if random_id is None else random_id
+        )
+        if failed := [item["peer_id"] for item in response if "error" in item]:
+            logger.warning("send_bulk(): not delivered to %s users: %s", len(failed), failed)
+
+    def send_photo(self, peer_id: int, image_url: str = None, file_name: str = None, image_data: bytes = None):
         """
         Отправка изображения пользователю
 
@@ -161,7 +255,8 @@ class VkBot(IBot):
         https://vk.com/dev/messages.send
 
         Если image_url не None - отправка изображения по ссылке,
-        если file_name не None - отправка изображения по названию файла
+        если file_name не None - отправка изображения по названию файла,
+        если image_data не None - отправка изображения из памяти без записи на диск
 
         Parameters
         ----------
@@ -171,36 +266,111 @@ class VkBot(IBot):
             Ссылка на изображение
         file_name: str, default None
             Название файла с изображением
+        image_data: bytes, default None
+            Содержимое изображения
 
         Returns
         -------
         None
-
-        Note:
-            Если image_url и file_name одновременно не None, то отправится изображение по ссылке
         """
         if image_url is not None:
-            image = self.session.get(image_url, stream=True)  # получение объекта по ссылке
+            key = self.attachments.url_key(image_url)
+            self.send_attachment(peer_id, key, lambda: self.upload_photo_url(image_url))
+        if file_name is not None:
+            with open(file_name, "rb") as image:
+                image_data = image.read()
+        if image_data is not None:
+            key = self.attachments.data_key(image_data)
+            self.send_attachment(peer_id, key, lambda: self.upload_photo_data(image_data))
+
+    def upload_photo_url(self, image_url: str) -> str:
+        """
+        Загрузка изображения по ссылке на сервер vk
+
+        Parameters
+        ----------
+        image_url: str
+            Ссылка на изображение
+
+        Returns
+        -------
+        str
+            Медиавложение вида photo{owner_id}_{id}
+        """
+        image = self.session.get(image_url, stream=True)  # получение объекта по ссылке
+        self.sender.limiter.acquire(2)  # VkUpload делает два запроса к VkAPI
+        with VK_UPLOAD.guard("photos.upload"):
             photo = self.upload.photo_messages(photos=image.raw)[0]  # необработанный запрос передается vk upload
-            attachments = [f"photo{photo['owner_id']}_{photo['id']}"]  # медиавложение к личному сообщению
-            self.vk_api.messages.send(
+        return f"photo{photo['owner_id']}_{photo['id']}"
+
+    def upload_photo_data(self, data: bytes) -> str:
+        """
+        Загрузка изображения на сервер vk
+
+        Parameters
+        ----------
+        data: bytes
+            Содержимое изображения
+
+        Returns
+        -------
+        str
+            Медиавложение вида photo{owner_id}_{id}
+        """
+        server = self.sender.call("photos.getMessagesUploadServer")
+        with VK_UPLOAD.guard("photos.upload"):
+            post = self.session.post(server["upload_url"], files={"photo": ("photo.jpg", io.BytesIO(data))}).json()
+        photo = self.sender.call(
+            "photos.saveMessagesPhoto",
+            photo=post["photo"],
+            server=post["server"],
+            hash=post["hash"])[0]
+        return f"photo{photo['owner_id']}_{photo['id']}"
+
+    def send_attachment(self, peer_id: int, key: str, upload) -> None:
+        """
+        Отправка изображения с повторным использованием ранее загруженного вложения
+
+        Если изображение с ключом key уже загружалось, отправляется сохраненное вложение,
+        иначе изображение загружается функцией upload и вложение сохраняется.
+        Если сохраненное вложение оказалось недействительным, изображение загружается заново.
+
+        Parameters
+        ----------
+        peer_id: int
+            id пользователя, которому нужно отправить изображение
+        key: str
+            Ключ изображения (ссылка или хэш содержимого)
+        upload: callable
+            Функция загрузки изображения, возвращающая вложение
+
+        Returns
+        -------
+        None
+        """
+        if attachment := self.attachments.get_attachment(key):
+            def on_error(error):
+                logger.warning("send_attachment(): cached attachment %s rejected, uploading again", attachment)
+                self.attachments.delete_attachment(key)
+                self.send_attachment(peer_id, key, upload)
+
+            self.sender.send(
+                "messages.send",
+                on_error=on_error,
                 user_id=peer_id,
-                attachment=','.join(attachments),  # отправка вложений к сообщению
+                attachment=attachment,
                 random_id=get_random_id()
                 # уникальный id, предназначенный для предотвращения повторной отправки одинакового сообщения
             )
-        if file_name is not None:
-            server = self.vk_api.photos.getMessagesUploadServer()
-            post = requests.post(server["upload_url"], files={"photo": open(file_name, "rb")}).json()
-            photo = self.vk_api.photos.saveMessagesPhoto(
-                photo=post["photo"],
-                server=post["server"],
-                hash=post["hash"])[0]
-            attachments = [f"photo{photo['owner_id']}_{photo['id']}"]
-            self.vk_api.messages.send(
-                user_id=peer_id,
-                attachment=','.join(attachments),
-                random_id=get_random_id())
+            return
+        try:
+            attachment = upload()
+        except (DependencyUnavailable, requests.RequestException):
+            logger.error("send_attachment(): upload failed", exc_info=True)
+            self.send_message(peer_id, AnswerValue.SERVICE_UNAVAILABLE)
+            return
+        self.attachments.add_attachment(key, attachment)
+        self.sender.send("messages.send", user_id=peer_id, attachment=attachment, random_id=get_random_id())
 
     def answer(self, event: vk_api.longpoll.Event) -> None:
         """
@@ -222,6 +392,7 @@ class VkBot(IBot):
             answer_config=self.answer_config,
             platform_config=PlatformVK
         ).get_answer(peer_id=event.peer_id, text=event.text)
+        StatsCollector.get(PlatformVK.table_name, "vk").record(event.peer_id, answer.get(AnswerKey.HANDLER))
 
         if answer.get(AnswerKey.PHOTO_LINK):
             self.send_photo(
@@ -230,6 +401,13 @@ class VkBot(IBot):
             )
             self.used = True
 
+        if answer.get(AnswerKey.PHOTO_DATA):
+            self.send_photo(
+                peer_id=event.peer_id,
+                image_data=answer.get(AnswerKey.PHOTO_DATA)
+            )
+            self.used = True
+
         if answer.get(AnswerKey.PHOTO_FILE):
             self.send_photo(
                 peer_id=event.peer_id,
@@ -248,6 +426,24 @@ class VkBot(IBot):
             )
             self.used = True
 
+        if answer.get(AnswerKey.BACKGROUND_TASK):
+            self.run_background(answer.get(AnswerKey.BACKGROUND_TASK))
+
+    def run_background(self, task) -> None:
+        """
+        Запуск долгой задачи (например, рассылки) в отдельном потоке, чтобы не задерживать ответы
+
+        Parameters
+        ----------
+        task: callable
+            Функция, принимающая бота
+
+        Returns
+        -------
+        None
+        """
+        threading.Thread(target=task, args=(self,), daemon=True).start()
+
     def not_found(self, peer_id: int) -> None:
         """
         Функция для случая когда пользователю не был отправлен ответ
@@ -267,35 +463,367 @@ class VkBot(IBot):
             self.send_message(peer_id, "Шо?")
 
     def message_handler(self, event):
-        try:
-            SQLUser(PlatformVK.table_name).log_user(
-                user_id=event.peer_id,
-                name=self.get_user_first_name(event),
-                surname=self.get_user_last_name(event))
-            SQLMessages(PlatformVK.table_name).log_message(
-                message_id=event.message_id,
-                user_id=event.peer_id,
-                text=event.text)
-            self.answer(event)
-            self.not_found(event.peer_id)  # чтобы ответ пользователю в любом случае произошёл
-        except Exception:
-            logger.error("message_handler(): Exception occurred", exc_info=True)
-            raise
+        if self.recent.is_duplicate(event.peer_id, event.message_id) or self.is_throttled(event.peer_id, "vk"):
+            return
+        self.used = False  # изначально ответ пользователю не произошёл
+        with start_trace("vk.message", peer_id=event.peer_id, message_id=event.message_id):
+            try:
+                SQLUser(PlatformVK.table_name).log_user(
+                    user_id=event.peer_id,
+                    name=self.get_user_first_name(event),
+                    surname=self.get_user_last_name(event))
+                MessageLogWriter.get(PlatformVK.table_name).add(
+                    message_id=event.message_id,
+                    user_id=event.peer_id,
+                    text=event.text)
+                self.answer(event)
+                self.not_found(event.peer_id)  # чтобы ответ пользователю в любом случае произошёл
+            except Exception:
+                logger.error("message_handler(): Exception occurred, trace %s", current_trace_id(), exc_info=True)
+                raise
+
+    def resume_broadcasts(self) -> None:
+        """
+        Продолжение рассылок, прерванных при предыдущем запуске
+
+        Returns
+        -------
+        None
+        """
+        broadcast = self.answer_config.broadcast(PlatformVK.table_name)
+        for broadcast_id in broadcast.get_unfinished():
+            self.run_background(lambda bot, broadcast_id=broadcast_id: broadcast.run(broadcast_id, bot))
 
     def start(self) -> None:
         """
         Функция, запускающая работу бота.
 
-        При запуске скачиваются клавиатуры.
-        Далее функция слушает longpoll, когда приходит текстовое сообщение, происходит логирование и вызов методов
+        При запуске бот прогревается (файлы, расписания, ссылки, соединения с базой данных и кэши),
+        продолжаются прерванные рассылки и сообщается о готовности (см. warmup).
+        Только после этого функция слушает longpoll, когда приходит текстовое сообщение, происходит логирование и вызов методов
         answer и not_found.
 
         Returns
         -------
         None
         """
+        Warmup(self.answer_config, PlatformVK).run()
+        self.resume_broadcasts()
+        mark_ready()
+        self.long_poll = VkLongPoll(self.vk)
         for event in self.long_poll.listen():  # слушаем longpoll
-            self.used = False  # изначально ответ пользователю не произошёл
             if event.type == VkEventType.MESSAGE_NEW and event.to_me and event.text:  # если пришло текстовое сообщение
                 self.message_handler(event)
 
+
+
+class TgBot(IBot):
+    """Класс TgBot используется для создания и запуска бота telegram
+
+    Обновления получаются методом getUpdates пачками до batch_size и обрабатываются
+    параллельно в пуле потоков. Обновления одного чата обрабатываются по порядку:
+    задача обработки чата ждет завершения предыдущей задачи этого чата.
+    Соединения с базой данных и кэши (запросы, графики, вложения) общие с VkBot,
+    поэтому оба бота могут работать в одном процессе.
+
+    https://core.telegram.org/bots/api#getupdates
+
+    Attributes
+    ----------
+    bot: telebot.TeleBot
+        Клиент Telegram Bot API
+    ApiException: type
+        Ошибка Telegram Bot API
+    executor: ThreadPoolExecutor
+        Потоки обработки обновлений
+    chats: dict
+        Последняя задача обработки каждого чата
+    limiter: TokenBucket
+        Ограничитель частоты отправки сообщений
+    attachments: SQLAttachments
+        Хранилище file_id уже загруженных изображений
+    throttle: PeerThrottle
+        Ограничение частоты сообщений пользователей, None - без ограничения
+    recent: RecentMessages
+        Id последних сообщений для отбрасывания повторно доставленных
+    default_keyboards: MemoryCache
+        Текущее меню каждого чата
+    """
+    def __init__(self, config):
+        try:
+            # telebot импортируется только при запуске telegram бота
+            import telebot
+            self.bot = telebot.TeleBot(PlatformTG.settings.TOKEN, threaded=False)
+            self.ApiException = telebot.apihelper.ApiException
+            self.answer_config = config
+            self.executor = ThreadPoolExecutor(max_workers=PlatformTG.settings.WORKERS, thread_name_prefix="TgBot")
+            self.chats = {}
+            self.limiter = TokenBucket(rate=PlatformTG.settings.RATE)
+            self.throttle = self.make_throttle()
+            self.recent = RecentMessages("tg")
+            self.attachments = SQLAttachments(PlatformTG.table_name)
+            self.default_keyboards = MemoryCache(max_size=10000)
+            self.offset = None
+        except Exception:
+            logger.error("TgBot initialization failed", exc_info=True)
+            raise
+
+    def send_message(self, peer_id: int, text: str, keyboard=None) -> None:
+        """
+        Отправка сообщения пользователю
+
+        https://core.telegram.org/bots/api#sendmessage
+
+        Parameters
+        ----------
+        peer_id: int
+            id чата, в который нужно отправить сообщение
+        text: str
+            Сообщение, которое будет отправлено пользователю
+        keyboard: ReplyKeyboardMarkup, default None
+            Экранная клавиатура, которая будет показываться пользователю.
+            Если keyboard = None, то отправляется текущее меню чата
+
+        Returns
+        -------
+        None
+        """
+        if keyboard is None:
+            keyboard = self.get_default_keyboard(peer_id)
+        self.limiter.acquire()
+        with external_call("telegram", "sendMessage"):
+            self.bot.send_message(peer_id, text, reply_markup=keyboard)
+
+    def send_bulk(self, peer_ids: list, text: str, random_id: int = None) -> None:
+        """
+        Отправка одного сообщения нескольким пользователям
+
+        В Telegram Bot API нет массовой отправки, поэтому сообщения отправляются по одному
+        с учетом ограничения частоты. Ошибка отправки одному пользователю (например, бот
+        заблокирован) не прерывает отправку остальным
+
+        Parameters
+        ----------
+        peer_ids: list
+            id чатов, в которые нужно отправить сообщение
+        text: str
+            Текст сообщения
+        random_id: int, default None
+            Не используется, параметр для совместимости с VkBot.send_bulk
+
+        Returns
+        -------
+        None
+        """
+        failed = []
+        for peer_id in peer_ids:
+            self.limiter.acquire()
+            try:
+                self.bot.send_message(peer_id, text)
+            except self.ApiException:
+                failed.append(peer_id)
+        if failed:
+            logger.warning("send_bulk(): not delivered to %s users: %s", len(failed), failed)
+
+    def send_photo(self, peer_id: int, image_url: str = None, file_name: str = None, image_data: bytes = None):
+        """
+        Отправка изображения пользователю
+
+        Изображение, уже отправленное ранее, отправляется по сохраненному file_id без повторной загрузки
+
+        https://core.telegram.org/bots/api#sendphoto
+
+        Parameters
+        ----------
+        peer_id: int
+            id чата, в который нужно отправить изображение
+        image_url: str
+            Ссылка на изображение
+        file_name: str, default None
+            Название файла с изображением
+        image_data: bytes, default None
+            Содержимое изображения
+
+        Returns
+        -------
+        None
+        """
+        if image_url is not None:
+            self.send_attachment(peer_id, self.attachments.url_key(image_url), image_url)
+        if file_name is not None:
+            with open(file_name, "rb") as image:
+                image_data = image.read()
+        if image_data is not None:
+            self.send_attachment(peer_id, self.attachments.data_key(image_data), image_data)
+
+    def send_attachment(self, peer_id: int, key: str, photo) -> None:
+        if file_id := self.attachments.get_attachment(key):
+            self.limiter.acquire()
+            try:
+                with external_call("telegram", "sendPhoto"):
+                    self.bot.send_photo(peer_id, file_id)
+                return
+            except self.ApiException:
+                logger.warning("send_attachment(): cached file_id %s rejected, uploading again", file_id)
+                self.attachments.delete_attachment(key)
+        self.limiter.acquire()
+        with external_call("telegram", "sendPhoto"):
+            message = self.bot.send_photo(peer_id, io.BytesIO(photo) if isinstance(photo, bytes) else photo)
+        self.attachments.add_attachment(key, message.photo[-1].file_id)
+
+    def get_default_keyboard(self, peer_id: int):
+        name = self.default_keyboards.get(peer_id) or PlatformTG.keyboard_name.START["start1"]
+        return PlatformTG.keyboard.json_to_keyboard(name)
+
+    def answer(self, peer_id: int, text: str) -> bool:
+        """
+        Функция, отправляющая ответ пользователю на его сообщение
+
+        Parameters
+        ----------
+        peer_id: int
+            id чата
+        text: str
+            Текст сообщения
+
+        Returns
+        -------
+        bool
+            True, если ответ был отправлен
+        """
+        answer = Answerer(
+            answer_config=self.answer_config,
+            platform_config=PlatformTG
+        ).get_answer(peer_id=peer_id, text=text)
+        StatsCollector.get(PlatformTG.table_name, "tg").record(peer_id, answer.get(AnswerKey.HANDLER))
+        used = False
+
+        if answer.get(AnswerKey.PHOTO_LINK):
+            self.send_photo(peer_id=peer_id, image_url=answer.get(AnswerKey.PHOTO_LINK))
+            used = True
+
+        if answer.get(AnswerKey.PHOTO_DATA):
+            self.send_photo(peer_id=peer_id, image_data=answer.get(AnswerKey.PHOTO_DATA))
+            used = True
+
+        if answer.get(AnswerKey.PHOTO_FILE):
+            self.send_photo(peer_id=peer_id, file_name=answer.get(AnswerKey.PHOTO_FILE))
+            used = True
+
+        if answer.get(AnswerKey.DEFAULT_KEYBOARD):
+            # json_to_keyboard для telegram возвращает объект, поэтому сохраняется название файла меню
+            for name in PlatformTG.keyboard_name.START.values():
+                if PlatformTG.keyboard.json_to_keyboard(name) is answer.get(AnswerKey.DEFAULT_KEYBOARD):
+                    self.default_keyboards.set(peer_id, name)
+
+        if answer.get(AnswerKey.TEXT_ANSWER):
+            self.send_message(
+                peer_id=peer_id,
+                text=answer.get(AnswerKey.TEXT_ANSWER),
+                keyboard=answer.get(AnswerKey.KEYBOARD)
+            )
+            used = True
+
+        if answer.get(AnswerKey.BACKGROUND_TASK):
+            threading.Thread(target=answer.get(AnswerKey.BACKGROUND_TASK), args=(self,), daemon=True).start()
+
+        return used
+
+    def message_handler(self, update: "telebot.types.Update") -> None:
+        """
+        Обработка одного обновления: текстового сообщения или нажатия inline кнопки
+
+        Parameters
+        ----------
+        update: telebot.types.Update
+            Обновление telegram
+
+        Returns
+        -------
+        None
+        """
+        if update.callback_query is not None:
+            self.bot.answer_callback_query(update.callback_query.id)
+            message, user, text = update.callback_query.message, update.callback_query.from_user, \
+                update.callback_query.data
+        else:
+            message = update.message
+            if message is None or not message.text:
+                return
+            user, text = message.from_user, message.text
+        peer_id = message.chat.id
+        if self.recent.is_duplicate(peer_id, update.update_id) or self.is_throttled(peer_id, "tg"):
+            return
+        with start_trace("tg.message", peer_id=peer_id, update_id=update.update_id):
+            try:
+                SQLUser(PlatformTG.table_name).log_user(user_id=peer_id, name=user.first_name, surname=user.last_name)
+                MessageLogWriter.get(PlatformTG.table_name).add(
+                    message_id=update.update_id,  # message_id в telegram уникален только внутри чата
+                    user_id=peer_id,
+                    text=text)
+                if not self.answer(peer_id, text):
+                    self.send_message(peer_id, "Шо?")  # чтобы ответ пользователю в любом случае произошёл
+            except Exception:
+                logger.error("TgBot.message_handler(): Exception occurred, trace %s", current_trace_id(), exc_info=True)
+
+    def handle_chat(self, previous, updates: list) -> None:
+        if previous is not None:
+            wait([previous])
+        for update in updates:
+            self.message_handler(update)
+
+    def dispatch(self, updates: list) -> None:
+        """
+        Распределение пачки обновлений по задачам обработки чатов
+
+        Parameters
+        ----------
+        updates: list
+            Обновления в порядке получения
+
+        Returns
+        -------
+        None
+        """
+        by_chat = {}
+        for update in updates:
+            if update.callback_query is not None and update.callback_query.message is not None:
+                chat_id = update.callback_query.message.chat.id
+            elif update.message is not None:
+                chat_id = update.message.chat.id
+            else:
+                continue
+            by_chat.setdefault(chat_id, []).append(update)
+        self.chats = {chat_id: future for chat_id, future in self.chats.items() if not future.done()}
+        for chat_id, chat_updates in by_chat.items():
+            self.chats[chat_id] = self.executor.submit(self.handle_chat, self.chats.get(chat_id), chat_updates)
+
+    def resume_broadcasts(self) -> None:
+        broadcast = self.answer_config.broadcast(PlatformTG.table_name)
+        for broadcast_id in broadcast.get_unfinished():
+            threading.Thread(target=broadcast.run, args=(broadcast_id, self), daemon=True).start()
+
+    def start(self) -> None:
+        """
+        Функция, запускающая работу бота: получение обновлений методом getUpdates
+
+        Returns
+        -------
+        None
+        """
+        self.resume_broadcasts()
+        while True:
+            try:
+                updates = self.bot.get_updates(
+                    offset=self.offset,
+                    limit=PlatformTG.settings.BATCH_SIZE,
+                    timeout=PlatformTG.settings.POLL_TIMEOUT,
+                    long_polling_timeout=PlatformTG.settings.POLL_TIMEOUT
+                )
+            except Exception:
+                logger.error("TgBot.start(): getUpdates failed", exc_info=True)
+                time.sleep(1)
+                continue
+            if updates:
+                self.offset = updates[-1].update_id + 1
+                self.dispatch(updates)
@@ -0,0 +1,230 @@
+import threading
+import zlib
+from abc import ABCMeta, abstractmethod, ABC
+
+from psycopg2 import sql
+
+from postgres import PostgreSQL as pSQL
+from settings import BroadcastSettings, AnswerValue, logger
+
+
+class IBroadcast(ABC):
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def create(self, author_id: int, text: str, course: str = None, group: str = None) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_unfinished(self) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def run(self, broadcast_id: int, bot) -> None:
+        raise NotImplementedError
+
+
+class SQLBroadcast(IBroadcast):
+    """Класс для рассылки сообщений зарегистрированным пользователям
+
+    Получатели выбираются из таблицы регистрации по возрастанию user_id и читаются курсором
+    на стороне сервера, поэтому список получателей не загружается в память целиком.
+    Сообщение отправляется пачками до chunk_size получателей одним вызовом messages.send.
+    После каждой пачки в таблице рассылок сохраняется последний обработанный user_id,
+    поэтому прерванная рассылка продолжается с места остановки (см. get_unfinished).
+
+    Attributes
+    ----------
+    running: set
+        id рассылок, выполняемых в этом процессе
+    chunk_size: int
+        Количество получателей в одном вызове messages.send (ограничение VkAPI - 100)
+    """
+    RUNNING = "running"
+    FINISHED = "finished"
+
+    running = set()
+    _lock = threading.Lock()
+
+    def __init__(self, table_name):
+        self.SQL = pSQL
+        self.TableName = table_name
+        self.chunk_size = BroadcastSettings.CHUNK_SIZE
+        self.progress_every = BroadcastSettings.PROGRESS_EVERY
+
+    def create(self, author_id: int, text: str, course: str = None, group: str = None) -> int:
+        """
+        Создание рассылки
+
+        Parameters
+        ----------
+        author_id: int
+            id администратора, которому отправляются отчеты о ходе рассылки
+        text: str
+            Текст рассылки
+        course: str, default None
+            Курс получателей, None - все курсы
+        group: str, default None
+            Группа получателей, None - все группы
+
+        Returns
+        -------
+        int
+            id рассылки
+        """
+        query = sql.SQL("""
+        INSERT INTO {table_name} (author_id, course, user_group, text, status, created)
+        VALUES ({author_id}, {course}, {group}, {text}, {status}, NOW())
+        RETURNING id;
+        """).format(
+            table_name=sql.Identifier(self.TableName.BROADCASTS),
+            author_id=sql.Literal(author_id),
+            course=sql.Literal(course),
+            group=sql.Literal(group),
+            text=sql.Literal(text),
+            status=sql.Literal(self.RUNNING)
+        )
+        return self.SQL().execute_query(query, returning=True)[0]
+
+    def get(self, broadcast_id: int):
+        query = sql.SQL("""
+        SELECT author_id, course, user_group, text, last_user_id, sent FROM {table_name}
+        WHERE id = {broadcast_id};
+        """).format(
+            table_name=sql.Identifier(self.TableName.BROADCASTS),
+            broadcast_id=sql.Literal(broadcast_id)
+        )
+        return self.SQL().execute_read_query(query, one=True)
+
+    def get_unfinished(self) -> list:
+        """
+        Получение рассылок, которые были прерваны до завершения
+
+        Returns
+        -------
+        list
+            Список id рассылок
+        """
+        query = sql.SQL("""
+        SELECT id FROM {table_name}
+        WHERE status = {status}
+        ORDER BY id;
+        """).format(
+            table_name=sql.Identifier(self.TableName.BROADCASTS),
+            status=sql.Literal(self.RUNNING)
+        )
+        return [row[0] for row in self.SQL().execute_read_query(query) or []]
+
+    def save_progress(self, broadcast_id: int, last_user_id: int, sent: int) -> None:
+        query = sql.SQL("""
+        UPDATE {table_name}
+        SET last_user_id = {last_user_id}, sent = {sent}
+        WHERE id = {broadcast_id};
+        """).format(
+            table_name=sql.Identifier(self.TableName.BROADCASTS),
+            last_user_id=sql.Literal(last_user_id),
+            sent=sql.Literal(sent),
+            broadcast_id=sql.Literal(broadcast_id)
+        )
+        self.SQL().execute_query(query)
+
+    def finish(self, broadcast_id: int) -> None:
+        query = sql.SQL("""
+        UPDATE {table_name}
+        SET status = {status}
+        WHERE id = {broadcast_id};
+        """).format(
+            table_name=sql.Identifier(self.TableName.BROADCASTS),
+            status=sql.Literal(self.FINISHED),
+            broadcast_id=sql.Literal(broadcast_id)
+        )
+        self.SQL().execute_query(query)
+
+    def recipients(self, course: str = None, group: str = None, after: int = 0):
+        """
+        Потоковое получение id получателей рассылки
+
+        Parameters
+        ----------
+        course: str, default None
+            Курс получателей, None - все курсы
+        group: str, default None
+            Группа получателей, None - все группы
+        after: int, default 0
+            Возвращаются только пользователи с user_id больше after
+
+        Returns
+        -------
+        generator
+            id пользователей по возрастанию
+        """
+        query = sql.SQL("""
+        SELECT user_id FROM {table_name}
+        WHERE user_id > {after}
+        AND ({course}::TEXT IS NULL OR user_course = {course})
+        AND ({group}::TEXT IS NULL OR user_group = {group})
+        AND NOT EXISTS (SELECT 1 FROM {ban_list} WHERE {ban_list}.user_id = {table_name}.user_id)
+        ORDER BY user_id;
+        """).format(
+            table_name=sql.Identifier(self.TableName.REG_INFO),
+            ban_list=sql.Identifier(self.TableName.BAN_LIST),
+            after=sql.Literal(after),
+            course=sql.Literal(course),
+            group=sql.Literal(group)
+        )
+        for row in self.SQL().iterate_read_query(query, itersize=self.chunk_size * 10):
+            yield row[0]
+
+    def run(self, broadcast_id: int, bot) -> None:
+        """
+        Выполнение рассылки
+
+        Сообщение отправляется методом bot.send_bulk пачками до chunk_size получателей.
+        random_id пачки зависит от id рассылки и первого получателя, поэтому пачка,
+        повторно отправленная после перезапуска, не дублируется у пользователей.
+
+        Parameters
+        ----------
+        broadcast_id: int
+            id рассылки
+        bot: IBot
+            Бот, через которого отправляются сообщения
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if broadcast_id in self.running:
+                return
+            self.running.add(broadcast_id)
+        try:
+            author_id, course, group, text, last_user_id, sent = self.get(broadcast_id)
+            logger.info("broadcast %s: started from user_id %s, sent %s", broadcast_id, last_user_id, sent)
+            reported = sent // self.progress_every
+            chunk = []
+            for user_id in self.recipients(course, group, after=last_user_id):
+                chunk.append(user_id)
+                if len(chunk) < self.chunk_size:
+                    continue
+                sent += self.send_chunk(broadcast_id, bot, chunk, text, sent)
+                chunk = []
+                if sent // self.progress_every > reported:
+                    reported = sent // self.progress_every
+                    bot.send_message(author_id, AnswerValue.BROADCAST_PROGRESS.format(broadcast_id, sent))
+            if chunk:
+                sent += self.send_chunk(broadcast_id, bot, chunk, text, sent)
+            self.finish(broadcast_id)
+            logger.info("broadcast %s: finished, sent %s", broadcast_id, sent)
+            bot.send_message(author_id, AnswerValue.BROADCAST_FINISH.format(broadcast_id, sent))
+        except Exception:
+            logger.error("broadcast %s: Exception occurred", broadcast_id, exc_info=True)
+        finally:
+            with self._lock:
+                self.running.discard(broadcast_id)
+
+    def send_chunk(self, broadcast_id: int, bot, chunk: list, text: str, sent: int) -> int:
+        random_id = zlib.crc32(f"broadcast:{broadcast_id}:{chunk[0]}".encode()) & 0x7fffffff
+        bot.send_bulk(chunk, text, random_id=random_id)
+        self.save_progress(broadcast_id, chunk[-1], sent + len(chunk))
+        return len(chunk)
@@ -0,0 +1,441 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABCMeta, abstractmethod, ABC
+from collections import OrderedDict
+
+from settings import logger
+
+
+class ICache(ABC):
+    """
+    Интерфейс для класса кэша
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def get(self, key: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, value) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCache(ICache):
+    """Кэш в памяти с вытеснением давно не использованных записей (LRU) и временем жизни записей
+
+    Attributes
+    ----------
+    max_size: int
+        Максимальное количество записей
+    ttl: float
+        Время жизни записи в секундах, 0 - без ограничения
+    hits: int
+        Количество попаданий в кэш
+    misses: int
+        Количество промахов
+    """
+    def __init__(self, max_size: int = 1000, ttl: float = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires = item
+            if expires and expires < time.time():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value) -> None:
+        expires = time.time() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def add(self, key: str, value=True) -> bool:
+        """
+        Атомарная запись значения, только если ключа в кэше нет (или его запись устарела)
+
+        Returns
+        -------
+        bool
+            True если значение записано, False если ключ уже был в кэше
+        """
+        expires = time.time() + self.ttl if self.ttl else 0
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and not (item[1] and item[1] < time.time()):
+                self._data.move_to_end(key)
+                return False
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+            return True
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache(ICache):
+    """Дисковый кэш в файле SQLite с временем жизни записей и ограничением на их количество
+
+    Значения сериализуются с помощью pickle. При превышении max_size удаляются
+    записи с самым старым временем последнего обращения.
+
+    Attributes
+    ----------
+    filename: str
+        Имя файла базы данных
+    table: str
+        Имя таблицы, в которой хранятся записи (позволяет держать несколько кэшей в одном файле)
+    max_size: int
+        Максимальное количество записей
+    ttl: float
+        Время жизни записи в секундах, 0 - без ограничения
+    hits: int
+        Количество попаданий в кэш
+    misses: int
+        Количество промахов
+    """
+    def __init__(self, filename: str, table: str = "cache", max_size: int = 100000, ttl: float = 0):
+        self.filename = filename
+        self.table = table
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        Ленивое открытие соединения с файлом кэша
+
+        Returns
+        -------
+        sqlite3.Connection
+            Соединение, общее для всех потоков (доступ защищен блокировкой)
+        """
+        if self._connection is None:
+            directory = os.path.dirname(self.filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.filename, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS "{self.table}"(
+                key TEXT PRIMARY KEY,
+                value BLOB,
+                expires REAL,
+                accessed REAL
+            )""")
+            self._connection.execute(f"""
+            CREATE INDEX IF NOT EXISTS "{self.table}_accessed" ON "{self.table}"(accessed)
+            """)
+            self._connection.commit()
+        return self._connection
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            try:
+                connection = self.get_connection()
+                row = connection.execute(
+                    f'SELECT value, expires FROM "{self.table}" WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                value, expires = row
+                if expires and expires < now:
+                    connection.execute(f'DELETE FROM "{self.table}" WHERE key = ?', (key,))
+                    connection.commit()
+                    self.misses += 1
+                    return None
+                connection.execute(f'UPDATE "{self.table}" SET accessed = ? WHERE key = ?', (now, key))
+                connection.commit()
+            except sqlite3.Error:
+                logger.error("SQLiteCache.get(): Exception occurred", exc_info=True)
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(value)
+
+    def set(self, key: str, value) -> None:
+        now = time.time()
+        expires = now + self.ttl if self.ttl else 0
+        with self._lock:
+            try:
+                connection = self.get_connection()
+                connection.execute(
+                    f'INSERT OR REPLACE INTO "{self.table}" VALUES (?, ?, ?, ?)',
+                    (key, pickle.dumps(value), expires, now)
+                )
+                self._writes += 1
+                # вытеснение выполняется пачкой, а не на каждую запись
+                if self._writes % 100 == 0:
+                    self.evict(connection, now)
+                connection.commit()
+            except sqlite3.Error:
+                logger.error("SQLiteCache.set(): Exception occurred", exc_info=True)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            try:
+                connection = self.get_connection()
+                connection.execute(f'DELETE FROM "{self.table}" WHERE key = ?', (key,))
+                connection.commit()
+            except sqlite3.Error:
+                logger.error("SQLiteCache.delete(): Exception occurred", exc_info=True)
+
+    def evict(self, connection: sqlite3.Connection, now: float) -> None:
+        """
+        Удаление просроченных записей и записей сверх max_size
+
+        Parameters
+        ----------
+        connection: sqlite3.Connection
+            Соединение с файлом кэша
+        now: float
+            Текущее время
+
+        Returns
+        -------
+        None
+        """
+        connection.execute(f'DELETE FROM "{self.table}" WHERE expires > 0 AND expires < ?', (now,))
+        count = connection.execute(f'SELECT COUNT(*) FROM "{self.table}"').fetchone()[0]
+        if count > self.max_size:
+            connection.execute(f"""
+            DELETE FROM "{self.table}" WHERE key IN (
+                SELECT key FROM "{self.table}" ORDER BY accessed LIMIT ?
+            )""", (count - self.max_size,))
+
+
+class TieredCache(ICache):
+    """Двухуровневый кэш: быстрый кэш в памяти поверх дискового
+
+    Промах в памяти проверяется на диске, найденное на диске значение поднимается в память.
+
+    Attributes
+    ----------
+    memory: MemoryCache
+        Первый уровень
+    disk: SQLiteCache
+        Второй уровень
+    hits: int
+        Количество попаданий (в любой уровень)
+    misses: int
+        Количество промахов мимо обоих уровней
+    """
+    def __init__(self, memory: MemoryCache, disk: SQLiteCache):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value) -> None:
+        self.memory.set(key, value)
+        self.disk.set(key, value)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        self.disk.delete(key)
+
+    def stats(self) -> dict:
+        """
+        Статистика обращений к кэшу
+
+        Returns
+        -------
+        dict
+            Количество попаданий и промахов по уровням
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk.hits,
+        }
+
+
+class FileCache:
+    """Хранилище файлов, адресуемых по содержимому, с вытеснением давно не использованных файлов
+
+    Имя файла - sha256 от его содержимого, поэтому одинаковые данные хранятся один раз,
+    а записанный файл больше никогда не меняется и может читаться одновременно несколькими обработчиками.
+    Время последнего обращения хранится в mtime файла.
+
+    Attributes
+    ----------
+    directory: str
+        Папка с файлами
+    suffix: str
+        Расширение файлов
+    max_files: int
+        Максимальное количество файлов в папке
+    """
+    def __init__(self, directory: str, suffix: str = "", max_files: int = 1000):
+        self.directory = directory
+        self.suffix = suffix
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def get_path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}{self.suffix}")
+
+    def get(self, digest: str):
+        """
+        Получение пути к файлу по хэшу содержимого
+
+        Parameters
+        ----------
+        digest: str
+            Хэш содержимого
+
+        Returns
+        -------
+        str или None
+            Путь к файлу, None если файла нет
+        """
+        path = self.get_path(digest)
+        try:
+            os.utime(path)  # отметка использования для LRU
+        except FileNotFoundError:
+            return None
+        return path
+
+    def read(self, digest: str):
+        """
+        Чтение содержимого файла по хэшу
+
+        Parameters
+        ----------
+        digest: str
+            Хэш содержимого
+
+        Returns
+        -------
+        bytes или None
+            Содержимое файла, None если файла нет
+        """
+        if (path := self.get(digest)) is None:
+            return None
+        try:
+            with open(path, "rb") as handler:
+                return handler.read()
+        except FileNotFoundError:  # файл мог быть вытеснен между get и open
+            return None
+
+    def put(self, data: bytes) -> str:
+        """
+        Сохранение данных в файл
+
+        Parameters
+        ----------
+        data: bytes
+            Содержимое файла
+
+        Returns
+        -------
+        str
+            Хэш содержимого
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.get_path(digest)
+        if self.get(digest) is None:
+            os.makedirs(self.directory, exist_ok=True)
+            # запись во временный файл и переименование, чтобы читатель не увидел недописанный файл
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as handler:
+                handler.write(data)
+            os.replace(tmp_path, path)
+            self.evict()
+        return digest
+
+    def evict(self) -> None:
+        """
+        Удаление файлов, к которым дольше всего не обращались, сверх max_files
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(self.directory)
+                           if entry.is_file() and entry.name.endswith(self.suffix)]
+            except FileNotFoundError:
+                return
+            if len(entries) <= self.max_files:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.max_files]:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+def normalize_key(text: str) -> str:
+    """
+    Приведение текста запроса к виду, используемому как ключ кэша
+
+    Регистр сохраняется: запросы к вольфраму различают регистр (Mm - мегаметр, mm - миллиметр)
+
+    Parameters
+    ----------
+    text: str
+        Текст запроса
+
+    Returns
+    -------
+    str
+        Текст без лишних пробелов
+    """
+    return " ".join(text.split())
@@ -1,5 +1,7 @@
 import subprocess
 
+from metrics import external_call
+
 
 class PHPExecutor:
     def __init__(self, filename):
@@ -10,7 +12,8 @@ class PHPExecutor:
         return proc
 
     def execute_code(self, args: str = "") -> str:
-        proc = self.submit(args)
-        script_response = proc.stdout.read()
+        with external_call("php", self.filename):
+            proc = self.submit(args)
+            script_response = proc.stdout.read()
         return script_response.decode("utf-8")
 
@@ -1,7 +1,41 @@
-import pandas as pd
+"""
+Загрузка таблиц из хранилища
+
+pandas импортируется внутри методов при первой загрузке таблицы: это самый долгий импорт бота,
+а таблицы ссылок и расписаний нужны только части команд.
+"""
+import os
+from typing import TYPE_CHECKING
 
 from file_storage import GoogleAPI
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def modified_time(file_name: str, extension: str):
+    """
+    Время изменения локального файла таблицы
+
+    Parameters
+    ----------
+    file_name: str
+        Название файла, можно без расширения
+    extension: str
+        Расширение (.csv, .xlsx)
+
+    Returns
+    -------
+    int или None
+        Время изменения в наносекундах, None если файла нет
+    """
+    if file_name[-len(extension):] != extension:
+        file_name = f"{file_name}{extension}"
+    try:
+        return os.stat(file_name).st_mtime_ns
+    except OSError:
+        return None
+
 
 class PandasLoader:
     """Класс для возвращения содержимого файлов в качестве Pandas объектов
@@ -35,7 +69,7 @@ class PandasLoader:
         except FileNotFoundError:
             return False
 
-    def get_csv(self, file_name: str, folder_name: str = None) -> pd.DataFrame:
+    def get_csv(self, file_name: str, folder_name: str = None) -> "pd.DataFrame":
         """
         Получение содержимого csv файла как Pandas таблички.
 
@@ -53,6 +87,7 @@ class PandasLoader:
         pd.DataFrame
             Pandas таблица с содержимым файла
         """
+        import pandas as pd
         if file_name[-4:] != ".csv":
             file_name = f"{file_name}.csv"
         if self.is_exist(file_name):
@@ -63,7 +98,7 @@ class PandasLoader:
             self.Storage().download_file(file_name)
         return pd.read_csv(file_name)
 
-    def update_csv(self, file_name: str, df: pd.DataFrame) -> None:
+    def update_csv(self, file_name: str, df: "pd.DataFrame") -> None:
         """
         Обновление содержимого file_name данными из Pandas таблицы df
 
@@ -81,7 +116,7 @@ class PandasLoader:
         df.to_csv(file_name, index=False)
         self.Storage().update_file(file_name, 'text/csv')
 
-    def get_excel(self, file_name: str, sheet_name: str = None, folder_name: str = None) -> pd.ExcelFile or pd.DataFrame:
+    def get_excel(self, file_name: str, sheet_name: str = None, folder_name: str = None) -> "pd.ExcelFile or pd.DataFrame":
         """
         Получение содержимого excel файла как Pandas объекта.
 
@@ -101,6 +136,7 @@ class PandasLoader:
         pd.ExcelFile или pd.DataFrame
             Pandas Excel file или Pandas таблица с содержимым страницы excel файла
         """
+        import pandas as pd
         if file_name[-5:] != ".xlsx":
             file_name = f"{file_name}.xlsx"
         if self.is_exist(file_name):
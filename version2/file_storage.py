@@ -1,12 +1,9 @@
 import io
-
-import googleapiclient
-from google.oauth2 import service_account
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
-from googleapiclient.discovery import build
-from httplib2 import ServerNotFoundError
+import os
+import tempfile
 from abc import ABCMeta, abstractmethod, ABC
 
+from resilience import GOOGLE_DRIVE
 from settings import GoogleAPISettings, logger
 
 
@@ -72,10 +69,18 @@ class GoogleAPI(IStorage):
         GDConnection
             Если соединение с Google не будет установлено
         """
+        # клиент Google API импортируется при первом подключении к диску
+        from google.oauth2 import service_account
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build
+        from httplib2 import Http, ServerNotFoundError
         service = None
         try:
             credentials = service_account.Credentials.from_service_account_file(self.key_file_name, scopes=self.scopes)
-            service = build(self.api_name, self.api_version, credentials=credentials)
+            # без таймаута зависший запрос к диску (и скачивание файла по частям) блокирует поток навсегда
+            http = AuthorizedHttp(credentials, http=Http(timeout=GOOGLE_DRIVE.timeout))
+            with GOOGLE_DRIVE.guard("discovery"):
+                service = build(self.api_name, self.api_version, http=http)
             logger.debug("Connection to GoogleDisk successful")
         except ServerNotFoundError:
             logger.error("Connection to GoogleDisk failed", exc_info=True)
@@ -91,14 +96,16 @@ class GoogleAPI(IStorage):
         dict
             Словарь с информацией о файлах
         """
-        results = self.service.files().list(pageSize=10,
-                                            fields="nextPageToken, files(id, name, mimeType)").execute()
+        with GOOGLE_DRIVE.guard("files.list"):
+            results = self.service.files().list(pageSize=10,
+                                                fields="nextPageToken, files(id, name, mimeType)").execute()
         nextPageToken = results.get('nextPageToken')
         while nextPageToken:
-            nextPage = self.service.files().list(
-                pageSize=10,
-                fields="nextPageToken, files(id, name, mimeType, parents)",
-                pageToken=nextPageToken).execute()
+            with GOOGLE_DRIVE.guard("files.list"):
+                nextPage = self.service.files().list(
+                    pageSize=10,
+                    fields="nextPageToken, files(id, name, mimeType, parents)",
+                    pageToken=nextPageToken).execute()
             nextPageToken = nextPage.get('nextPageToken')
             results['files'] = results['files'] + nextPage['files']
         logger.debug("get_files(): status message: %s", "OK")
@@ -146,10 +153,11 @@ class GoogleAPI(IStorage):
             Данные файлов из папки
         """
         folder_id = self.get_id(folder_name)
-        folder_files = self.service.files().list(
-            pageSize=100,
-            fields="nextPageToken, files(id, name, mimeType, parents, createdTime)",
-            q=f"'{folder_id}' in parents").execute()
+        with GOOGLE_DRIVE.guard("files.list"):
+            folder_files = self.service.files().list(
+                pageSize=100,
+                fields="nextPageToken, files(id, name, mimeType, parents, createdTime)",
+                q=f"'{folder_id}' in parents").execute()
         return folder_files['files']
 
     def download_folder_files(self, folder_name: str) -> bool:
@@ -166,18 +174,9 @@ class GoogleAPI(IStorage):
         bool
             Статус загрузки, True если не произошло ошибок
         """
-        files_ids = []
-        files_names = []
         files_dict = self.get_folder_files_list(folder_name)
         for i in range(len(files_dict)):
-            files_ids.append(files_dict[i]['id'])
-            files_names.append(files_dict[i]['name'])
-            request = self.service.files().get_media(fileId=files_ids[i])
-            fh = io.FileIO(files_names[i], 'wb')
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                done = downloader.next_chunk()
+            self.download_media(files_dict[i]['id'], files_dict[i]['name'])
         logger.debug("download_folder_files(): status message: %s", "OK")
         return True
 
@@ -194,16 +193,44 @@ class GoogleAPI(IStorage):
         bool
             Статус загрузки, True если не произошло ошибок
         """
-        file_id = self.get_id(file_name)
-        request = self.service.files().get_media(fileId=file_id)
-        fh = io.FileIO(file_name, 'wb')
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            done = downloader.next_chunk()
+        self.download_media(self.get_id(file_name), file_name)
         logger.debug("download_file(): status message: %s", "OK")
         return True
 
+    def download_media(self, file_id: str, file_name: str) -> None:
+        """
+        Скачивание содержимого файла с Google диска в локальный файл
+
+        Файл скачивается во временный файл в той же папке и заменяет локальный только
+        после успешного скачивания: при ошибке диска остается прежняя версия файла
+
+        Parameters
+        ----------
+        file_id: str
+            id файла на диске
+        file_name: str
+            Путь к локальному файлу
+
+        Returns
+        -------
+        None
+        """
+        from googleapiclient.http import MediaIoBaseDownload
+        request = self.service.files().get_media(fileId=file_id)
+        fd, temp_name = tempfile.mkstemp(prefix=f".{os.path.basename(file_name)}.",
+                                         dir=os.path.dirname(os.path.abspath(file_name)))
+        try:
+            with io.FileIO(fd, 'wb') as fh:
+                downloader = MediaIoBaseDownload(fh, request)
+                done = False
+                with GOOGLE_DRIVE.guard("files.get_media"):
+                    while done is False:
+                        _, done = downloader.next_chunk()
+            os.replace(temp_name, file_name)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+
     def update_file(self, file_name: str, mime_type: str) -> bool:
         """
         Обновление содержимого существующего на диске файла
@@ -220,11 +247,13 @@ class GoogleAPI(IStorage):
         None
         """
         file_id = self.get_id(file_name)
+        from googleapiclient.http import MediaFileUpload
         file_metadata = {'name': file_name}
         media = MediaFileUpload(filename=file_name,
                                 mimetype=mime_type)
-        self.service.files().update(fileId=file_id,
-                                    body=file_metadata,
-                                    media_body=media).execute()
+        with GOOGLE_DRIVE.guard("files.update"):
+            self.service.files().update(fileId=file_id,
+                                        body=file_metadata,
+                                        media_body=media).execute()
         logger.debug("update_file(): status message: %s", "OK")
         return True
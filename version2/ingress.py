@@ -0,0 +1,506 @@
+"""
+Получение событий vk и распределение их между процессами-обработчиками
+
+Источник событий (Callback API, Bots Long Poll, user long poll или локальный генератор)
+складывает сообщения в очередь, разделенную на части по количеству процессов.
+Часть выбирается консистентным хэшированием peer_id, поэтому все сообщения одного пользователя
+обрабатываются одним процессом по порядку, а сообщения разных пользователей - параллельно.
+Для работы на нескольких машинах каждая машина запускает свой сервер Callback API
+за балансировщиком, который распределяет запросы по peer_id.
+"""
+import bisect
+import collections
+import hashlib
+import hmac
+import itertools
+import json
+import multiprocessing
+import multiprocessing.connection
+import queue
+import random
+import threading
+import time
+from abc import ABCMeta, abstractmethod, ABC
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+from vk_api.bot_longpoll import VkBotLongPoll
+from vk_api.longpoll import VkLongPoll, VkEventType
+
+from metrics import QUEUE_DEPTH
+from settings import IngressSettings, logger
+
+
+class Message(NamedTuple):
+    """Входящее текстовое сообщение, атрибуты совпадают с vk_api.longpoll.Event"""
+    peer_id: int
+    message_id: int
+    text: str
+
+
+def parse_event(raw: dict):
+    """
+    Получение сообщения из события Callback API / Bots Long Poll
+
+    https://vk.com/dev/callback_api
+
+    Parameters
+    ----------
+    raw: dict
+        Событие в формате json
+
+    Returns
+    -------
+    Message или None
+        Сообщение, если событие - новое текстовое сообщение
+    """
+    if raw.get("type") != "message_new":
+        return None
+    obj = raw.get("object") or {}
+    message = obj.get("message", obj)  # до версии API 5.103 объект события - само сообщение
+    if not message.get("text"):
+        return None
+    return Message(
+        peer_id=message.get("peer_id") or message.get("from_id") or message.get("user_id"),
+        message_id=message.get("id"),
+        text=message["text"]
+    )
+
+
+def parse_group_id(value: str) -> int:
+    """
+    Проверка id сообщества, нужного для Bots Long Poll
+
+    Parameters
+    ----------
+    value: str
+        Значение переменной окружения VK_GROUP_ID
+
+    Returns
+    -------
+    int
+        id сообщества
+
+    Raises
+    ------
+    ValueError
+        Если id не задан или не является положительным числом
+    """
+    if not value or not value.strip().isdigit() or not int(value):
+        raise ValueError(f"VK_GROUP_ID must be the positive community id for bots_longpoll ingress, got {value!r}")
+    return int(value)
+
+
+class IEventSource(ABC):
+    """
+    Интерфейс источника событий
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def listen(self):
+        raise NotImplementedError
+
+
+class UserLongPollSource(IEventSource):
+    """Источник событий user long poll (как в VkBot.start)"""
+    def __init__(self, vk):
+        self.long_poll = VkLongPoll(vk)
+
+    def listen(self):
+        for event in self.long_poll.listen():
+            if event.type == VkEventType.MESSAGE_NEW and event.to_me and event.text:
+                yield Message(peer_id=event.peer_id, message_id=event.message_id, text=event.text)
+
+
+class BotsLongPollSource(IEventSource):
+    """Источник событий Bots Long Poll API сообщества
+
+    https://vk.com/dev/bots_longpoll
+    """
+    def __init__(self, vk, group_id: int):
+        self.long_poll = VkBotLongPoll(vk, group_id)
+
+    def listen(self):
+        for event in self.long_poll.listen():
+            if message := parse_event(event.raw):
+                yield message
+
+
+class CallbackSource(IEventSource):
+    """Источник событий Callback API: http сервер, на который vk отправляет события
+
+    https://vk.com/dev/callback_api
+
+    Attributes
+    ----------
+    confirmation: str
+        Строка, которую сервер должен вернуть при подтверждении адреса
+    secret: str
+        Секретный ключ, передаваемый vk в каждом событии
+    events: queue.Queue
+        Полученные сообщения
+    """
+    def __init__(self, host: str, port: int, confirmation: str, secret: str = None):
+        self.confirmation = confirmation
+        self.secret = secret
+        self.events = queue.Queue()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+
+    def make_handler(self):
+        source = self
+
+        class CallbackHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                try:
+                    raw = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                except ValueError:
+                    self.reply(400, "bad request")
+                    return
+                if source.secret and not hmac.compare_digest(str(raw.get("secret", "")), source.secret):
+                    self.reply(403, "forbidden")
+                    return
+                if raw.get("type") == "confirmation":
+                    self.reply(200, source.confirmation)
+                    return
+                if message := parse_event(raw):
+                    source.events.put(message)
+                self.reply(200, "ok")  # vk повторяет событие, если не получил "ok"
+
+            def reply(self, code: int, body: str):
+                data = body.encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug("CallbackSource: " + format, *args)
+
+        return CallbackHandler
+
+    def listen(self):
+        threading.Thread(target=self.server.serve_forever, name="CallbackSource", daemon=True).start()
+        logger.info("CallbackSource: listening on %s:%s", *self.server.server_address[:2])
+        while True:
+            yield self.events.get()
+
+
+class FakeEventSource(IEventSource):
+    """Локальный источник сообщений для проверки и нагрузочного тестирования без vk
+
+    Attributes
+    ----------
+    peers: int
+        Количество пользователей
+    count: int
+        Количество сообщений, None - бесконечно
+    texts: list
+        Тексты сообщений
+    rate: float
+        Сообщений в секунду, None - без ограничения
+    """
+    def __init__(self, peers: int = 100, count: int = 1000, texts: list = None, rate: float = None, seed: int = 0):
+        self.peers = peers
+        self.count = count
+        self.texts = texts or ["расписание", "лекции", "другое", "вернуться в главное меню", "привет"]
+        self.rate = rate
+        self.random = random.Random(seed)
+
+    def listen(self):
+        message_id = 0
+        while self.count is None or message_id < self.count:
+            message_id += 1
+            yield Message(
+                peer_id=self.random.randint(1, self.peers),
+                message_id=message_id,
+                text=self.random.choice(self.texts)
+            )
+            if self.rate:
+                time.sleep(1 / self.rate)
+
+
+class FakeHandler:
+    """Обработчик для FakeEventSource: проверяет порядок сообщений каждого пользователя без обращения к vk"""
+    def __init__(self, index: int = 0, delay: float = 0):
+        self.index = index
+        self.delay = delay
+        self.last = {}
+        self.handled = 0
+
+    def message_handler(self, event) -> None:
+        if event.message_id <= self.last.get(event.peer_id, 0):
+            logger.warning("FakeHandler: message %s from %s out of order", event.message_id, event.peer_id)
+        self.last[event.peer_id] = event.message_id
+        self.handled += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.handled % 1000 == 0:
+            logger.info("FakeHandler %s: handled %s messages", self.index, self.handled)
+
+
+class HashRing:
+    """Консистентное хэширование: распределение ключей по узлам
+
+    Каждый узел занимает replicas точек на кольце, ключ относится к ближайшей по часовой стрелке точке.
+    При изменении количества узлов к другим узлам переходит только около 1/N ключей,
+    поэтому кэши процессов-обработчиков остаются актуальными для их пользователей.
+
+    Attributes
+    ----------
+    nodes: list
+        Узлы кольца
+    replicas: int
+        Количество точек на кольце для каждого узла
+    """
+    def __init__(self, nodes: list, replicas: int = 100):
+        self.nodes = list(nodes)
+        self.replicas = replicas
+        self.ring = sorted(
+            (self.hash(f"{node}:{replica}"), node)
+            for node in self.nodes
+            for replica in range(replicas)
+        )
+        self.points = [point for point, _ in self.ring]
+
+    @staticmethod
+    def hash(key) -> int:
+        # встроенный hash() для строк зависит от процесса, поэтому используется md5
+        return int.from_bytes(hashlib.md5(str(key).encode("utf-8")).digest()[:8], "big")
+
+    def get(self, key):
+        """
+        Получение узла для ключа
+
+        Parameters
+        ----------
+        key
+            Ключ (например, peer_id)
+
+        Returns
+        -------
+        Узел кольца
+        """
+        index = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+        return self.ring[index][1]
+
+
+def worker(index: int, handler_factory, events, acks) -> None:
+    """
+    Процесс-обработчик: последовательно обрабатывает сообщения своей части очереди
+
+    После обработки сообщения (успешной или с ошибкой) его номер отправляется в очередь подтверждений.
+    Неподтвержденные сообщения после падения процесса передаются перезапущенному процессу.
+
+    Parameters
+    ----------
+    index: int
+        Номер процесса
+    handler_factory: callable
+        Функция, создающая обработчик с методом message_handler(event); вызывается в процессе-обработчике
+    events: multiprocessing.Queue
+        Часть очереди этого процесса: пары (номер, сообщение), None - завершение работы
+    acks: multiprocessing.Queue
+        Очередь подтверждений: пары (номер процесса, номер сообщения)
+
+    Returns
+    -------
+    None
+    """
+    handler = handler_factory(index)
+    for seq, message in iter(events.get, None):
+        try:
+            handler.message_handler(message)
+        except Exception:
+            logger.error("worker(): message %s from %s failed", message.message_id, message.peer_id, exc_info=True)
+        acks.put((index, seq))
+
+
+class WorkerPool:
+    """Процессы-обработчики с очередью, разделенной по пользователям, и перезапуском при падении
+
+    Процесс для сообщения выбирается консистентным хэшированием peer_id, поэтому сообщения
+    одного пользователя обрабатываются одним процессом в порядке получения, а кэши процесса
+    (расписание, ссылки, статусы) относятся к его части пользователей.
+
+    Каждое сообщение хранится в родительском процессе до подтверждения обработки.
+    Если процесс-обработчик завершился, он перезапускается с новой очередью, в которую
+    в прежнем порядке передаются все неподтвержденные сообщения. Сообщение, на котором процесс
+    падал max_attempts раз, пропускается.
+
+    Первые процессы создаются fork до запуска потоков родительского процесса и получают
+    его прогретые кэши. Перезапущенные процессы создаются через forkserver: к этому времени
+    в родительском процессе работают потоки, и fork мог бы скопировать блокировку, захваченную
+    одним из них. Сервер forkserver запускается как новый процесс и не импортирует модули бота,
+    поэтому процесс, созданный из него, импортирует и прогревает все сам.
+
+    Attributes
+    ----------
+    workers: int
+        Количество процессов
+    ring: HashRing
+        Распределение пользователей по процессам
+    queues: list
+        Части очереди (multiprocessing.Queue)
+    pending: list
+        Неподтвержденные сообщения каждого процесса: {номер: сообщение} в порядке отправки
+    slots: list
+        Семафоры, ограничивающие количество неподтвержденных сообщений процесса размером queue_size
+    processes: list
+        Процессы-обработчики
+    """
+    def __init__(self, handler_factory, workers: int = IngressSettings.WORKERS,
+                 queue_size: int = IngressSettings.QUEUE_SIZE, max_attempts: int = IngressSettings.MAX_ATTEMPTS):
+        self.workers = workers
+        self.handler_factory = handler_factory
+        self.max_attempts = max_attempts
+        self.context = multiprocessing.get_context("fork")
+        self.restart_context = multiprocessing.get_context("forkserver")
+        self.restart_context.set_forkserver_preload([])
+        self.ring = HashRing(range(workers))
+        # очереди создаются в контексте forkserver, чтобы их можно было передать перезапущенному процессу
+        self.queues = [self.restart_context.Queue() for _ in range(workers)]
+        self.acks = self.restart_context.Queue()
+        self.pending = [collections.OrderedDict() for _ in range(workers)]
+        self.attempts = [{} for _ in range(workers)]
+        self.slots = [threading.BoundedSemaphore(queue_size) for _ in range(workers)]
+        self.processes = [None] * workers
+        self.seq = itertools.count()
+        self.closing = False
+        self._lock = threading.Lock()
+        QUEUE_DEPTH.set_function("ingress", function=self.qsize)
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            self.start_worker(index, self.context)
+        threading.Thread(target=self.ack_reader, name="WorkerPool-acks", daemon=True).start()
+        threading.Thread(target=self.supervise, name="WorkerPool-supervisor", daemon=True).start()
+
+    def start_worker(self, index: int, context) -> None:
+        process = context.Process(
+            target=worker,
+            args=(index, self.handler_factory, self.queues[index], self.acks),
+            name=f"worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def partition(self, peer_id: int) -> int:
+        return self.ring.get(peer_id)
+
+    def put(self, message: Message) -> None:
+        """
+        Передача сообщения процессу, обрабатывающему этого пользователя
+
+        Если у процесса queue_size неподтвержденных сообщений, функция ждет освобождения места
+
+        Parameters
+        ----------
+        message: Message
+            Входящее сообщение
+
+        Returns
+        -------
+        None
+        """
+        index = self.partition(message.peer_id)
+        self.slots[index].acquire()
+        with self._lock:
+            seq = next(self.seq)
+            self.pending[index][seq] = message
+            self.queues[index].put((seq, message))
+
+    def ack_reader(self) -> None:
+        for index, seq in iter(self.acks.get, None):
+            with self._lock:
+                if self.pending[index].pop(seq, None) is None:
+                    continue  # повторно обработанное после перезапуска сообщение
+                self.attempts[index].pop(seq, None)
+            self.slots[index].release()
+
+    def supervise(self) -> None:
+        while not self.closing:
+            sentinels = {process.sentinel: index for index, process in enumerate(self.processes)}
+            for sentinel in multiprocessing.connection.wait(list(sentinels), timeout=1):
+                if self.closing:
+                    return
+                self.restart(sentinels[sentinel])
+
+    def restart(self, index: int) -> None:
+        """
+        Перезапуск завершившегося процесса с передачей ему неподтвержденных сообщений
+
+        Parameters
+        ----------
+        index: int
+            Номер процесса
+
+        Returns
+        -------
+        None
+        """
+        process = self.processes[index]
+        process.join()
+        logger.error("WorkerPool: worker %s exited with code %s, restarting", index, process.exitcode)
+        with self._lock:
+            pending, attempts = self.pending[index], self.attempts[index]
+            if pending:
+                # первое неподтвержденное сообщение обрабатывалось во время падения
+                seq = next(iter(pending))
+                attempts[seq] = attempts.get(seq, 0) + 1
+                if attempts[seq] >= self.max_attempts:
+                    message = pending.pop(seq)
+                    attempts.pop(seq)
+                    self.slots[index].release()
+                    logger.error("WorkerPool: message %s from %s dropped after %s attempts",
+                                 message.message_id, message.peer_id, self.max_attempts)
+            # в старой очереди могли остаться сообщения, поэтому создается новая
+            self.queues[index] = self.restart_context.Queue()
+            for seq, message in pending.items():
+                self.queues[index].put((seq, message))
+            self.start_worker(index, self.restart_context)
+        time.sleep(IngressSettings.RESTART_DELAY)
+
+    def qsize(self) -> int:
+        with self._lock:
+            return sum(len(pending) for pending in self.pending)
+
+    def close(self) -> None:
+        """
+        Завершение процессов после обработки всех сообщений из очереди
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self.closing = True
+            for events in self.queues:
+                events.put(None)
+        for process in self.processes:
+            process.join()
+        self.acks.put(None)
+
+
+def serve(source: IEventSource, pool: WorkerPool) -> None:
+    """
+    Передача событий из источника процессам-обработчикам
+
+    Parameters
+    ----------
+    source: IEventSource
+        Источник событий
+    pool: WorkerPool
+        Процессы-обработчики (должны быть запущены до создания потоков источника)
+
+    Returns
+    -------
+    None
+    """
+    try:
+        for message in source.listen():
+            pool.put(message)
+    finally:
+        pool.close()
@@ -1,10 +1,9 @@
 import json
 import enum
 import ast
+import functools
 from abc import ABC, abstractmethod
 
-import telebot as tb
-
 
 
 class IKeyboard(ABC):
@@ -125,6 +124,8 @@ class TgKeyboard(IKeyboard):
         Если True, то клавиатура будет подана внутри сообщения
     """
     def __init__(self, labels=None, inline=False):
+        # telebot импортируется при первом создании клавиатуры, чтобы не загружать его при работе только с vk
+        import telebot as tb
         if inline:
             self.keyboard = tb.types.InlineKeyboardMarkup()
         else:
@@ -149,6 +150,7 @@ class TgKeyboard(IKeyboard):
         None
         """
         if inline:
+            import telebot as tb
             for i in labels:
                 if type(i) == str:
                     self.keyboard.add(tb.types.InlineKeyboardButton(text=i, callback_data=i))
@@ -180,10 +182,13 @@ class TgKeyboard(IKeyboard):
             json.dump(kb, keyboard_file)
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def json_to_keyboard(name: str) -> "TgKeyboard.keyboard":
         """
         Конвертация json файла в объект, который можно подать в качестве аргумента в методе отправки сообщения
 
+        Результат кэшируется: файлы клавиатур не меняются во время работы бота
+
         Parameters
         ----------
         name: str
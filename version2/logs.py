@@ -0,0 +1,195 @@
+"""
+Настройка логирования
+
+Записи логов кладутся в очередь обработчиком QueueHandler, а форматирование и запись в файлы
+выполняет фоновый поток QueueListener, поэтому вызов logger.debug в обработчике сообщения
+не ждет диска. Отладочные записи можно прореживать (SamplingFilter), файлы ограничены
+по размеру (RotatingFileHandler). Все параметры задаются переменными окружения (см. settings.LogSettings).
+
+Файлы с заданными именами пишет только главный процесс (первый настроивший логирование).
+Процессы-обработчики и процессы построения графиков пишут в свои файлы с номером процесса
+в имени (debug.1234.log), поэтому несколько процессов не ротируют один и тот же файл.
+"""
+import atexit
+import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+import random
+
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+OWNER_VARIABLE = "BOT_LOG_OWNER_PID"  # процесс, который пишет в файлы без номера процесса
+
+
+def parse_rates(text: str) -> dict:
+    """
+    Разбор настройки прореживания вида "get_answer_text=0.01,settings=0.1"
+
+    Parameters
+    ----------
+    text: str
+        Пары ключ=доля через запятую, ключ - название функции или логгера
+
+    Returns
+    -------
+    dict
+        Доля сохраняемых записей для каждого ключа
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        key, _, rate = item.partition("=")
+        rates[key.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Фильтр, сохраняющий только часть записей уровня не выше level
+
+    Доля сохраняемых записей задается для функции (record.funcName) или логгера (record.name),
+    для остальных записей используется default_rate. Записи выше level (предупреждения, ошибки)
+    не прореживаются.
+
+    Attributes
+    ----------
+    rates: dict
+        Доля сохраняемых записей по названию функции или логгера
+    default_rate: float
+        Доля для записей без отдельной настройки
+    level: int
+        Максимальный уровень прореживаемых записей
+    """
+    def __init__(self, rates: dict = None, default_rate: float = 1.0, level: int = logging.DEBUG):
+        super().__init__()
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self.level = level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.level:
+            return True
+        rate = self.rates.get(record.funcName, self.rates.get(record.name, self.default_rate))
+        return rate >= 1 or random.random() < rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не форматирует запись в вызывающем потоке и не ждет при переполнении очереди
+
+    Стандартный QueueHandler.prepare подставляет аргументы в сообщение до постановки в очередь,
+    здесь это делает поток записи. Если очередь заполнена, запись отбрасывается и учитывается в dropped.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def process_filename(filename: str, pid: int) -> str:
+    """
+    Имя файла лога процесса: debug.log -> debug.1234.log
+
+    Parameters
+    ----------
+    filename: str
+        Имя файла главного процесса
+    pid: int
+        Номер процесса
+
+    Returns
+    -------
+    str
+        Имя файла с номером процесса
+    """
+    root, extension = os.path.splitext(filename)
+    return f"{root}.{pid}{extension}"
+
+
+def make_handlers(settings, pid: int = None) -> list:
+    """
+    Создание обработчиков записи в файлы
+
+    Parameters
+    ----------
+    settings: LogSettings
+        Настройки логирования
+    pid: int, default None
+        Номер процесса для имени файла, None - файлы главного процесса
+
+    Returns
+    -------
+    list
+        Обработчики RotatingFileHandler
+    """
+    formatter = logging.Formatter(FORMAT)
+    handlers = []
+    for filename, level in ((settings.FILENAME, logging.NOTSET), (settings.ERRORS_FILENAME, logging.WARNING)):
+        if not filename:
+            continue
+        handler = logging.handlers.RotatingFileHandler(
+            filename if pid is None else process_filename(filename, pid),
+            maxBytes=settings.MAX_BYTES, backupCount=settings.BACKUP_COUNT, encoding="utf-8")
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+        handlers.append(handler)
+    return handlers
+
+
+def setup_logging(settings) -> logging.handlers.QueueListener:
+    """
+    Настройка корневого логгера: очередь, фоновая запись в файлы с ротацией, прореживание
+
+    Parameters
+    ----------
+    settings: LogSettings
+        Настройки логирования
+
+    Returns
+    -------
+    logging.handlers.QueueListener
+        Поток записи логов (останавливается при завершении программы)
+    """
+    queue_handler = DeferredQueueHandler(queue.Queue(settings.QUEUE_SIZE))
+    queue_handler.addFilter(SamplingFilter(parse_rates(settings.SAMPLE), settings.SAMPLE_DEFAULT))
+    listeners = []  # поток записи текущего процесса
+
+    def start(pid: int = None) -> logging.handlers.QueueListener:
+        # после fork поток записи родительского процесса не существует, а его очередь могла остаться
+        # заблокированной другим потоком, поэтому процесс создает свои очередь, файлы и поток записи
+        log_queue = queue.Queue(settings.QUEUE_SIZE)
+        listener = logging.handlers.QueueListener(log_queue, *make_handlers(settings, pid),
+                                                  respect_handler_level=True)
+        queue_handler.queue = log_queue
+        listeners[:] = [listener]
+        listener.start()
+        return listener
+
+    def stop():
+        if listeners:
+            listeners.pop().stop()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LEVEL)  # при уровне INFO вызовы logger.debug завершаются до создания записи
+
+    # процесс, созданный forkserver или spawn, настраивает логирование заново и узнает главный процесс по окружению
+    owner = os.environ.setdefault(OWNER_VARIABLE, str(os.getpid()))
+    listener = start(None if owner == str(os.getpid()) else os.getpid())
+    atexit.register(stop)
+    # процессы multiprocessing завершаются без atexit, но вызывают финализаторы
+    multiprocessing.util.Finalize(None, stop, exitpriority=0)
+    os.register_at_fork(after_in_child=lambda: start(os.getpid()))
+    # после fork процесс multiprocessing очищает финализаторы родительского процесса
+    multiprocessing.util.register_after_fork(
+        queue_handler, lambda handler: multiprocessing.util.Finalize(None, stop, exitpriority=0))
+    return listener
@@ -1,13 +1,24 @@
 import signal
 import sys
+import threading
 
-from bot import VkBot
-from settings import VKTableName
+import vk_api
+
+from bot import VkBot, TgBot
+from ingress import WorkerPool, UserLongPollSource, BotsLongPollSource, CallbackSource, FakeEventSource, FakeHandler
+from ingress import serve, parse_group_id
+from settings import VKTableName, VKSettings, VKSenderSettings, IngressSettings, TGTableName, TGSettings, PlatformVK
+from settings import MetricsSettings
 from answer_config import Config
+from metrics import start_http_server, READY
+from partitions import MessagePartitions
+from warmup import Warmup, mark_ready, remove_ready_file
 
 
 def before_interrupt():
     Config.user(VKTableName).reset_all_statuses()
+    if TGSettings.TOKEN:
+        Config.user(TGTableName).reset_all_statuses()
     print("User statuses reset to default")
 
 
@@ -16,6 +27,65 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
-signal.signal(signal.SIGINT, signal_handler)
+def make_bot(index: int) -> VkBot:
+    READY.clear()  # процесс, созданный fork, копирует состояние уже готового родительского процесса
+    if MetricsSettings.PORT:
+        start_http_server(MetricsSettings.PORT + 1 + index)  # у каждого процесса свои метрики
+    # ограничение частоты запросов общее для сообщества, поэтому делится между процессами
+    bot = VkBot(Config, rate=VKSenderSettings.RATE / IngressSettings.WORKERS)
+    # файлы и индексы первых процессов прогреты родительским процессом до fork и берутся из кэшей,
+    # перезапущенный процесс (forkserver) загружает их заново
+    Warmup(Config, PlatformVK).run()
+    if index == 0:
+        bot.resume_broadcasts()
+    mark_ready(ready_file="")
+    return bot
+
+
+def start_maintenance() -> None:
+    # секции таблиц сообщений обслуживает только главный процесс
+    MessagePartitions(VKTableName).start_maintenance()
+    if TGSettings.TOKEN:
+        MessagePartitions(TGTableName).start_maintenance()
+
+
+def make_source():
+    if IngressSettings.MODE == "fake":
+        return FakeEventSource(count=None, rate=100)
+    if IngressSettings.MODE == "callback":
+        return CallbackSource(
+            host=IngressSettings.CALLBACK_HOST,
+            port=IngressSettings.CALLBACK_PORT,
+            confirmation=IngressSettings.CALLBACK_CONFIRMATION,
+            secret=IngressSettings.CALLBACK_SECRET
+        )
+    vk = vk_api.VkApi(token=VKSettings.TOKEN)
+    if IngressSettings.MODE == "bots_longpoll":
+        return BotsLongPollSource(vk, parse_group_id(IngressSettings.GROUP_ID))
+    return UserLongPollSource(vk)
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, signal_handler)
+    remove_ready_file()
 
-VkBot(Config).start()
+    if IngressSettings.MODE == "user_longpoll" and IngressSettings.WORKERS == 1:
+        start_http_server()
+        start_maintenance()
+        if TGSettings.TOKEN:
+            # telegram бот работает в том же процессе и использует общие соединения с базой данных и кэши
+            threading.Thread(target=TgBot(Config).start, name="TgBot", daemon=True).start()
+        VkBot(Config).start()
+    else:
+        pool = WorkerPool(FakeHandler if IngressSettings.MODE == "fake" else make_bot)
+        if IngressSettings.MODE != "fake":
+            Warmup(Config, PlatformVK, database=False, before_fork=True).run()
+        pool.start()  # процессы запускаются до создания потоков и соединений источника
+        start_http_server()
+        if IngressSettings.MODE != "fake":
+            start_maintenance()
+        if TGSettings.TOKEN and IngressSettings.MODE != "fake":
+            threading.Thread(target=TgBot(Config).start, name="TgBot", daemon=True).start()
+        source = make_source()
+        mark_ready()
+        serve(source, pool)
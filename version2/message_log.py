@@ -0,0 +1,168 @@
+"""
+Прием входящих сообщений без повторов и пакетная запись журнала сообщений
+
+Longpoll после переподключения и повторная доставка событий могут передать сообщение еще раз.
+RecentMessages помнит id последних сообщений процесса и отбрасывает повтор до любой работы
+с базой данных и API. Журнал сообщений пишется не запросом на каждое сообщение, а фоновым потоком
+пачками (MessageLogWriter), повторы, не замеченные в памяти, пропускает сам запрос (см. SQLMessages.log_messages).
+"""
+import datetime
+import multiprocessing.util
+import os
+import threading
+
+from cache import MemoryCache
+from messages import SQLMessages
+from metrics import Counter
+from settings import MessageLogSettings, logger
+
+
+DUPLICATE_MESSAGES = Counter("bot_duplicate_messages_total", "Incoming messages dropped as already received",
+                             ("platform",))
+
+
+class RecentMessages:
+    """Id последних полученных сообщений
+
+    Attributes
+    ----------
+    platform: str
+        Название платформы в метриках
+    recent: MemoryCache
+        (peer_id, message_id) последних max_size сообщений, давно полученные вытесняются (LRU)
+    """
+    def __init__(self, platform: str, max_size: int = MessageLogSettings.RECENT_IDS):
+        self.platform = platform
+        self.recent = MemoryCache(max_size=max_size)
+
+    def is_duplicate(self, peer_id: int, message_id: int) -> bool:
+        """
+        Проверка и запоминание сообщения
+
+        Returns
+        -------
+        bool
+            True если сообщение уже было получено и его нужно отбросить
+        """
+        if self.recent.add((peer_id, message_id)):
+            return False
+        DUPLICATE_MESSAGES.inc(self.platform)
+        logger.info("is_duplicate(): %s message %s from %s dropped", self.platform, message_id, peer_id)
+        return True
+
+
+class MessageLogWriter:
+    """Пакетная запись журнала сообщений
+
+    Для каждой таблицы в процессе используется один объект (см. get). Сообщения пишутся раз
+    в flush_interval секунд или сразу, когда накопилось batch_size сообщений
+
+    Attributes
+    ----------
+    TableName: VKTableName или TGTableName
+        Названия таблиц платформы
+    batch_size: int
+        Количество сообщений, после которого запись начинается без ожидания
+    flush_interval: float
+        Период записи в секундах
+    max_pending: int
+        Сколько сообщений хранится, пока база данных недоступна, более старые отбрасываются
+    """
+    writers = {}
+    _writers_lock = threading.Lock()
+
+    def __init__(self, table_name, batch_size: int = MessageLogSettings.BATCH_SIZE,
+                 flush_interval: float = MessageLogSettings.FLUSH_INTERVAL,
+                 max_pending: int = MessageLogSettings.MAX_PENDING):
+        self.Messages = SQLMessages
+        self.TableName = table_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.rows = []
+        self.pid = None
+        self.wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, table_name) -> "MessageLogWriter":
+        with cls._writers_lock:
+            if (writer := cls.writers.get(table_name.MESSAGES)) is None:
+                writer = cls.writers[table_name.MESSAGES] = cls(table_name)
+            return writer
+
+    def add(self, message_id: int, user_id: int, text: str) -> None:
+        """
+        Добавление сообщения в очередь записи
+
+        Parameters
+        ----------
+        message_id: int
+            id сообщения
+        user_id: int
+            id пользователя
+        text: str
+            Текст сообщения
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self.rows.append((message_id, user_id, text, datetime.datetime.now(datetime.timezone.utc)))
+            full = len(self.rows) >= self.batch_size
+        self.start()
+        if full:
+            self.wakeup.set()
+
+    def start(self) -> None:
+        # поток записи создается при первом сообщении и заново в каждом процессе после fork
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            if self.pid is not None:  # накопленное родительским процессом записывает родитель
+                self.rows = []
+            self.pid = os.getpid()
+            self.wakeup = threading.Event()
+        threading.Thread(target=self.loop, name=f"message-log-{self.TableName.MESSAGES}", daemon=True).start()
+        multiprocessing.util.Finalize(self, self.try_flush, exitpriority=10)
+
+    def loop(self) -> None:
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.try_flush()
+
+    def try_flush(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.error("MessageLogWriter.flush(): Exception occurred", exc_info=True)
+
+    def flush(self) -> None:
+        """
+        Запись накопленных сообщений пачками по batch_size
+
+        Если запись не удалась, сообщения возвращаются в очередь (не больше max_pending)
+
+        Returns
+        -------
+        None
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self.rows = self.rows, []
+            for start in range(0, len(rows), self.batch_size):
+                try:
+                    self.Messages(self.TableName).log_messages(rows[start:start + self.batch_size])
+                except Exception:
+                    with self._lock:
+                        self.rows[:0] = rows[start:]
+                        if len(self.rows) > self.max_pending:
+                            logger.warning("MessageLogWriter.flush(): %s messages dropped",
+                                           len(self.rows) - self.max_pending)
+                            del self.rows[:len(self.rows) - self.max_pending]
+                    raise
@@ -1,9 +1,11 @@
 import datetime
 from abc import ABCMeta, abstractmethod, ABC
 
-from psycopg2 import sql
+from psycopg2 import sql, Error
 
 from postgres import PostgreSQL as pSQL
+from reserved import ReservedIndex
+from settings import FuzzySettings, MessageLogSettings, logger
 
 
 class IMessages(ABC):
@@ -13,6 +15,10 @@ class IMessages(ABC):
     def log_message(self, message_id: int, user_id: int, text: str) -> None:
         raise NotImplementedError
 
+    @abstractmethod
+    def log_messages(self, rows: list) -> None:
+        raise NotImplementedError
+
     @abstractmethod
     def is_reserved(self, text: str) -> bool:
         raise NotImplementedError
@@ -29,6 +35,10 @@ class IMessages(ABC):
     def get_answer_command(self, text: str) -> str:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_answer_similar(self, text: str) -> str:
+        raise NotImplementedError
+
     @abstractmethod
     def get_days(self) -> [str]:
         raise NotImplementedError
@@ -68,6 +78,8 @@ class SQLMessages(IMessages):
     days: list
         Список дней недели в текстовом формате
     """
+    reserved = None  # индекс зарезервированных фраз, общий для процесса
+
     def __init__(self, table_name=None):
         self.courses = [f"{i + 1} курс" for i in range(4)]
         self.days = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота"]
@@ -78,15 +90,45 @@ class SQLMessages(IMessages):
         self.TableName = table_name
 
     def log_message(self, message_id, user_id, text):
+        self.log_messages([(message_id, user_id, text, datetime.datetime.now(datetime.timezone.utc))])
+
+    def log_messages(self, rows: list) -> None:
+        """
+        Запись пачки сообщений одним запросом
+
+        Повторно доставленные сообщения пропускаются: ON CONFLICT DO NOTHING для таблицы
+        с message_id UNIQUE (несекционированной или старой секции) и проверка, что сообщения
+        с таким message_id от того же пользователя нет за последние DEDUP_WINDOW часов
+        (в секционированной таблице уникальный индекс без datetime невозможен).
+
+        Parameters
+        ----------
+        rows: list
+            Кортежи (message_id, user_id, text, datetime)
+
+        Returns
+        -------
+        None
+        """
+        rows = list({(message_id, user_id): (message_id, user_id, text, time)
+                     for message_id, user_id, text, time in rows}.values())
+        if not rows:
+            return
         query = sql.SQL("""
-        INSERT INTO {table_name}
-        VALUES ({message_id}, {user_id}, {text}, {time});
+        INSERT INTO {table_name} (message_id, user_id, text, datetime)
+        SELECT new.message_id, new.user_id, new.text, new.datetime
+        FROM (VALUES {rows}) AS new (message_id, user_id, text, datetime)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {table_name} logged
+            WHERE logged.user_id = new.user_id AND logged.message_id = new.message_id
+            AND logged.datetime >= new.datetime - {window}
+        )
+        ON CONFLICT DO NOTHING;
         """).format(
             table_name=sql.Identifier(self.TableName.MESSAGES),  # sql.Identifier нужен для предотвращения SQL инъекций
-            message_id=sql.Literal(message_id),
-            user_id=sql.Literal(user_id),
-            text=sql.Literal(text),
-            time=sql.Literal(datetime.datetime.now())
+            rows=sql.SQL(", ").join(
+                sql.SQL("({}, {}::BIGINT, {}, {})").format(*map(sql.Literal, row)) for row in rows),
+            window=sql.Literal(datetime.timedelta(hours=MessageLogSettings.DEDUP_WINDOW))
         )
         self.SQL().execute_query(query)
 
@@ -104,7 +146,11 @@ class SQLMessages(IMessages):
         bool
             True если содержится, False иначе
         """
-        pass
+        if SQLMessages.reserved is None:
+            vocabulary = self.courses + self.days + list(self.var_num_dict) + list(self.reserved_words)
+            vocabulary += [group for groups in self.groups for group in groups]
+            SQLMessages.reserved = ReservedIndex(vocabulary)
+        return SQLMessages.reserved.is_reserved(text)
 
     def get_answer_photo(self, text: str) -> str:
         """
@@ -181,6 +227,50 @@ class SQLMessages(IMessages):
         if res:
             return res
 
+    def get_answer_similar(self, text: str) -> str:
+        """
+        Получение ответа на команду или текстовое сообщение, похожее на text (например, с опечаткой)
+
+        Похожесть - доля общих триграмм (pg_trgm), кандидаты выбираются по GIN индексу оператором %,
+        затем отбрасываются варианты с похожестью меньше FuzzySettings.THRESHOLD.
+        Из нескольких вариантов выбирается самый похожий, при равенстве - команда.
+
+        Parameters
+        ----------
+        text: str
+            Сообщение, на которое не нашлось точного ответа
+
+        Returns
+        -------
+        str
+            Ответ или None
+        """
+        query = sql.SQL("""
+        SELECT answer FROM (
+            SELECT answer, similarity(text, {text}) AS score, 0 AS priority FROM {commands}
+            WHERE text % {text}
+            UNION ALL
+            SELECT answer, similarity(text, {text}) AS score, 1 AS priority FROM {custom_answers}
+            WHERE text % {text}
+        ) AS candidates
+        WHERE score >= {threshold}
+        ORDER BY score DESC, priority
+        LIMIT 1;
+        """).format(
+            commands=sql.Identifier(self.TableName.COMMANDS),
+            custom_answers=sql.Identifier(self.TableName.CUSTOM_ANSWERS),
+            text=sql.Literal(text),
+            threshold=sql.Literal(FuzzySettings.THRESHOLD)
+        )
+        try:
+            res = self.SQL().execute_read_query(query, one=True)
+        except Error:
+            # без расширения pg_trgm (миграция не применена) поиск похожих ответов отключается
+            logger.error("get_answer_similar(): Exception occurred", exc_info=True)
+            return None
+        if res:
+            return res[0]
+
     def add_answer_custom(self, user_id, text, answer):
         query = sql.SQL("""
         INSERT INTO {table_name}
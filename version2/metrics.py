@@ -0,0 +1,350 @@
+"""
+Метрики бота в формате Prometheus
+
+Счетчики, гистограммы задержек и текущие значения хранятся в памяти процесса и отдаются
+http сервером (см. start_http_server) в текстовом формате Prometheus.
+Тот же сервер отвечает на /ready: 200 после прогрева процесса (см. warmup), 503 до него.
+Запись значения - это поиск в словаре и увеличение числа под блокировкой,
+поэтому метрики можно собирать на каждом сообщении и запросе к базе данных.
+
+https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from psycopg2 import sql
+
+from settings import MetricsSettings, AnswerKey, logger
+from tracing import span
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Базовый класс метрики
+
+    Значения хранятся отдельно для каждого набора значений меток
+
+    Attributes
+    ----------
+    name: str
+        Название метрики
+    documentation: str
+        Описание метрики
+    labelnames: tuple
+        Названия меток
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {escape(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, labels, extra)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Монотонно возрастающий счетчик, название по соглашению Prometheus заканчивается на _total"""
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        for labels, value in items:
+            yield "", labels, "", value
+
+
+class Gauge(Metric):
+    """Текущее значение, например размер очереди
+
+    Значение задается методом set или вычисляется при каждом чтении функцией из set_function
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry: "Registry" = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.functions = {}
+
+    def set(self, *labels, value: float) -> None:
+        with self._lock:
+            self.values[labels] = value
+
+    def set_function(self, *labels, function) -> None:
+        with self._lock:
+            self.functions[labels] = function
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items())
+            functions = list(self.functions.items())
+        for labels, function in functions:
+            try:
+                items.append((labels, function()))
+            except Exception:
+                logger.warning("Gauge %s%s: function failed", self.name, labels, exc_info=True)
+        for labels, value in items:
+            yield "", labels, "", value
+
+
+class Histogram(Metric):
+    """Распределение значений (задержек) по корзинам
+
+    Для каждого набора меток хранится список счетчиков корзин, сумма и количество значений
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS,
+                 registry: "Registry" = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if (state := self.values.get(labels)) is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """
+        Измерение времени выполнения блока with
+
+        Parameters
+        ----------
+        labels
+            Значения меток
+
+        Returns
+        -------
+        contextmanager
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - start)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self.values.items()]
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield "_bucket", labels, f'le="{format_value(float(bound))}"', cumulative
+            yield "_sum", labels, "", total
+            yield "_count", labels, "", count
+
+
+class Registry:
+    """Набор метрик процесса"""
+    def __init__(self):
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> None:
+        with self._lock:
+            self.metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self.metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+READY = threading.Event()  # процесс прогрет и обрабатывает сообщения
+
+HANDLER_LATENCY = Histogram("bot_handler_seconds", "Answerer handler latency", ("handler",))
+HANDLER_ANSWERS = Counter("bot_handler_answers_total", "Answers returned by Answerer handler", ("handler",))
+DB_LATENCY = Histogram("bot_db_query_seconds", "PostgreSQL query latency", ("operation", "table"))
+DB_ERRORS = Counter("bot_db_query_errors_total", "Failed PostgreSQL queries", ("operation", "table"))
+EXTERNAL_LATENCY = Histogram("bot_external_call_seconds", "External API call latency", ("service", "method"))
+EXTERNAL_ERRORS = Counter("bot_external_call_errors_total", "Failed external API calls", ("service", "method"))
+THROTTLED_MESSAGES = Counter("bot_throttled_messages_total", "Incoming messages dropped by flood protection",
+                             ("platform",))
+QUEUE_DEPTH = Gauge("bot_queue_depth", "Events or requests waiting in a queue", ("queue",))
+
+
+def measure_handler(func):
+    """
+    Декоратор метода Answerer: время выполнения и количество ответов обработчика, интервал трассы
+
+    Parameters
+    ----------
+    func: callable
+        Обработчик (peer_id, text) -> dict
+
+    Returns
+    -------
+    callable
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with span(name):
+                answer = func(*args, **kwargs)
+        finally:
+            HANDLER_LATENCY.observe(name, value=time.perf_counter() - start)
+        if answer:
+            HANDLER_ANSWERS.inc(name)
+            answer.setdefault(AnswerKey.HANDLER, name)  # для статистики команд
+        return answer
+
+    return wrapper
+
+
+@contextmanager
+def external_call(service: str, method: str):
+    """
+    Измерение времени и ошибок вызова внешнего сервиса (vk, wolframalpha, google drive, php), интервал трассы
+
+    Parameters
+    ----------
+    service: str
+        Название сервиса
+    method: str
+        Вызываемый метод
+
+    Returns
+    -------
+    contextmanager
+    """
+    start = time.perf_counter()
+    try:
+        with span(f"{service}.{method}"):
+            yield
+    except BaseException:
+        EXTERNAL_ERRORS.inc(service, method)
+        raise
+    finally:
+        EXTERNAL_LATENCY.observe(service, method, value=time.perf_counter() - start)
+
+
+def query_labels(query) -> tuple:
+    """
+    Операция и таблица SQL запроса для меток метрик
+
+    Таблица - первый sql.Identifier в запросе, операция - первое слово текста запроса
+
+    Parameters
+    ----------
+    query: sql.Composable или str
+        SQL запрос
+
+    Returns
+    -------
+    tuple
+        (операция, таблица)
+    """
+    operation, table = "", ""
+    for part in getattr(query, "seq", None) or [query]:
+        if not table and isinstance(part, sql.Identifier):
+            table = part.strings[0]
+        elif not operation:
+            text = part.string if isinstance(part, sql.SQL) else part if isinstance(part, str) else ""
+            operation = text.split(None, 1)[0].upper() if text.strip() else ""
+        if operation and table:
+            break
+    return operation or "UNKNOWN", table or "unknown"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/ready":
+            self.send_ready()
+            return
+        if path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        data = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_ready(self):
+        ready = READY.is_set()
+        data = b"ready\n" if ready else b"warming up\n"
+        self.send_response(200 if ready else 503)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int = MetricsSettings.PORT, host: str = MetricsSettings.HOST):
+    """
+    Запуск http сервера с метриками в отдельном потоке
+
+    Parameters
+    ----------
+    port: int
+        Порт, 0 - сервер не запускается
+    host: str
+        Адрес
+
+    Returns
+    -------
+    ThreadingHTTPServer или None
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError:
+        logger.error("start_http_server(): can't listen on %s:%s", host, port, exc_info=True)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("start_http_server(): metrics on http://%s:%s/metrics", host, port)
+    return server
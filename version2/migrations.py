@@ -0,0 +1,307 @@
+"""
+Версионные миграции схемы базы данных
+
+Примененные миграции записываются в таблицу MigrationSettings.TABLE (платформа, версия),
+поэтому повторный запуск выполняет только новые миграции. Каждая миграция сама по себе
+идемпотентна: если она была прервана, при следующем запуске она продолжается с места остановки.
+"""
+from typing import NamedTuple
+
+from psycopg2 import sql
+
+from partitions import MessagePartitions
+from postgres import PostgreSQL
+from settings import MigrationSettings, logger
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    method: str
+
+
+class Migrator:
+    """Применение миграций к таблицам одной платформы
+
+    Attributes
+    ----------
+    platform: str
+        Название платформы в таблице версий (vk, tg)
+    TableName: VKTableName или TGTableName
+        Названия таблиц платформы
+    batch_size: int
+        Количество строк, конвертируемых в одной транзакции
+    """
+    MIGRATIONS = (
+        Migration(1, "create tables", "create_tables"),
+        Migration(2, "datetime TEXT to TIMESTAMPTZ", "convert_datetime"),
+        Migration(3, "indexes for messages and registration queries", "create_indexes"),
+        Migration(4, "monthly partitions for messages", "partition_messages"),
+        Migration(5, "daily usage statistics", "create_stats"),
+        Migration(6, "trigram indexes for similar answers", "create_trigram_indexes"),
+    )
+
+    def __init__(self, platform: str, table_name, batch_size: int = MigrationSettings.BATCH_SIZE):
+        self.platform = platform
+        self.TableName = table_name
+        self.batch_size = batch_size
+        self.SQL = PostgreSQL
+
+    def migrate(self) -> list:
+        """
+        Применение всех еще не примененных миграций по возрастанию версии
+
+        Returns
+        -------
+        list
+            Версии, примененные при этом запуске
+        """
+        self.SQL().execute_query(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table_name}(
+            platform TEXT,
+            version INTEGER,
+            description TEXT,
+            applied TIMESTAMPTZ DEFAULT NOW(),
+            PRIMARY KEY (platform, version)
+        );
+        """).format(table_name=sql.Identifier(MigrationSettings.TABLE)))
+
+        applied = []
+        done = self.applied_versions()
+        for migration in self.MIGRATIONS:
+            if migration.version in done:
+                continue
+            logger.info("migrate(): %s version %s (%s) started", self.platform, migration.version,
+                        migration.description)
+            getattr(self, migration.method)()
+            self.SQL().execute_query(sql.SQL("""
+            INSERT INTO {table_name} (platform, version, description)
+            VALUES ({platform}, {version}, {description})
+            ON CONFLICT DO NOTHING;
+            """).format(
+                table_name=sql.Identifier(MigrationSettings.TABLE),
+                platform=sql.Literal(self.platform),
+                version=sql.Literal(migration.version),
+                description=sql.Literal(migration.description)
+            ))
+            logger.info("migrate(): %s version %s finished", self.platform, migration.version)
+            applied.append(migration.version)
+        return applied
+
+    def applied_versions(self) -> set:
+        query = sql.SQL("SELECT version FROM {table_name} WHERE platform = {platform};").format(
+            table_name=sql.Identifier(MigrationSettings.TABLE),
+            platform=sql.Literal(self.platform)
+        )
+        return {row[0] for row in self.SQL().execute_read_query(query) or []}
+
+    def column_type(self, table: str, column: str):
+        query = sql.SQL("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = {table} AND column_name = {column};
+        """).format(table=sql.Literal(table), column=sql.Literal(column))
+        row = self.SQL().execute_read_query(query, one=True)
+        return row[0] if row else None
+
+    def create_tables(self) -> None:
+        table = self.TableName
+        for definition in (
+            "{users} (user_id BIGINT PRIMARY KEY, name TEXT, surname TEXT, datetime TEXT)",
+            "{reg_info} (user_id BIGINT REFERENCES {users}(user_id) UNIQUE, user_course TEXT, user_group TEXT)",
+            "{user_status} (user_id BIGINT REFERENCES {users}(user_id) UNIQUE, status TEXT, callback TEXT)",
+            "{messages} (message_id INTEGER UNIQUE, user_id BIGINT, text TEXT, datetime TEXT)",
+            "{ban_list} (user_id BIGINT UNIQUE)",
+            "{commands} (text TEXT UNIQUE, answer TEXT)",
+            "{custom_answers} (user_id BIGINT UNIQUE, text TEXT UNIQUE, answer TEXT)",
+            "{photo_links} (text TEXT UNIQUE, photo_link TEXT)",
+            "{photo_attachments} (key TEXT PRIMARY KEY, attachment TEXT)",
+            "{broadcasts} (id SERIAL PRIMARY KEY, author_id BIGINT, course TEXT, user_group TEXT, text TEXT, "
+            "last_user_id BIGINT DEFAULT 0, sent INTEGER DEFAULT 0, status TEXT, created TIMESTAMP)",
+        ):
+            self.SQL().execute_query(sql.SQL("CREATE TABLE IF NOT EXISTS " + definition + ";").format(
+                users=sql.Identifier(table.USERS),
+                reg_info=sql.Identifier(table.REG_INFO),
+                user_status=sql.Identifier(table.USER_STATUS),
+                messages=sql.Identifier(table.MESSAGES),
+                ban_list=sql.Identifier(table.BAN_LIST),
+                commands=sql.Identifier(table.COMMANDS),
+                custom_answers=sql.Identifier(table.CUSTOM_ANSWERS),
+                photo_links=sql.Identifier(table.PHOTO_LINKS),
+                photo_attachments=sql.Identifier(table.PHOTO_ATTACHMENTS),
+                broadcasts=sql.Identifier(table.BROADCASTS)
+            ))
+
+    def convert_datetime(self) -> None:
+        self.convert_column(self.TableName.USERS, "user_id")
+        self.convert_column(self.TableName.MESSAGES, "message_id")
+        if self.column_type(self.TableName.BROADCASTS, "created") == "timestamp without time zone":
+            self.SQL().execute_query(sql.SQL("""
+            ALTER TABLE {table_name} ALTER COLUMN created TYPE TIMESTAMPTZ;
+            """).format(table_name=sql.Identifier(self.TableName.BROADCASTS)))
+
+    def timezone_query(self) -> sql.Composable:
+        # старые значения записаны без часового пояса, SET LOCAL действует до конца транзакции
+        if not MigrationSettings.LEGACY_TIMEZONE:
+            return sql.SQL("")
+        return sql.SQL("SET LOCAL TIME ZONE {timezone};").format(
+            timezone=sql.Literal(MigrationSettings.LEGACY_TIMEZONE))
+
+    def convert_column(self, table: str, key: str) -> None:
+        """
+        Конвертация столбца datetime из TEXT в TIMESTAMPTZ без долгой блокировки таблицы
+
+        Значения копируются в новый столбец datetime_tz пачками по batch_size строк в порядке key,
+        каждая пачка - отдельная транзакция, поэтому бот продолжает писать в таблицу.
+        Прерванная конвертация продолжается с наибольшего уже сконвертированного key.
+        В конце под блокировкой записи досчитываются строки, добавленные во время конвертации,
+        старый столбец удаляется, а новый переименовывается в datetime.
+
+        Parameters
+        ----------
+        table: str
+            Название таблицы
+        key: str
+            Уникальный столбец с индексом, по которому выбираются пачки
+
+        Returns
+        -------
+        None
+        """
+        if self.column_type(table, "datetime") != "text":
+            return
+        identifiers = {"table_name": sql.Identifier(table), "key": sql.Identifier(key)}
+        self.SQL().execute_query(sql.SQL("""
+        ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS datetime_tz TIMESTAMPTZ;
+        """).format(**identifiers))
+
+        after = self.SQL().execute_read_query(sql.SQL("""
+        SELECT MAX({key}) FROM {table_name} WHERE datetime_tz IS NOT NULL;
+        """).format(**identifiers), one=True)[0]
+        while True:
+            last = self.SQL().execute_read_query(sql.SQL("""
+            SELECT MAX({key}) FROM (
+                SELECT {key} FROM {table_name}
+                WHERE {after}::BIGINT IS NULL OR {key} > {after}
+                ORDER BY {key}
+                LIMIT {batch_size}
+            ) AS batch;
+            """).format(after=sql.Literal(after), batch_size=sql.Literal(self.batch_size), **identifiers),
+                one=True)[0]
+            if last is None:
+                break
+            self.SQL().execute_query(sql.SQL("""
+            {timezone}
+            UPDATE {table_name} SET datetime_tz = NULLIF(datetime, '')::TIMESTAMPTZ
+            WHERE ({after}::BIGINT IS NULL OR {key} > {after}) AND {key} <= {last} AND datetime_tz IS NULL;
+            """).format(timezone=self.timezone_query(), after=sql.Literal(after), last=sql.Literal(last),
+                        **identifiers))
+            after = last
+            logger.info("convert_column(): %s converted up to %s = %s", table, key, last)
+
+        self.SQL().execute_query(sql.SQL("""
+        {timezone}
+        LOCK TABLE {table_name} IN EXCLUSIVE MODE;
+        UPDATE {table_name} SET datetime_tz = NULLIF(datetime, '')::TIMESTAMPTZ
+        WHERE datetime_tz IS NULL AND datetime IS NOT NULL;
+        ALTER TABLE {table_name} DROP COLUMN datetime;
+        ALTER TABLE {table_name} RENAME COLUMN datetime_tz TO datetime;
+        ALTER TABLE {table_name} ALTER COLUMN datetime SET DEFAULT NOW();
+        """).format(timezone=self.timezone_query(), **identifiers))
+        logger.info("convert_column(): %s.datetime is TIMESTAMPTZ", table)
+
+    def create_index(self, name: str, table: str, definition: str) -> None:
+        """
+        Создание индекса без блокировки записи в таблицу (CREATE INDEX CONCURRENTLY)
+
+        Если предыдущее создание индекса было прервано, PostgreSQL оставляет нерабочий (INVALID) индекс,
+        который IF NOT EXISTS считает существующим, поэтому такой индекс сначала удаляется.
+
+        Parameters
+        ----------
+        name: str
+            Название индекса
+        table: str
+            Название таблицы
+        definition: str
+            Метод и столбцы индекса, например "(user_id, datetime)" или "USING BRIN (datetime)"
+
+        Returns
+        -------
+        None
+        """
+        row = self.SQL().execute_read_query(sql.SQL("""
+        SELECT pg_index.indisvalid FROM pg_index
+        JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+        WHERE pg_class.relname = {name}
+        AND pg_class.relnamespace = (SELECT oid FROM pg_namespace WHERE nspname = current_schema());
+        """).format(name=sql.Literal(name)), one=True)
+        if row and not row[0]:
+            logger.warning("create_index(): dropping invalid index %s", name)
+            self.SQL().execute_query(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {name};").format(
+                name=sql.Identifier(name)), autocommit=True)
+        self.SQL().execute_query(sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table_name} "
+                                         + definition + ";").format(
+            name=sql.Identifier(name),
+            table_name=sql.Identifier(table)
+        ), autocommit=True)
+
+    def create_indexes(self) -> None:
+        messages, reg_info = self.TableName.MESSAGES, self.TableName.REG_INFO
+        # история сообщений пользователя и выборки по периоду для статистики
+        self.create_index(f"{messages}_user_id_datetime_idx", messages, "(user_id, datetime)")
+        # таблица сообщений пополняется по времени, BRIN индекс по datetime занимает несколько страниц
+        self.create_index(f"{messages}_datetime_brin_idx", messages, "USING BRIN (datetime)")
+        # выбор получателей рассылки по курсу и группе
+        self.create_index(f"{reg_info}_course_group_idx", reg_info, "(user_course, user_group, user_id)")
+
+    def partition_messages(self) -> None:
+        partitions = MessagePartitions(self.TableName)
+        partitions.partition()
+        partitions.ensure_partitions()
+
+    def create_stats(self) -> None:
+        """
+        Таблицы статистики по дням и заполнение их по истории сообщений
+
+        Статистика команд по истории не восстанавливается: обработчик, ответивший на сообщение, не сохранялся
+        """
+        table = self.TableName
+        identifiers = {
+            "daily": sql.Identifier(table.STATS_DAILY),
+            "daily_users": sql.Identifier(table.STATS_DAILY_USERS),
+            "commands": sql.Identifier(table.STATS_COMMANDS),
+            "messages": sql.Identifier(table.MESSAGES)
+        }
+        self.SQL().execute_query(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {daily} (
+            day DATE PRIMARY KEY,
+            messages BIGINT NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS {daily_users} (
+            day DATE,
+            user_id BIGINT,
+            PRIMARY KEY (day, user_id)
+        );
+        CREATE TABLE IF NOT EXISTS {commands} (
+            day DATE,
+            command TEXT,
+            count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, command)
+        );
+        """).format(**identifiers))
+        self.SQL().execute_query(sql.SQL("""
+        INSERT INTO {daily_users} (day, user_id)
+        SELECT DISTINCT (datetime AT TIME ZONE 'UTC')::DATE, user_id FROM {messages}
+        ON CONFLICT DO NOTHING;
+        INSERT INTO {daily} (day, messages, active_users)
+        SELECT (datetime AT TIME ZONE 'UTC')::DATE, COUNT(*), COUNT(DISTINCT user_id) FROM {messages}
+        GROUP BY 1
+        ON CONFLICT DO NOTHING;
+        """).format(**identifiers))
+
+    def create_trigram_indexes(self) -> None:
+        # для кириллицы база данных должна использовать UTF8 и локаль, в которой русские буквы - буквы
+        self.SQL().execute_query(sql.SQL("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+        for table in (self.TableName.COMMANDS, self.TableName.CUSTOM_ANSWERS):
+            self.create_index(f"{table}_text_trgm_idx", table, "USING GIN (text gin_trgm_ops)")
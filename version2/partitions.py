@@ -0,0 +1,286 @@
+"""
+Помесячное секционирование журнала сообщений
+
+Таблица MESSAGES хранится как секционированная по datetime (PARTITION BY RANGE) таблица
+с секцией на каждый месяц, поэтому вставка и VACUUM работают с небольшой текущей секцией,
+а старая история удаляется целыми секциями без DELETE. Фоновое обслуживание заранее создает
+секции на следующие месяцы и удаляет (или выгружает в сжатый CSV и удаляет) секции старше срока хранения.
+"""
+import datetime
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+
+from psycopg2 import sql
+
+from postgres import PostgreSQL
+from settings import MessageLogSettings, logger
+
+
+BOUND_PATTERN = re.compile(r"FOR VALUES FROM \((.+)\) TO \((.+)\)")
+
+
+def month_start(moment: datetime.datetime, months: int = 0) -> datetime.datetime:
+    """
+    Начало месяца, отстоящего от moment на months месяцев
+
+    Returns
+    -------
+    datetime.datetime
+        Полночь первого числа месяца (UTC)
+    """
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime.datetime(index // 12, index % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class MessagePartitions:
+    """Секции таблицы сообщений одной платформы
+
+    Attributes
+    ----------
+    TableName: VKTableName или TGTableName
+        Названия таблиц платформы
+    premake_months: int
+        На сколько месяцев вперед создаются секции
+    retention_months: int
+        Сколько полных месяцев хранятся сообщения, 0 - хранятся всегда
+    retention_mode: str
+        archive - секция выгружается в ARCHIVE_DIRECTORY перед удалением, drop - просто удаляется
+    """
+    def __init__(self, table_name):
+        self.SQL = PostgreSQL
+        self.TableName = table_name
+        self.table = table_name.MESSAGES
+        self.premake_months = MessageLogSettings.PREMAKE_MONTHS
+        self.retention_months = MessageLogSettings.RETENTION_MONTHS
+        self.retention_mode = MessageLogSettings.RETENTION_MODE
+        self.archive_directory = MessageLogSettings.ARCHIVE_DIRECTORY
+
+    def partition_name(self, month: datetime.datetime) -> str:
+        return f"{self.table}_{month:%Y_%m}"
+
+    def relkind(self, table: str):
+        query = sql.SQL("""
+        SELECT relkind FROM pg_class
+        WHERE relname = {table} AND relnamespace = (SELECT oid FROM pg_namespace WHERE nspname = current_schema());
+        """).format(table=sql.Literal(table))
+        row = self.SQL().execute_read_query(query, one=True)
+        return row[0] if row else None
+
+    def is_partitioned(self) -> bool:
+        return self.relkind(self.table) == "p"
+
+    def list_partitions(self) -> list:
+        """
+        Секции таблицы сообщений
+
+        Returns
+        -------
+        list
+            Кортежи (название, нижняя граница, верхняя граница), границы - текст выражения
+            PostgreSQL ('2024-01-01 00:00:00+00' или MINVALUE), у секции DEFAULT границы None
+        """
+        query = sql.SQL("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = {table}
+        AND parent.relnamespace = (SELECT oid FROM pg_namespace WHERE nspname = current_schema())
+        ORDER BY child.relname;
+        """).format(table=sql.Literal(self.table))
+        partitions = []
+        for name, bound in self.SQL().execute_read_query(query) or []:
+            if match := BOUND_PATTERN.search(bound):
+                partitions.append((name, match.group(1), match.group(2)))
+            else:
+                partitions.append((name, None, None))
+        return partitions
+
+    def partition(self) -> None:
+        """
+        Перевод существующей таблицы сообщений в секционированную
+
+        Сначала в одной короткой транзакции старая таблица переименовывается в {MESSAGES}_legacy,
+        создается секционированная таблица с секцией текущего месяца (от момента переключения)
+        и секцией DEFAULT, после чего бот пишет уже в новую таблицу. Затем старая таблица
+        присоединяется как секция (MINVALUE, момент переключения): ограничение CHECK проверяется
+        без блокировки записи, поэтому ATTACH PARTITION не сканирует таблицу.
+        Если перевод был прерван, повторный вызов продолжает его.
+
+        Returns
+        -------
+        None
+        """
+        legacy = f"{self.table}_legacy"
+        if not self.is_partitioned():
+            now = datetime.datetime.now(datetime.timezone.utc)
+            indexes = (f"{self.table}_user_id_datetime_idx", f"{self.table}_datetime_brin_idx")
+            self.SQL().execute_query(sql.SQL("""
+            LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE;
+            ALTER TABLE {table} RENAME TO {legacy};
+            ALTER INDEX IF EXISTS {user_index} RENAME TO {legacy_user_index};
+            ALTER INDEX IF EXISTS {brin_index} RENAME TO {legacy_brin_index};
+            CREATE TABLE {table} (
+                message_id INTEGER,
+                user_id BIGINT,
+                text TEXT,
+                datetime TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            ) PARTITION BY RANGE (datetime);
+            CREATE INDEX {user_index} ON {table} (user_id, datetime);
+            CREATE INDEX {brin_index} ON {table} USING BRIN (datetime);
+            CREATE TABLE {current} PARTITION OF {table} FOR VALUES FROM ({now}) TO ({next_month});
+            CREATE TABLE {default} PARTITION OF {table} DEFAULT;
+            """).format(
+                table=sql.Identifier(self.table),
+                legacy=sql.Identifier(legacy),
+                user_index=sql.Identifier(indexes[0]),
+                legacy_user_index=sql.Identifier(f"{legacy}_user_id_datetime_idx"),
+                brin_index=sql.Identifier(indexes[1]),
+                legacy_brin_index=sql.Identifier(f"{legacy}_datetime_brin_idx"),
+                current=sql.Identifier(self.partition_name(now)),
+                now=sql.Literal(now),
+                next_month=sql.Literal(month_start(now, 1)),
+                default=sql.Identifier(f"{self.table}_default")
+            ))
+            logger.info("partition(): %s is partitioned, attaching %s", self.table, legacy)
+
+        partitions = self.list_partitions()
+        if self.relkind(legacy) is None or any(name == legacy for name, _, _ in partitions):
+            return
+        cutover = min((lower for _, lower, _ in partitions if lower and lower.startswith("'")),
+                      key=lambda bound: bound.strip("'"))
+        identifiers = {
+            "table": sql.Identifier(self.table),
+            "legacy": sql.Identifier(legacy),
+            "check": sql.Identifier(f"{legacy}_datetime_check"),
+            "cutover": sql.SQL(cutover)
+        }
+        # строки из старой таблицы, записанные процессами бота с часами, спешащими относительно момента переключения
+        self.SQL().execute_query(sql.SQL("""
+        INSERT INTO {table} (message_id, user_id, text, datetime)
+        SELECT message_id, user_id, text, datetime FROM {legacy} WHERE datetime >= {cutover};
+        DELETE FROM {legacy} WHERE datetime >= {cutover};
+        UPDATE {legacy} SET datetime = 'epoch' WHERE datetime IS NULL;
+        """).format(**identifiers))
+        if not self.SQL().execute_read_query(sql.SQL("SELECT EXISTS (SELECT 1 FROM {legacy});").format(**identifiers),
+                                             one=True)[0]:
+            self.SQL().execute_query(sql.SQL("DROP TABLE {legacy};").format(**identifiers))
+            return
+        self.SQL().execute_query(sql.SQL("""
+        ALTER TABLE {legacy} DROP CONSTRAINT IF EXISTS {check};
+        ALTER TABLE {legacy} ADD CONSTRAINT {check} CHECK (datetime IS NOT NULL AND datetime < {cutover}) NOT VALID;
+        """).format(**identifiers))
+        self.SQL().execute_query(sql.SQL("ALTER TABLE {legacy} VALIDATE CONSTRAINT {check};").format(**identifiers))
+        self.SQL().execute_query(sql.SQL("""
+        ALTER TABLE {legacy} ALTER COLUMN datetime SET NOT NULL;
+        ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ({cutover});
+        """).format(**identifiers))
+        logger.info("partition(): %s attached to %s", legacy, self.table)
+
+    def ensure_partitions(self) -> None:
+        """
+        Создание секций текущего и следующих premake_months месяцев
+
+        Returns
+        -------
+        None
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        existing = {name for name, _, _ in self.list_partitions()}
+        for months in range(self.premake_months + 1):
+            name = self.partition_name(month_start(now, months))
+            if name in existing:
+                continue
+            self.SQL().execute_query(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} FOR VALUES FROM ({start}) TO ({end});
+            """).format(
+                partition=sql.Identifier(name),
+                table=sql.Identifier(self.table),
+                start=sql.Literal(month_start(now, months)),
+                end=sql.Literal(month_start(now, months + 1))
+            ))
+            logger.info("ensure_partitions(): %s created", name)
+
+    def archive(self, partition: str) -> str:
+        """
+        Выгрузка секции в сжатый CSV файл
+
+        Файл сначала записывается во временный, поэтому неполный архив не остается под итоговым названием
+
+        Parameters
+        ----------
+        partition: str
+            Название секции
+
+        Returns
+        -------
+        str
+            Путь к архиву
+        """
+        os.makedirs(self.archive_directory, exist_ok=True)
+        filename = os.path.join(self.archive_directory, f"{partition}.csv.gz")
+        with gzip.open(filename + ".tmp", "wb") as file:
+            self.SQL().copy_to(sql.SQL("COPY {partition} TO STDOUT WITH (FORMAT CSV, HEADER)").format(
+                partition=sql.Identifier(partition)), file)
+        shutil.move(filename + ".tmp", filename)
+        return filename
+
+    def apply_retention(self) -> list:
+        """
+        Удаление секций, все сообщения которых старше retention_months полных месяцев
+
+        Returns
+        -------
+        list
+            Названия удаленных секций
+        """
+        if not self.retention_months:
+            return []
+        cutoff = month_start(datetime.datetime.now(datetime.timezone.utc), -self.retention_months)
+        dropped = []
+        for name, _, upper in self.list_partitions():
+            if upper is None or upper == "MAXVALUE":
+                continue
+            expired = self.SQL().execute_read_query(sql.SQL("SELECT {upper}::TIMESTAMPTZ <= {cutoff};").format(
+                upper=sql.SQL(upper), cutoff=sql.Literal(cutoff)), one=True)[0]
+            if not expired:
+                continue
+            if self.retention_mode == "archive":
+                logger.info("apply_retention(): %s archived to %s", name, self.archive(name))
+            self.SQL().execute_query(sql.SQL("""
+            ALTER TABLE {table} DETACH PARTITION {partition};
+            DROP TABLE {partition};
+            """).format(table=sql.Identifier(self.table), partition=sql.Identifier(name)))
+            logger.info("apply_retention(): %s dropped", name)
+            dropped.append(name)
+        return dropped
+
+    def maintain(self) -> None:
+        if not self.is_partitioned():
+            logger.warning("maintain(): %s is not partitioned, run setup.py", self.table)
+            return
+        self.ensure_partitions()
+        self.apply_retention()
+
+    def start_maintenance(self, interval: float = MessageLogSettings.MAINTENANCE_INTERVAL) -> threading.Thread:
+        """
+        Запуск фонового обслуживания секций раз в interval секунд
+
+        Returns
+        -------
+        threading.Thread
+        """
+        def loop():
+            while True:
+                try:
+                    self.maintain()
+                except Exception:
+                    logger.error("maintain(): %s Exception occurred", self.table, exc_info=True)
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name=f"partitions-{self.table}", daemon=True)
+        thread.start()
+        return thread
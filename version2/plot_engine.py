@@ -0,0 +1,284 @@
+"""
+Локальное построение графиков функций
+
+Модуль не импортирует settings и остальной код бота, так как его функции выполняются
+в отдельных процессах (см. request_handler.LocalGraphBuilder).
+"""
+import ast
+import io
+import re
+
+import numpy as np
+
+
+class ExpressionError(Exception):
+    pass
+
+
+FUNCTIONS = {
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "tg": np.tan,
+    "cot": lambda x: 1 / np.tan(x),
+    "ctg": lambda x: 1 / np.tan(x),
+    "arcsin": np.arcsin,
+    "asin": np.arcsin,
+    "arccos": np.arccos,
+    "acos": np.arccos,
+    "arctan": np.arctan,
+    "atan": np.arctan,
+    "arctg": np.arctan,
+    "sinh": np.sinh,
+    "cosh": np.cosh,
+    "tanh": np.tanh,
+    "exp": np.exp,
+    "log": np.log,
+    "ln": np.log,
+    "lg": np.log10,
+    "log10": np.log10,
+    "log2": np.log2,
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+    "sign": np.sign,
+    "floor": np.floor,
+    "ceil": np.ceil,
+}
+
+CONSTANTS = {
+    "pi": np.pi,
+    "e": np.e,
+}
+
+VARIABLES = {
+    1: ("x",),
+    2: ("x", "y"),
+}
+
+BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.Pow: np.power,
+    ast.Mod: np.mod,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: np.positive,
+    ast.USub: np.negative,
+}
+
+MAX_EXPRESSION_LENGTH = 200
+MAX_NODES = 100
+
+
+def normalize_expression(func: str) -> str:
+    """
+    Приведение записи функции, принятой у пользователей, к синтаксису python
+
+    Убирается левая часть вида "y =", "f(x) =", "^" заменяется на "**",
+    добавляются пропущенные знаки умножения ("2x" -> "2*x", ")(" -> ")*(").
+
+    Parameters
+    ----------
+    func: str
+        Функция в строковом формате
+
+    Returns
+    -------
+    str
+        Функция в синтаксисе python
+    """
+    func = func.strip().lower()
+    func = re.sub(r"^\s*(?:[yz]|f\s*\(\s*x\s*(?:,\s*y\s*)?\))\s*=", "", func)
+    func = func.replace("^", "**").replace(",", ".")
+    func = re.sub(r"(?<![a-z_\d.])(\d+(?:\.\d*)?)\s*(?=[a-z(])", r"\1*", func)
+    func = re.sub(r"\)\s*(?=[a-z\d(])", ")*", func)
+    return func.strip()
+
+
+def parse_expression(func: str, var_num: int) -> ast.Expression:
+    """
+    Разбор функции в дерево с проверкой, что в нем есть только разрешенные операции
+
+    Parameters
+    ----------
+    func: str
+        Функция в строковом формате
+    var_num: int
+        Количество переменных функции
+
+    Returns
+    -------
+    ast.Expression
+        Дерево выражения
+
+    Raises
+    ------
+    ExpressionError
+        Если функцию нельзя построить локально
+    """
+    if var_num not in VARIABLES:
+        raise ExpressionError(f"Unsupported number of variables: {var_num}")
+    expression = normalize_expression(func)
+    if not expression or len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError("Expression is empty or too long")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except (SyntaxError, ValueError):
+        raise ExpressionError(f"Can't parse expression: {expression}")
+
+    names = set(VARIABLES[var_num]) | set(CONSTANTS)
+    nodes = list(ast.walk(tree))
+    if len(nodes) > MAX_NODES:
+        raise ExpressionError("Expression is too complex")
+    for node in nodes:
+        if isinstance(node, (ast.Expression, ast.Load)):
+            continue
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            continue
+        if isinstance(node, ast.operator) and type(node) in BINARY_OPERATORS:
+            continue
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+            continue
+        if isinstance(node, ast.unaryop) and type(node) in UNARY_OPERATORS:
+            continue
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            continue
+        if isinstance(node, ast.Name) and (node.id in names or node.id in FUNCTIONS):
+            continue
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+                and len(node.args) == 1 and not node.keywords:
+            continue
+        raise ExpressionError(f"Unsupported element: {type(node).__name__}")
+    return tree
+
+
+def evaluate(node: ast.AST, variables: dict):
+    """
+    Векторное вычисление проверенного parse_expression дерева
+
+    Parameters
+    ----------
+    node: ast.AST
+        Узел дерева выражения
+    variables: dict
+        Значения переменных (numpy массивы)
+
+    Returns
+    -------
+    numpy.ndarray или float
+        Значение выражения
+    """
+    if isinstance(node, ast.Expression):
+        return evaluate(node.body, variables)
+    if isinstance(node, ast.Constant):
+        return np.float64(node.value)  # float, чтобы 9**9**9 не считался в длинной арифметике
+    if isinstance(node, ast.Name):
+        if node.id in variables:
+            return variables[node.id]
+        if node.id in CONSTANTS:
+            return CONSTANTS[node.id]
+        raise ExpressionError(f"Function used as variable: {node.id}")
+    if isinstance(node, ast.BinOp):
+        return BINARY_OPERATORS[type(node.op)](evaluate(node.left, variables), evaluate(node.right, variables))
+    if isinstance(node, ast.UnaryOp):
+        return UNARY_OPERATORS[type(node.op)](evaluate(node.operand, variables))
+    if isinstance(node, ast.Call):
+        return FUNCTIONS[node.func.id](evaluate(node.args[0], variables))
+    raise ExpressionError(f"Unsupported element: {type(node).__name__}")
+
+
+def compute(func: str, var_num: int, points: int, limit: float) -> tuple:
+    """
+    Вычисление значений функции на сетке
+
+    Parameters
+    ----------
+    func: str
+        Функция в строковом формате
+    var_num: int
+        Количество переменных функции
+    points: int
+        Количество точек сетки по каждой оси
+    limit: float
+        Сетка строится на отрезке [-limit, limit] по каждой оси
+
+    Returns
+    -------
+    tuple
+        Массивы координат сетки и значений функции, значения вне области определения равны nan
+
+    Raises
+    ------
+    ExpressionError
+        Если функцию нельзя построить локально
+    """
+    tree = parse_expression(func, var_num)
+    axis = np.linspace(-limit, limit, points)
+    if var_num == 1:
+        grid = (axis,)
+    else:
+        grid = np.meshgrid(axis, axis)
+    with np.errstate(all="ignore"):
+        values = evaluate(tree, dict(zip(VARIABLES[var_num], grid)))
+        values = np.broadcast_to(np.asarray(values, dtype=np.float64), grid[0].shape).copy()
+    values[~np.isfinite(values)] = np.nan
+    if np.isnan(values).all():
+        raise ExpressionError("Function is not defined on the plot range")
+    return grid, values
+
+
+def render_plot(func: str, var_num: int, points: int = 500, limit: float = 10) -> bytes:
+    """
+    Построение графика функции одной переменной или поверхности для функции двух переменных
+
+    Parameters
+    ----------
+    func: str
+        Функция в строковом формате
+    var_num: int
+        Количество переменных функции
+    points: int, default 500
+        Количество точек по оси для графика функции одной переменной,
+        для поверхности используется в 5 раз меньше точек по каждой оси
+    limit: float, default 10
+        Границы области построения
+
+    Returns
+    -------
+    bytes
+        Изображение с графиком в формате jpg
+
+    Raises
+    ------
+    ExpressionError
+        Если функцию нельзя построить локально
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    if var_num == 1:
+        (x,), y = compute(func, var_num, points, limit)
+        figure, axes = plt.subplots(figsize=(6, 4.5))
+        axes.plot(x, y)
+        axes.axhline(0, color="black", linewidth=0.5)
+        axes.axvline(0, color="black", linewidth=0.5)
+        axes.grid(True, linestyle=":")
+        axes.set_xlabel("x")
+        axes.set_ylabel("y")
+    else:
+        (x, y), z = compute(func, var_num, max(points // 5, 10), limit)
+        figure = plt.figure(figsize=(6, 5))
+        axes = figure.add_subplot(projection="3d")
+        axes.plot_surface(x, y, z, cmap="viridis", linewidth=0)
+        axes.set_xlabel("x")
+        axes.set_ylabel("y")
+        axes.set_zlabel("z")
+    axes.set_title(func)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="jpg", dpi=100)
+    plt.close(figure)
+    return buffer.getvalue()
@@ -1,57 +1,210 @@
-import psycopg2
+import os
+import threading
+
 from psycopg2 import OperationalError
+from psycopg2.pool import ThreadedConnectionPool
 
+from metrics import DB_LATENCY, DB_ERRORS, query_labels
 from settings import logger, PostgresSQLSettings
+from tracing import span
 
 
 class PostgreSQL:
+    """Класс для выполнения запросов к PostgreSQL
+
+    Соединения берутся из общего для процесса пула и возвращаются в него после каждого запроса,
+    поэтому создание объекта не открывает новое соединение. Если все соединения заняты,
+    запрос ждет освобождения соединения. После fork процесс создает собственный пул.
+
+    Attributes
+    ----------
+    pool: ThreadedConnectionPool
+        Пул соединений процесса
+    """
+    pool = None
+    pool_pid = None
+    pool_slots = None
+    _pool_lock = threading.Lock()
+
     def __init__(self):
         self.database = PostgresSQLSettings.DB_NAME
         self.user = PostgresSQLSettings.DB_USERNAME
         self.password = PostgresSQLSettings.DB_PASSWORD
         self.host = PostgresSQLSettings.DB_HOST
         self.port = PostgresSQLSettings.DB_PORT
-        self.connection = self.get_connection()
+
+    def get_pool(self) -> ThreadedConnectionPool:
+        with self._pool_lock:
+            if PostgreSQL.pool is None or PostgreSQL.pool_pid != os.getpid():
+                try:
+                    PostgreSQL.pool = ThreadedConnectionPool(
+                        PostgresSQLSettings.POOL_MIN_SIZE,
+                        PostgresSQLSettings.POOL_MAX_SIZE,
+                        database=self.database,
+                        user=self.user,
+                        password=self.password,
+                        host=self.host,
+                        port=self.port,
+                    )
+                except OperationalError:
+                    logger.error("Connection to PostgreSQL DB failed", exc_info=True)
+                    raise
+                PostgreSQL.pool_pid = os.getpid()
+                PostgreSQL.pool_slots = threading.BoundedSemaphore(PostgresSQLSettings.POOL_MAX_SIZE)
+            return PostgreSQL.pool
 
     def get_connection(self):
-        connection = None
+        pool = self.get_pool()
+        PostgreSQL.pool_slots.acquire()
         try:
-            connection = psycopg2.connect(
-                database=self.database,
-                user=self.user,
-                password=self.password,
-                host=self.host,
-                port=self.port,
-            )
-        except OperationalError:
+            return pool.getconn()
+        except Exception:
+            PostgreSQL.pool_slots.release()
             logger.error("Connection to PostgreSQL DB failed", exc_info=True)
             raise
-        finally:
-            return connection
 
-    def execute_query(self, query):
-        cursor = self.connection.cursor()
+    def put_connection(self, connection, broken=False) -> None:
+        # незавершенная транзакция откатывается пулом, разорванное соединение закрывается
+        self.get_pool().putconn(connection, close=broken or connection.closed != 0)
+        PostgreSQL.pool_slots.release()
+
+    def execute_query(self, query, returning=False, autocommit=False):
+        """
+        Выполнение запроса, изменяющего данные
+
+        Parameters
+        ----------
+        query
+            SQL запрос
+        returning: bool, default False
+            Вернуть первую строку результата (INSERT ... RETURNING)
+        autocommit: bool, default False
+            Выполнить запрос вне транзакции (нужно для CREATE INDEX CONCURRENTLY)
+
+        Returns
+        -------
+        tuple или None
+        """
+        labels = query_labels(query)
+        connection = self.get_connection()
+        broken = False
         try:
-            cursor.execute(query)
+            connection.autocommit = autocommit
+            with DB_LATENCY.time(*labels), span("db", operation=labels[0], table=labels[1]):
+                with connection.cursor() as cursor:
+                    cursor.execute(query)
+                    result = cursor.fetchone() if returning else None
+                if not autocommit:
+                    connection.commit()
         except OperationalError:
+            broken = True
+            DB_ERRORS.inc(*labels)
             logger.error("execute_query(): Exception occurred", exc_info=True)
             raise
-        else:
-            self.connection.commit()
+        except Exception:
+            DB_ERRORS.inc(*labels)
+            if not autocommit:
+                connection.rollback()
+            raise
+        finally:
+            if autocommit and not connection.closed:
+                connection.autocommit = False
+            self.put_connection(connection, broken)
+        return result
 
     def execute_read_query(self, query, one=False):
-        cursor = self.connection.cursor()
+        labels = query_labels(query)
+        connection = self.get_connection()
+        broken = False
         result = None
         try:
-            cursor.execute(query)
+            with DB_LATENCY.time(*labels), span("db", operation=labels[0], table=labels[1]):
+                with connection.cursor() as cursor:
+                    cursor.execute(query)
+                    if one:
+                        result = cursor.fetchone()
+                    else:
+                        result = cursor.fetchall()
         except OperationalError:
+            broken = True
+            DB_ERRORS.inc(*labels)
             logger.error("execute_read_query(): Exception occurred", exc_info=True)
             raise
-        else:
-            if one:
-                result = cursor.fetchone()
-            else:
-                result = cursor.fetchall()
+        except Exception:
+            DB_ERRORS.inc(*labels)
+            raise
         finally:
-            return result
+            self.put_connection(connection, broken)
+        return result
 
+    def copy_to(self, query, file) -> None:
+        """
+        Выгрузка результата запроса в файл командой COPY
+
+        Parameters
+        ----------
+        query
+            SQL запрос вида COPY (...) TO STDOUT
+        file
+            Файл, открытый на запись
+
+        Returns
+        -------
+        None
+        """
+        labels = query_labels(query)
+        connection = self.get_connection()
+        broken = False
+        try:
+            with DB_LATENCY.time(*labels), span("db", operation=labels[0], table=labels[1]):
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(query, file)
+                connection.commit()
+        except OperationalError:
+            broken = True
+            DB_ERRORS.inc(*labels)
+            logger.error("copy_to(): Exception occurred", exc_info=True)
+            raise
+        except Exception:
+            DB_ERRORS.inc(*labels)
+            connection.rollback()
+            raise
+        finally:
+            self.put_connection(connection, broken)
+
+    def iterate_read_query(self, query, itersize=1000):
+        """
+        Построчное чтение результата запроса через курсор на стороне сервера
+
+        Строки передаются с сервера пачками по itersize, поэтому результат не загружается в память целиком
+
+        Parameters
+        ----------
+        query
+            SQL запрос
+        itersize: int, default 1000
+            Количество строк, получаемых с сервера за одно обращение
+
+        Returns
+        -------
+        generator
+            Строки результата
+        """
+        connection = self.get_connection()
+        broken = False
+        try:
+            with connection:
+                with connection.cursor(name=f"iterate_{id(query)}") as cursor:
+                    cursor.itersize = itersize
+                    labels = query_labels(query)
+                    try:
+                        with DB_LATENCY.time(*labels), span("db", operation=labels[0], table=labels[1]):
+                            cursor.execute(query)
+                    except OperationalError:
+                        broken = True
+                        DB_ERRORS.inc(*labels)
+                        logger.error("iterate_read_query(): Exception occurred", exc_info=True)
+                        raise
+                    yield from cursor
+        finally:
+            self.put_connection(connection, broken)
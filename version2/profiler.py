@@ -0,0 +1,198 @@
+"""
+Профилирование работающего бота
+
+Сэмплирующий профилировщик раз в interval секунд читает стеки всех потоков процесса
+(sys._current_frames) и считает одинаковые стеки. Результат записывается в формате collapsed stacks
+(одна строка "поток;функция;функция количество"), который принимают flamegraph.pl, speedscope и inferno.
+Одновременно tracemalloc сравнивает снимки памяти в начале и в конце профилирования,
+самые большие приросты памяти записываются в отдельный отчет.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from abc import ABCMeta, abstractmethod, ABC
+
+from settings import ProfilerSettings, AnswerValue, logger
+
+
+class IProfiler(ABC):
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def run(self, seconds: float, bot, peer_id: int) -> None:
+        raise NotImplementedError
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse(frame, thread_name: str) -> str:
+    """
+    Стек потока в формате collapsed stacks
+
+    Parameters
+    ----------
+    frame: frame
+        Текущий кадр потока
+    thread_name: str
+        Название потока (корень стека)
+
+    Returns
+    -------
+    str
+        Кадры от корня к текущему через ";"
+    """
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.append(thread_name.replace(";", ":").replace(" ", "_"))
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler(IProfiler):
+    """Профилирование процесса по запросу администратора
+
+    В процессе одновременно выполняется не больше одного профилирования
+
+    Attributes
+    ----------
+    interval: float
+        Период чтения стеков в секундах
+    directory: str
+        Папка для файлов с результатами
+    top: int
+        Количество строк в отчетах
+    """
+    running = False
+    _lock = threading.Lock()
+
+    def __init__(self, interval: float = ProfilerSettings.INTERVAL, directory: str = ProfilerSettings.DIRECTORY,
+                 top: int = ProfilerSettings.TOP):
+        self.interval = interval
+        self.directory = directory
+        self.top = top
+
+    def sample(self, seconds: float) -> tuple:
+        """
+        Чтение стеков всех потоков, кроме текущего, в течение seconds секунд
+
+        Returns
+        -------
+        tuple
+            (collections.Counter стеков, количество замеров)
+        """
+        stacks = collections.Counter()
+        own_id = threading.get_ident()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            for thread_id, frame in frames.items():
+                if thread_id != own_id:
+                    stacks[collapse(frame, names.get(thread_id, str(thread_id)))] += 1
+            frames = frame = None  # кадры держат ссылки на локальные переменные других потоков
+            samples += 1
+            time.sleep(self.interval)
+        return stacks, samples
+
+    def profile(self, seconds: float) -> dict:
+        """
+        Профилирование процесса
+
+        Parameters
+        ----------
+        seconds: float
+            Длительность профилирования
+
+        Returns
+        -------
+        dict
+            stacks - счетчик стеков, samples - количество замеров,
+            allocations - наибольшие приросты памяти (tracemalloc.StatisticDiff)
+        """
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(ProfilerSettings.TRACEMALLOC_FRAMES)
+        try:
+            before = tracemalloc.take_snapshot()
+            stacks, samples = self.sample(seconds)
+            after = tracemalloc.take_snapshot()
+        finally:
+            if started_tracemalloc:
+                tracemalloc.stop()
+        snapshot_filter = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        allocations = after.filter_traces(snapshot_filter).compare_to(before.filter_traces(snapshot_filter), "lineno")
+        return {"stacks": stacks, "samples": samples, "allocations": allocations[:self.top]}
+
+    def write(self, result: dict, name: str) -> tuple:
+        """
+        Запись результатов профилирования
+
+        Returns
+        -------
+        tuple
+            (файл collapsed stacks, файл отчета о памяти)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        stacks_file = os.path.join(self.directory, f"{name}.collapsed")
+        with open(stacks_file, "w", encoding="utf-8") as file:
+            for stack, count in result["stacks"].most_common():
+                file.write(f"{stack} {count}\n")
+        memory_file = os.path.join(self.directory, f"{name}.memory.txt")
+        with open(memory_file, "w", encoding="utf-8") as file:
+            for statistic in result["allocations"]:
+                file.write(f"{statistic}\n")
+        return stacks_file, memory_file
+
+    def summary(self, result: dict, files: tuple) -> str:
+        own_time = collections.Counter()
+        for stack, count in result["stacks"].items():
+            own_time[stack.rsplit(";", 1)[-1]] += count
+        total = sum(own_time.values()) or 1
+        functions = "\n".join(f"{count * 100 / total:.1f}% {name}" for name, count in own_time.most_common(5))
+        allocations = "\n".join(
+            f"{statistic.size_diff / 1024:+.1f} KiB {statistic.traceback[0].filename}:{statistic.traceback[0].lineno}"
+            for statistic in result["allocations"][:5]
+        )
+        return AnswerValue.PROFILE_FINISH.format(result["samples"], functions, allocations, *files)
+
+    def run(self, seconds: float, bot, peer_id: int) -> None:
+        """
+        Профилирование процесса и отправка краткого отчета администратору
+
+        Parameters
+        ----------
+        seconds: float
+            Длительность профилирования
+        bot: IBot
+            Бот, через которого отправляется отчет
+        peer_id: int
+            id администратора
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if SamplingProfiler.running:
+                bot.send_message(peer_id, AnswerValue.PROFILE_BUSY)
+                return
+            SamplingProfiler.running = True
+        try:
+            logger.info("profiler: started for %s s by %s", seconds, peer_id)
+            result = self.profile(seconds)
+            files = self.write(result, time.strftime("profile-%Y%m%d-%H%M%S") + f"-{os.getpid()}")
+            logger.info("profiler: finished, %s samples, written to %s", result["samples"], files)
+            bot.send_message(peer_id, self.summary(result, files))
+        except Exception:
+            logger.error("profiler: Exception occurred", exc_info=True)
+        finally:
+            with self._lock:
+                SamplingProfiler.running = False
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов "ведро с токенами"
+
+    Ведро вмещает capacity токенов и пополняется со скоростью rate токенов в секунду.
+    Каждый запрос забирает токен, поэтому в среднем проходит не больше rate запросов в секунду,
+    а кратковременно - до capacity запросов подряд.
+
+    Attributes
+    ----------
+    rate: float
+        Скорость пополнения (токенов в секунду)
+    capacity: float
+        Вместимость ведра
+    tokens: float
+        Текущее количество токенов
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Попытка взять токены без ожидания
+
+        Parameters
+        ----------
+        tokens: float, default 1
+            Количество токенов
+
+        Returns
+        -------
+        bool
+            True если токены взяты, False если их недостаточно
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1) -> None:
+        """
+        Взятие токенов с ожиданием их появления
+
+        Parameters
+        ----------
+        tokens: float, default 1
+            Количество токенов
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PeerThrottle:
+    """Ограничение частоты входящих сообщений каждого пользователя
+
+    У каждого peer_id свое ведро с токенами (см. TokenBucket) вместимостью capacity, пополняемое
+    со скоростью rate. Ведра хранятся в одном словаре под общей блокировкой, без объекта TokenBucket
+    на пользователя, и не больше max_peers последних пользователей: давно писавший пользователь
+    вытесняется (LRU) и потом начинает с полного ведра, а активно пишущий не вытесняется никогда.
+
+    Attributes
+    ----------
+    rate: float
+        Сообщений в секунду на пользователя в среднем
+    capacity: float
+        Сообщений подряд без ограничения
+    max_peers: int
+        Максимальное количество хранимых ведер
+    """
+    ALLOW = "allow"
+    DROP = "drop"
+    NOTIFY = "notify"  # первое отброшенное сообщение: пользователю можно один раз сообщить об ограничении
+
+    def __init__(self, rate: float, capacity: float, max_peers: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_peers = max_peers
+        self.buckets = OrderedDict()  # peer_id -> [токены, время обновления, уведомлен ли пользователь]
+        self._lock = threading.Lock()
+
+    def check(self, peer_id: int) -> str:
+        """
+        Учет входящего сообщения пользователя
+
+        Parameters
+        ----------
+        peer_id: int
+            id пользователя
+
+        Returns
+        -------
+        str
+            ALLOW - сообщение нужно обработать, NOTIFY - отбросить и сообщить об ограничении,
+            DROP - отбросить молча (уведомление уже отправлено)
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self.buckets.get(peer_id)
+            if bucket is None:
+                bucket = self.buckets[peer_id] = [self.capacity, now, False]
+                if len(self.buckets) > self.max_peers:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(peer_id)
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                bucket[2] = False
+                return self.ALLOW
+            if bucket[2]:
+                return self.DROP
+            bucket[2] = True
+            return self.NOTIFY
@@ -1,6 +1,7 @@
+import threading
 from abc import ABCMeta, abstractmethod, ABC
 
-from file_loader import PandasLoader
+from file_loader import PandasLoader, modified_time
 
 
 class ILink(ABC):
@@ -22,26 +23,69 @@ class PandasLink:
     """
     Класс для получения ссылок на занятия из файла
 
+    Таблица каждого файла загружается один раз на процесс (см. load) и заново - только если
+    локальный файл изменился, поэтому создание объекта на каждое сообщение не читает файл.
+
     Attributes
     ----------
     links: pandas.core.frame.DataFrame
         Pandas таблица с ссылками
+    subjects: list
+        Названия предметов в нижнем регистре в порядке таблицы
+    index: dict
+        Название предмета -> ссылка
     """
+    tables = {}  # (course_name, folder_name) -> (время изменения файла, таблица, предметы, индекс)
+    _tables_lock = threading.Lock()
+
     def __init__(self, course_name, folder_name=None):
-        self.links = PandasLoader().get_csv(file_name=course_name, folder_name=folder_name)
-        self.normalize_subj_names()
+        self.links, self.subjects, self.index = self.load(course_name, folder_name)
+
+    @classmethod
+    def load(cls, course_name, folder_name=None) -> tuple:
+        """
+        Загрузка таблицы ссылок и построение индекса предметов
 
-    def normalize_subj_names(self) -> None:
+        Returns
+        -------
+        tuple
+            (таблица, список предметов, индекс предмет -> ссылка)
+        """
+        key = (course_name, folder_name)
+        cached = cls.tables.get(key)
+        if cached is not None and cached[0] == modified_time(course_name, ".csv"):
+            return cached[1:]
+        with cls._tables_lock:
+            cached = cls.tables.get(key)
+            if cached is not None and cached[0] == modified_time(course_name, ".csv"):
+                return cached[1:]
+            links = PandasLoader().get_csv(file_name=course_name, folder_name=folder_name)
+            cls.normalize_subj_names(links)
+            subj_name_key, subj_link_key = links.columns[0], links.columns[1]
+            subjects = links[subj_name_key].tolist()
+            index = {}
+            for subject, link in zip(subjects, links[subj_link_key].tolist()):
+                index.setdefault(subject, link)
+            cls.tables[key] = (modified_time(course_name, ".csv"), links, subjects, index)
+            return links, subjects, index
+
+    @staticmethod
+    def normalize_subj_names(links) -> None:
         """
         Приведение названий предметов к нижнему регистру
 
+        Parameters
+        ----------
+        links: pandas.core.frame.DataFrame
+            Pandas таблица с ссылками
+
         Returns
         -------
         None
         """
-        subj_name_key = self.links.columns[0]
-        self.links[subj_name_key] = \
-            [self.links[subj_name_key].values[i].lower() for i in range(self.links[subj_name_key].values.shape[0])]
+        subj_name_key = links.columns[0]
+        links[subj_name_key] = \
+            [links[subj_name_key].values[i].lower() for i in range(links[subj_name_key].values.shape[0])]
 
     def get_subj_list(self) -> list:
         """
@@ -54,9 +98,7 @@ class PandasLink:
         """
         if self.links is None:
             return []
-        subj_name_key = self.links.columns[0]
-        subj_list = self.links[subj_name_key].tolist()
-        return subj_list
+        return list(self.subjects)
 
     def get_subj_link(self, subj_name: str) -> str:
         """
@@ -73,5 +115,4 @@ class PandasLink:
         """
         if self.links is None:
             return "Error"
-        subj_name_key, subj_link_key = self.links.columns[0], self.links.columns[1]
-        return self.links[self.links[subj_name_key] == subj_name][subj_link_key].values[0]
+        return self.index[subj_name]
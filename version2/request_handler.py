@@ -1,9 +1,13 @@
+import multiprocessing
+import multiprocessing.pool
+import threading
 import requests
 from abc import ABCMeta, abstractmethod, ABC
 
-import wolframalpha
-
-from settings import WolframalphaAPISettings, logger
+from cache import MemoryCache, SQLiteCache, TieredCache, FileCache, normalize_key
+from resilience import WOLFRAMALPHA, DependencyUnavailable
+from plot_engine import ExpressionError, parse_expression, render_plot
+from settings import WolframalphaAPISettings, CacheSettings, GraphSettings, logger
 
 
 class IRequestHandler(ABC):
@@ -18,21 +22,46 @@ class IGraphBuilder(ABC):
     __metaclass__ = ABCMeta
 
     @abstractmethod
-    def save_plot(self, func: str, var_num: int, graph_name: str) -> bool:
+    def get_plot(self, func: str, var_num: int) -> bytes:
         raise NotImplementedError
 
 
 class WolframalphaAPI(IRequestHandler, IGraphBuilder):
+    # кэш общий для всех экземпляров, так как Answerer создает новый объект на каждый запрос
+    query_cache = TieredCache(
+        memory=MemoryCache(max_size=CacheSettings.QUERY_MEMORY_SIZE, ttl=CacheSettings.QUERY_TTL),
+        disk=SQLiteCache(
+            filename=CacheSettings.FILENAME,
+            table="wolframalpha_queries",
+            max_size=CacheSettings.QUERY_DISK_SIZE,
+            ttl=CacheSettings.QUERY_TTL
+        )
+    )
+    # (функция, количество переменных) -> хэш изображения в plot_files
+    plot_index = SQLiteCache(
+        filename=CacheSettings.FILENAME,
+        table="wolframalpha_plots",
+        max_size=CacheSettings.PLOT_MAX_FILES,
+        ttl=CacheSettings.PLOT_TTL
+    )
+    plot_files = FileCache(directory=CacheSettings.PLOT_DIR, suffix=".jpg", max_files=CacheSettings.PLOT_MAX_FILES)
+
     def __init__(self):
         self.app_id = WolframalphaAPISettings.TOKEN
         self.client = self.get_connection()
 
     def get_connection(self):
+        # клиент wolframalpha нужен только для запросов к API, поэтому импортируется при подключении
+        import wolframalpha
         return wolframalpha.Client(app_id=self.app_id)
 
     def get_response(self, text: str) -> str:
+        key = normalize_key(text)
+        if (cached := self.query_cache.get(key)) is not None:
+            logger.debug("get_response(): status message: %s", "cache hit")
+            return cached
         try:
-            res = self.client.query(text)
+            res = WOLFRAMALPHA.call("query", self.client.query, text)
         except Exception:
             logger.error("Connection to WolframalphaAPI failed", exc_info=True)
             return ""
@@ -41,8 +70,11 @@ class WolframalphaAPI(IRequestHandler, IGraphBuilder):
             for sub in pod.subpods:
                 if sub.plaintext is not None:
                     res_list.append(f"{sub.plaintext}\n")
+        response = "".join(res_list)
+        if response:  # пустой ответ не кэшируется, чтобы повторный запрос мог быть обработан
+            self.query_cache.set(key, response)
         logger.debug("get_response(): status message: %s", "OK")
-        return "".join(res_list)
+        return response
 
     @staticmethod
     def rename_operations(func_str: str) -> str:
@@ -60,7 +92,12 @@ class WolframalphaAPI(IRequestHandler, IGraphBuilder):
                     f"&input={query}" \
                     f"&output=json" \
                     f"&includepodid={dimension}Plot"
-        r = requests.get(query_url).json()
+        try:
+            with WOLFRAMALPHA.guard("plot"):
+                r = requests.get(query_url, timeout=WOLFRAMALPHA.timeout).json()
+        except (requests.RequestException, ValueError, DependencyUnavailable):
+            logger.error("get_plot_url(): connection to WolframalphaAPI failed", exc_info=True)
+            return ""
         try:
             pods = r["queryresult"]["pods"]
             plot_url = pods[0]["subpods"][0]["img"]["src"]
@@ -69,17 +106,104 @@ class WolframalphaAPI(IRequestHandler, IGraphBuilder):
         logger.debug("get_plot_url(): status message: %s", "OK")
         return plot_url
 
-    def save_plot(self, func: str, var_num: int, graph_name: str = "graph") -> bool:
+    def get_plot(self, func: str, var_num: int) -> bytes:
+        """
+        Построение графика функции
+
+        Изображение возвращается в памяти и сразу передается на отправку. Копия сохраняется в plot_files
+        под именем, равным хэшу содержимого, поэтому повторный запрос той же функции не обращается к вольфраму.
+
+        Parameters
+        ----------
+        func: str
+            Функция, график которой нужно построить
+        var_num: int
+            Количество переменных функции
+
+        Returns
+        -------
+        bytes
+            Изображение с графиком, пустые байты если график построить не удалось
+        """
+        key = f"{var_num}:{normalize_key(func)}"
+        if (digest := self.plot_index.get(key)) is not None:
+            if img_data := self.plot_files.read(digest):
+                logger.debug("get_plot(): status message: %s", "cache hit")
+                return img_data
         plot_url = self.get_plot_url(self.rename_operations(func), self.get_dimension(var_num))
         if not plot_url:
-            return False
-        if graph_name[-4:] == ".jpg":
-            img_name = graph_name
-        else:
-            img_name = f"{graph_name}.jpg"
-        img_data = requests.get(plot_url).content
-        with open(img_name, 'wb') as handler:
-            handler.write(img_data)
-        logger.debug("save_plot(): status message: %s", "OK")
-        return True
-
+            return b""
+        try:
+            with WOLFRAMALPHA.guard("image"):
+                response = requests.get(plot_url, timeout=WOLFRAMALPHA.timeout)
+                response.raise_for_status()
+        except (requests.RequestException, DependencyUnavailable):
+            logger.error("get_plot(): image download failed", exc_info=True)
+            return b""
+        # страница ошибки не должна попасть в кэш вместо изображения
+        if not response.headers.get("Content-Type", "").startswith("image/") or not response.content:
+            logger.error("get_plot(): unexpected response %s", response.headers.get("Content-Type"))
+            return b""
+        img_data = response.content
+        self.plot_index.set(key, self.plot_files.put(img_data))
+        logger.debug("get_plot(): status message: %s", "OK")
+        return img_data
+
+
+class LocalGraphBuilder(IGraphBuilder):
+    """Класс для построения графиков без обращения к внешним сервисам
+
+    Функция разбирается в ограниченное дерево выражения (см. plot_engine.parse_expression), вычисляется
+    векторно с помощью numpy и рисуется matplotlib в отдельном процессе, чтобы не блокировать бота.
+    Функции, которые не удалось разобрать или построить, передаются в fallback.
+
+    Attributes
+    ----------
+    fallback: IGraphBuilder
+        Класс, который строит графики, не поддерживаемые локально
+    pool: multiprocessing.pool.Pool
+        Общий для всех экземпляров пул процессов, создается при первом построении графика
+    """
+    pool = None
+    fallback = WolframalphaAPI
+    _pool_lock = threading.Lock()
+
+    @classmethod
+    def get_pool(cls) -> multiprocessing.pool.Pool:
+        with cls._pool_lock:
+            if cls.pool is None:
+                # forkserver, а не fork: пул создается при первом графике, когда в процессе уже работают
+                # потоки, и fork мог бы скопировать захваченную ими блокировку. Сервер forkserver
+                # загружает только plot_engine, который не импортирует settings и не запускает потоков
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["plot_engine"])
+                cls.pool = context.Pool(processes=GraphSettings.WORKERS)
+            return cls.pool
+
+    @classmethod
+    def reset_pool(cls, pool: multiprocessing.pool.Pool) -> None:
+        # зависший процесс занимал бы место в пуле, поэтому процессы завершаются и пул создается заново
+        with cls._pool_lock:
+            if cls.pool is pool:
+                cls.pool = None
+        pool.terminate()
+
+    def get_plot(self, func: str, var_num: int) -> bytes:
+        pool = None
+        try:
+            parse_expression(func, var_num)  # быстрая проверка до отправки в процесс
+            pool = self.get_pool()
+            result = pool.apply_async(render_plot, (func, var_num, GraphSettings.POINTS, GraphSettings.LIMIT))
+            img_data = result.get(timeout=GraphSettings.TIMEOUT)
+        except multiprocessing.TimeoutError:
+            logger.warning("get_plot(): local plot timed out, restarting graph processes, using fallback")
+            self.reset_pool(pool)
+            return self.fallback().get_plot(func, var_num)
+        except ExpressionError as e:
+            logger.debug("get_plot(): local plot unavailable (%s), using fallback", e)
+            return self.fallback().get_plot(func, var_num)
+        except Exception:
+            logger.warning("get_plot(): local plot failed, using fallback", exc_info=True)
+            return self.fallback().get_plot(func, var_num)
+        logger.debug("get_plot(): status message: %s", "OK")
+        return img_data
@@ -0,0 +1,200 @@
+"""
+Зарезервированные фразы
+
+Фразы, которые бот обрабатывает сам (надписи на кнопках всех клавиатур, команды из TextToAnswer,
+курсы, группы, дни недели), нельзя использовать как текст пользовательского ответа (teach_bot),
+иначе пользовательский ответ перехватит кнопку или команду. Индекс фраз строится автоматически
+из файлов клавиатур и перестраивается, когда файлы клавиатур меняются.
+"""
+import json
+import os
+import re
+import threading
+import time
+
+from settings import VKKeyboardName, TGKeyboardName, TextToAnswer, ReservedSettings, logger
+
+
+KEYBOARD_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyboards")
+
+# команды с аргументами: зарезервирован любой текст, начинающийся с них
+COMMAND_PREFIXES = (
+    TextToAnswer.GET_TEACHER_INGO,
+    TextToAnswer.DELETE_CUSTOM,
+    TextToAnswer.BAN,
+    TextToAnswer.UNBAN,
+    TextToAnswer.BROADCAST,
+    TextToAnswer.PROFILE,
+    TextToAnswer.STATS,
+)
+
+
+def normalize(text: str) -> str:
+    """
+    Приведение фразы к виду для сравнения: нижний регистр, ё -> е, одиночные пробелы,
+    без знаков препинания по краям
+    """
+    text = re.sub(r"\s+", " ", text.lower().replace("ё", "е"))
+    return text.strip(" .,!?;:")
+
+
+def deletes(text: str) -> set:
+    return {text[:i] + text[i + 1:] for i in range(len(text))}
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """
+    Расстояние Дамерау-Левенштейна (вставка, удаление, замена, перестановка соседних символов)
+
+    Returns
+    -------
+    int
+        Расстояние или limit + 1, если расстояние больше limit
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def constants(settings_class) -> list:
+    return [getattr(settings_class, name) for name in dir(settings_class) if name.isupper()]
+
+
+def keyboard_files(*keyboard_names) -> list:
+    """
+    Пути ко всем файлам клавиатур, перечисленным в классах названий клавиатур (VKKeyboardName, TGKeyboardName)
+    """
+    names = []
+    for keyboard_name in keyboard_names:
+        for value in constants(keyboard_name):
+            names.extend(value.values() if isinstance(value, dict) else [value])
+    return [name if os.path.exists(name) else os.path.join(KEYBOARD_DIRECTORY, name) for name in dict.fromkeys(names)]
+
+
+def keyboard_labels(path: str) -> list:
+    """
+    Надписи на кнопках клавиатуры vk ({"buttons": [[{"action": {"label": ...}}]]})
+    или telegram ({"keyboard" или "inline_keyboard": [[{"text": ...}]]})
+    """
+    with open(path, encoding="utf-8") as keyboard_file:
+        keyboard = json.load(keyboard_file)
+    rows = keyboard.get("buttons") or keyboard.get("keyboard") or keyboard.get("inline_keyboard") or []
+    labels = []
+    for row in rows:
+        for button in row:
+            label = button.get("action", {}).get("label") if "action" in button else button.get("text")
+            if label:
+                labels.append(label)
+    return labels
+
+
+class ReservedIndex:
+    """Индекс зарезервированных фраз
+
+    Проверка фразы - поиск нормализованного текста в множестве (O(1)). Если max_distance > 0,
+    фразы не короче min_fuzzy_length считаются зарезервированными и с опечаткой: в индексе хранятся
+    варианты фраз без одного символа (symmetric delete), найденный кандидат проверяется
+    расстоянием Дамерау-Левенштейна.
+
+    Attributes
+    ----------
+    vocabulary: list
+        Фразы помимо кнопок и команд (курсы, группы, дни недели)
+    max_distance: int
+        Допустимое количество опечаток, 0 или 1
+    check_interval: float
+        Как часто (в секундах) проверяется время изменения файлов клавиатур
+    """
+    def __init__(self, vocabulary=(), keyboard_names=(VKKeyboardName, TGKeyboardName),
+                 max_distance: int = ReservedSettings.MAX_DISTANCE,
+                 min_fuzzy_length: int = ReservedSettings.MIN_FUZZY_LENGTH,
+                 check_interval: float = ReservedSettings.CHECK_INTERVAL):
+        self.vocabulary = list(vocabulary)
+        self.keyboard_names = keyboard_names
+        self.max_distance = min(max_distance, 1)
+        self.min_fuzzy_length = min_fuzzy_length
+        self.check_interval = check_interval
+        self.phrases = frozenset()
+        self.variants = {}
+        self.mtimes = {}
+        self.checked = 0.0
+        self._lock = threading.Lock()
+        self.build()
+
+    def get_mtimes(self) -> dict:
+        mtimes = {}
+        for path in keyboard_files(*self.keyboard_names):
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def build(self) -> None:
+        mtimes = self.get_mtimes()
+        phrases = set(self.vocabulary)
+        phrases.update(value for value in constants(TextToAnswer) if isinstance(value, str))
+        for path, mtime in mtimes.items():
+            if mtime is None:
+                logger.warning("ReservedIndex.build(): keyboard %s not found", path)
+                continue
+            phrases.update(keyboard_labels(path))
+        phrases = frozenset(filter(None, map(normalize, phrases)))
+
+        variants = {}
+        if self.max_distance:
+            for phrase in phrases:
+                if len(phrase) >= self.min_fuzzy_length:
+                    for variant in deletes(phrase) | {phrase}:
+                        variants.setdefault(variant, []).append(phrase)
+        self.phrases, self.variants, self.mtimes = phrases, variants, mtimes
+        logger.info("ReservedIndex.build(): %s phrases, %s variants", len(phrases), len(variants))
+
+    def refresh(self) -> None:
+        # файлы проверяются не чаще check_interval, перестройка - только если файл изменился
+        if time.monotonic() - self.checked < self.check_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self.checked < self.check_interval:
+                return
+            if self.get_mtimes() != self.mtimes:
+                self.build()
+            self.checked = time.monotonic()
+
+    def is_reserved(self, text: str) -> bool:
+        """
+        Проверка, является ли текст зарезервированной фразой или командой
+
+        Parameters
+        ----------
+        text: str
+            Текст, который нужно проверить
+
+        Returns
+        -------
+        bool
+            True если текст зарезервирован
+        """
+        self.refresh()
+        if text.lower().startswith(COMMAND_PREFIXES):
+            return True
+        text = normalize(text)
+        if text in self.phrases:
+            return True
+        if not self.max_distance or len(text) + 1 < self.min_fuzzy_length:
+            return False
+        for variant in deletes(text) | {text}:
+            for phrase in self.variants.get(variant, ()):
+                if edit_distance(text, phrase, self.max_distance) <= self.max_distance:
+                    return True
+        return False
@@ -0,0 +1,257 @@
+"""
+Защита бота от медленных и недоступных внешних сервисов
+
+Для каждого внешнего сервиса (wolframalpha, Google диск, загрузка изображений в vk) задаются:
+- таймаут запроса;
+- автоматический выключатель (circuit breaker): после failure_threshold ошибок подряд запросы
+  к сервису сразу завершаются ошибкой CircuitOpenError в течение reset_timeout секунд,
+  затем один пробный запрос проверяет, восстановился ли сервис;
+- перегородка (bulkhead): одновременно ждать ответа сервиса могут не больше max_concurrent потоков,
+  остальные ждут свободного места не дольше max_wait секунд и получают BulkheadFullError.
+Поэтому недоступный сервис занимает не больше max_concurrent потоков, а не все потоки бота.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from metrics import Gauge, Counter, external_call
+from settings import ResilienceSettings, logger
+
+
+CIRCUIT_STATE = Gauge("bot_circuit_open", "1 if the circuit breaker of an external service is open", ("service",))
+REJECTED_CALLS = Counter("bot_external_call_rejected_total", "External calls rejected without waiting for the service",
+                         ("service", "reason"))
+
+
+class DependencyUnavailable(Exception):
+    pass
+
+
+class CircuitOpenError(DependencyUnavailable):
+    pass
+
+
+class BulkheadFullError(DependencyUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Автоматический выключатель
+
+    Attributes
+    ----------
+    name: str
+        Название сервиса
+    failure_threshold: int
+        Количество ошибок подряд, после которого выключатель размыкается
+    reset_timeout: float
+        Сколько секунд запросы отклоняются, прежде чем будет выполнен пробный запрос
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0.0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set_function(name, function=lambda: int(self.state != self.CLOSED))
+
+    def before_call(self) -> None:
+        """
+        Проверка, можно ли обратиться к сервису
+
+        Raises
+        ------
+        CircuitOpenError
+            Если выключатель разомкнут или пробный запрос уже выполняется
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened >= self.reset_timeout:
+                self.state = self.HALF_OPEN  # пробный запрос выполняет только этот поток
+                return
+        REJECTED_CALLS.inc(self.name, "circuit_open")
+        raise CircuitOpenError(f"{self.name} is unavailable, circuit breaker is open")
+
+    def cancel_probe(self) -> None:
+        # пробный запрос не был выполнен, следующий запрос снова будет пробным
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("CircuitBreaker: %s recovered, circuit closed", self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("CircuitBreaker: %s failed %s times, circuit opened for %s s",
+                                   self.name, self.failures, self.reset_timeout)
+                self.state = self.OPEN
+                self.opened = time.monotonic()
+
+
+class Bulkhead:
+    """Ограничение количества потоков, одновременно ожидающих сервис
+
+    Attributes
+    ----------
+    name: str
+        Название сервиса
+    max_concurrent: int
+        Максимальное количество одновременных запросов
+    max_wait: float
+        Сколько секунд запрос ждет свободного места
+    """
+    def __init__(self, name: str, max_concurrent: int, max_wait: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def acquire(self) -> None:
+        if not self._slots.acquire(timeout=self.max_wait):
+            REJECTED_CALLS.inc(self.name, "bulkhead_full")
+            raise BulkheadFullError(f"{self.name} is busy, {self.max_concurrent} calls in progress")
+
+    def release(self) -> None:
+        self._slots.release()
+
+
+class Dependency:
+    """Внешний сервис с таймаутом, выключателем и перегородкой
+
+    Attributes
+    ----------
+    name: str
+        Название сервиса (в метриках и логах)
+    timeout: float
+        Таймаут одного запроса в секундах
+    breaker: CircuitBreaker
+    bulkhead: Bulkhead
+    """
+    def __init__(self, name: str, timeout: float, max_concurrent: int,
+                 failure_threshold: int = ResilienceSettings.FAILURE_THRESHOLD,
+                 reset_timeout: float = ResilienceSettings.RESET_TIMEOUT,
+                 max_wait: float = ResilienceSettings.MAX_WAIT):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.bulkhead = Bulkhead(name, max_concurrent, max_wait)
+
+    def enter(self) -> None:
+        self.breaker.before_call()
+        try:
+            self.bulkhead.acquire()
+        except BulkheadFullError:
+            self.breaker.cancel_probe()
+            raise
+
+    @contextmanager
+    def guard(self, method: str):
+        """
+        Обращение к сервису внутри блока with
+
+        Таймаут передает в библиотеку сам вызывающий код (timeout=dependency.timeout),
+        ошибка внутри блока считается ошибкой сервиса
+
+        Parameters
+        ----------
+        method: str
+            Вызываемый метод (в метриках)
+
+        Raises
+        ------
+        CircuitOpenError, BulkheadFullError
+            Если сервис недоступен или занят
+        """
+        self.enter()
+        try:
+            with external_call(self.name, method):
+                yield
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            self.bulkhead.release()
+
+    def call(self, method: str, func, *args, **kwargs):
+        """
+        Вызов функции библиотеки, которая не поддерживает таймаут
+
+        Функция выполняется в отдельном потоке, вызывающий поток ждет ее не дольше timeout.
+        Место в перегородке освобождается, только когда функция действительно завершится,
+        поэтому зависшие запросы не дают создавать новые потоки без ограничения.
+
+        Raises
+        ------
+        TimeoutError
+            Если функция не завершилась за timeout секунд
+        CircuitOpenError, BulkheadFullError
+            Если сервис недоступен или занят
+        """
+        self.enter()
+        result = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                result["value"] = func(*args, **kwargs)
+            except BaseException as error:
+                result["error"] = error
+            finally:
+                self.bulkhead.release()
+                done.set()
+
+        with external_call(self.name, method):
+            threading.Thread(target=target, name=f"{self.name}-{method}", daemon=True).start()
+            if not done.wait(self.timeout):
+                self.breaker.record_failure()
+                raise TimeoutError(f"{self.name}.{method} did not respond in {self.timeout} s")
+            if "error" in result:
+                self.breaker.record_failure()
+                raise result["error"]
+        self.breaker.record_success()
+        return result["value"]
+
+
+def with_timeout(session: requests.Session, timeout: float) -> requests.Session:
+    """
+    Таймаут по умолчанию для всех запросов сессии requests (у requests его нет)
+
+    Returns
+    -------
+    requests.Session
+        Та же сессия
+    """
+    request = session.request
+
+    def request_with_timeout(method, url, **kwargs):
+        kwargs.setdefault("timeout", timeout)
+        return request(method, url, **kwargs)
+
+    session.request = request_with_timeout
+    return session
+
+
+WOLFRAMALPHA = Dependency("wolframalpha", ResilienceSettings.WOLFRAMALPHA_TIMEOUT,
+                          ResilienceSettings.WOLFRAMALPHA_CONCURRENCY)
+GOOGLE_DRIVE = Dependency("google_drive", ResilienceSettings.GOOGLE_DRIVE_TIMEOUT,
+                          ResilienceSettings.GOOGLE_DRIVE_CONCURRENCY)
+VK_UPLOAD = Dependency("vk_upload", ResilienceSettings.VK_UPLOAD_TIMEOUT, ResilienceSettings.VK_UPLOAD_CONCURRENCY)
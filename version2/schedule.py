@@ -1,6 +1,7 @@
+import threading
 from abc import ABCMeta, abstractmethod, ABC
 
-from file_loader import PandasLoader
+from file_loader import PandasLoader, modified_time
 from settings import logger
 
 
@@ -13,8 +14,23 @@ class ISchedule(ABC):
 
 
 class PandasSchedule(ISchedule):
+    """Расписание группы из excel файла
+
+    Страница курса загружается один раз на процесс и заново - только если локальный файл изменился,
+    а готовый текст расписания на день запоминается для каждой группы (см. compile).
+
+    Attributes
+    ----------
+    schedule: pandas.core.frame.DataFrame
+        Страница курса
+    rendered: dict
+        (номер группы, день) -> текст расписания, общий для всех объектов страницы
+    """
+    sheets = {}  # (filename, course) -> (время изменения файла, страница, тексты расписаний)
+    _sheets_lock = threading.Lock()
+
     def __init__(self, filename: str, course: str, group: str):
-        self.schedule = PandasLoader().get_excel(filename, course)
+        self.schedule, self.rendered = self.load(filename, course)
         self.group_num = int(group[-1])
         self.day_case = {
             "понедельник": "понедельник",
@@ -25,9 +41,57 @@ class PandasSchedule(ISchedule):
             "суббота": "субботу"}
         self.days = list(self.day_case.keys())
 
+    @classmethod
+    def load(cls, filename: str, course: str) -> tuple:
+        key = (filename, course)
+        cached = cls.sheets.get(key)
+        if cached is not None and cached[0] == modified_time(filename, ".xlsx"):
+            return cached[1:]
+        with cls._sheets_lock:
+            cached = cls.sheets.get(key)
+            if cached is not None and cached[0] == modified_time(filename, ".xlsx"):
+                return cached[1:]
+            schedule = PandasLoader().get_excel(filename, course)
+            cls.sheets[key] = (modified_time(filename, ".xlsx"), schedule, {})
+            return schedule, cls.sheets[key][2]
+
+    @classmethod
+    def compile(cls, filename: str, course: str, groups: list) -> int:
+        """
+        Загрузка страницы курса и подготовка расписаний групп на все дни
+
+        Parameters
+        ----------
+        filename: str
+            Файл расписания
+        course: str
+            Курс (страница файла)
+        groups: list
+            Названия групп курса
+
+        Returns
+        -------
+        int
+            Количество подготовленных расписаний
+        """
+        compiled = 0
+        for group in groups:
+            group_schedule = cls(filename, course, group)
+            if group_schedule.schedule is None:
+                return 0
+            for day in group_schedule.days:
+                group_schedule.get_schedule_str(day)
+                compiled += 1
+        return compiled
+
     def get_schedule_str(self, day: str) -> str:
         if self.schedule is None:
             return "Произошла ошибка на сервере, расписание недоступно"
+        if (day_sch := self.rendered.get((self.group_num, day))) is None:
+            day_sch = self.rendered[self.group_num, day] = self.render(day)
+        return day_sch
+
+    def render(self, day: str) -> str:
         day_sch = f"Расписание на {self.day_case[day]}\n"
         max_pairs_in_day = 8
         for i in range(self.days.index(day) * max_pairs_in_day + 1, (self.days.index(day) + 1) * max_pairs_in_day):
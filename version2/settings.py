@@ -4,22 +4,8 @@ from typing import NamedTuple
 
 from dotenv import load_dotenv
 
-from keyboard import VkKeyboard
-
-
-logging.basicConfig(
-    filename='debug.log',
-    filemode='w',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-logger = logging.getLogger(__name__)
-f_handler = logging.FileHandler(filename='errors.log', mode='w')
-f_handler.setLevel(logging.WARNING)
-f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-f_handler.setFormatter(f_format)
-logger.addHandler(f_handler)
+from keyboard import VkKeyboard, TgKeyboard
+from logs import setup_logging
 
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -27,12 +13,30 @@ if os.path.exists(dotenv_path):
     load_dotenv(dotenv_path)
 
 
+class LogSettings(NamedTuple):
+    LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+    FILENAME = os.environ.get("LOG_FILENAME", "debug.log")
+    ERRORS_FILENAME = os.environ.get("LOG_ERRORS_FILENAME", "errors.log")
+    MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+    BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+    QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+    # доля сохраняемых отладочных записей по функции или логгеру, например "get_answer_text=0.01,settings=0.1"
+    SAMPLE = os.environ.get("LOG_SAMPLE", "")
+    SAMPLE_DEFAULT = float(os.environ.get("LOG_SAMPLE_DEFAULT", 1))
+
+
+setup_logging(LogSettings)
+logger = logging.getLogger(__name__)
+
+
 class PostgresSQLSettings(NamedTuple):
     DB_NAME = os.environ.get("DB_NAME")
     DB_USERNAME = os.environ.get("DB_USERNAME")
     DB_PASSWORD = os.environ.get("DB_PASSWORD")
     DB_HOST = os.environ.get("DB_HOST")
     DB_PORT = os.environ.get("DB_PORT")
+    POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+    POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
 
 
 class GoogleAPISettings(NamedTuple):
@@ -46,6 +50,112 @@ class WolframalphaAPISettings(NamedTuple):
     TOKEN = os.environ.get("WOLFRAMALPHA_TOKEN")
 
 
+class CacheSettings(NamedTuple):
+    FILENAME = os.environ.get("CACHE_FILENAME", "cache.sqlite3")
+    QUERY_MEMORY_SIZE = int(os.environ.get("QUERY_CACHE_MEMORY_SIZE", 1000))
+    QUERY_DISK_SIZE = int(os.environ.get("QUERY_CACHE_DISK_SIZE", 100000))
+    QUERY_TTL = int(os.environ.get("QUERY_CACHE_TTL", 30 * 24 * 60 * 60))
+    PLOT_DIR = os.environ.get("PLOT_CACHE_DIR", "plots")
+    PLOT_MAX_FILES = int(os.environ.get("PLOT_CACHE_MAX_FILES", 1000))
+    PLOT_TTL = int(os.environ.get("PLOT_CACHE_TTL", 30 * 24 * 60 * 60))
+
+
+class GraphSettings(NamedTuple):
+    WORKERS = int(os.environ.get("GRAPH_WORKERS", 2))
+    TIMEOUT = float(os.environ.get("GRAPH_TIMEOUT", 10))
+    POINTS = int(os.environ.get("GRAPH_POINTS", 500))
+    LIMIT = float(os.environ.get("GRAPH_LIMIT", 10))
+
+
+class ProfilerSettings(NamedTuple):
+    INTERVAL = float(os.environ.get("PROFILER_INTERVAL", 0.01))  # период чтения стеков, секунды
+    DEFAULT_SECONDS = int(os.environ.get("PROFILER_DEFAULT_SECONDS", 30))
+    MAX_SECONDS = int(os.environ.get("PROFILER_MAX_SECONDS", 300))
+    DIRECTORY = os.environ.get("PROFILER_DIRECTORY", "profiles")
+    TOP = int(os.environ.get("PROFILER_TOP", 30))
+    TRACEMALLOC_FRAMES = int(os.environ.get("PROFILER_TRACEMALLOC_FRAMES", 1))
+
+
+class MigrationSettings(NamedTuple):
+    TABLE = os.environ.get("DB_SCHEMA_VERSION", "schema_version")
+    BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", 10000))  # строк в одной транзакции при конвертации
+    # часовой пояс, в котором записаны старые значения datetime TEXT, пусто - часовой пояс сессии PostgreSQL
+    LEGACY_TIMEZONE = os.environ.get("MIGRATION_LEGACY_TIMEZONE", "")
+
+
+class MessageLogSettings(NamedTuple):
+    PREMAKE_MONTHS = int(os.environ.get("MESSAGES_PREMAKE_MONTHS", 2))  # секции создаются заранее
+    RETENTION_MONTHS = int(os.environ.get("MESSAGES_RETENTION_MONTHS", 12))  # 0 - хранить всегда
+    RETENTION_MODE = os.environ.get("MESSAGES_RETENTION_MODE", "archive")  # archive, drop
+    ARCHIVE_DIRECTORY = os.environ.get("MESSAGES_ARCHIVE_DIRECTORY", "archive")
+    MAINTENANCE_INTERVAL = float(os.environ.get("MESSAGES_MAINTENANCE_INTERVAL", 6 * 60 * 60))
+    RECENT_IDS = int(os.environ.get("MESSAGES_RECENT_IDS", 10000))  # id последних сообщений для отбрасывания повторов
+    DEDUP_WINDOW = float(os.environ.get("MESSAGES_DEDUP_WINDOW", 24))  # часов, повтор ищется и в базе данных
+    BATCH_SIZE = int(os.environ.get("MESSAGES_BATCH_SIZE", 100))
+    FLUSH_INTERVAL = float(os.environ.get("MESSAGES_FLUSH_INTERVAL", 0.5))
+    MAX_PENDING = int(os.environ.get("MESSAGES_MAX_PENDING", 100000))  # при недоступной базе данных
+
+
+class StatsSettings(NamedTuple):
+    FLUSH_INTERVAL = float(os.environ.get("STATS_FLUSH_INTERVAL", 10))  # период записи счетчиков, секунды
+    DEFAULT_DAYS = int(os.environ.get("STATS_DEFAULT_DAYS", 7))
+    MAX_DAYS = int(os.environ.get("STATS_MAX_DAYS", 90))
+    TOP_COMMANDS = int(os.environ.get("STATS_TOP_COMMANDS", 10))
+
+
+class FuzzySettings(NamedTuple):
+    # не меньше pg_trgm.similarity_threshold (0.3 по умолчанию), иначе часть вариантов отсекает индекс
+    THRESHOLD = float(os.environ.get("FUZZY_THRESHOLD", 0.5))
+    MIN_LENGTH = int(os.environ.get("FUZZY_MIN_LENGTH", 4))  # у коротких сообщений мало триграмм
+
+
+class ReservedSettings(NamedTuple):
+    MAX_DISTANCE = int(os.environ.get("RESERVED_MAX_DISTANCE", 1))  # допустимые опечатки, 0 - только точное совпадение
+    MIN_FUZZY_LENGTH = int(os.environ.get("RESERVED_MIN_FUZZY_LENGTH", 6))
+    CHECK_INTERVAL = float(os.environ.get("RESERVED_CHECK_INTERVAL", 10))  # проверка изменения клавиатур, секунды
+
+
+class MetricsSettings(NamedTuple):
+    HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+    PORT = int(os.environ.get("METRICS_PORT", 9108))  # 0 - не запускать http сервер метрик
+
+
+class TracingSettings(NamedTuple):
+    EXPORTER = os.environ.get("TRACING_EXPORTER", "jsonl")  # jsonl, otlp, none
+    FILENAME = os.environ.get("TRACING_FILENAME", "traces.jsonl")
+    OTLP_ENDPOINT = os.environ.get("TRACING_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+    SERVICE_NAME = os.environ.get("TRACING_SERVICE_NAME", "bot")
+    SLOW_MS = float(os.environ.get("TRACING_SLOW_MS", 1000))  # более медленные трассы сохраняются всегда
+    SAMPLE_RATE = float(os.environ.get("TRACING_SAMPLE_RATE", 0))
+    MAX_SPANS = int(os.environ.get("TRACING_MAX_SPANS", 500))
+
+
+class ResilienceSettings(NamedTuple):
+    FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5))  # ошибок подряд до размыкания
+    RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", 30))
+    MAX_WAIT = float(os.environ.get("BULKHEAD_MAX_WAIT", 1))
+    WOLFRAMALPHA_TIMEOUT = float(os.environ.get("WOLFRAMALPHA_TIMEOUT", 15))
+    WOLFRAMALPHA_CONCURRENCY = int(os.environ.get("WOLFRAMALPHA_CONCURRENCY", 4))
+    GOOGLE_DRIVE_TIMEOUT = float(os.environ.get("GOOGLE_DRIVE_TIMEOUT", 30))
+    GOOGLE_DRIVE_CONCURRENCY = int(os.environ.get("GOOGLE_DRIVE_CONCURRENCY", 4))
+    VK_UPLOAD_TIMEOUT = float(os.environ.get("VK_UPLOAD_TIMEOUT", 20))
+    VK_UPLOAD_CONCURRENCY = int(os.environ.get("VK_UPLOAD_CONCURRENCY", 4))
+
+
+class FloodSettings(NamedTuple):
+    RATE = float(os.environ.get("FLOOD_RATE", 1))  # сообщений в секунду от одного пользователя, 0 - без ограничения
+    BURST = float(os.environ.get("FLOOD_BURST", 5))
+    MAX_PEERS = int(os.environ.get("FLOOD_MAX_PEERS", 100000))
+    NOTICE = int(os.environ.get("FLOOD_NOTICE", 1))  # 0 - отбрасывать сообщения без уведомления
+
+
+class WarmupSettings(NamedTuple):
+    ENABLED = int(os.environ.get("BOT_WARMUP", 1))  # 0 - не прогревать при запуске
+    WORKERS = int(os.environ.get("BOT_WARMUP_WORKERS", 4))
+    TIMEOUT = float(os.environ.get("BOT_WARMUP_TIMEOUT", 120))
+    READY_FILE = os.environ.get("BOT_READY_FILE", "")  # пустая строка - файл готовности не создается
+
+
 class FileName(NamedTuple):
     LINKS = {
         "1 курс": "1 курс.csv",
@@ -54,7 +164,6 @@ class FileName(NamedTuple):
         "4 курс": "4 курс.csv"
     }
     SCHEDULE = "Raspisanie_VESNA_2021.xlsx"
-    GRAPH = "graph.jpg"
     FILTER = "filter.php"
 
 
@@ -63,6 +172,32 @@ class VKSettings(NamedTuple):
     TOKEN = os.environ.get("VK_TOKEN")
 
 
+class VKSenderSettings(NamedTuple):
+    RATE = float(os.environ.get("VK_RATE_LIMIT", 20))  # запросов в секунду, для ключа сообщества - 20
+    LINGER = float(os.environ.get("VK_SEND_LINGER", 0.05))
+    MAX_CODE_SIZE = int(os.environ.get("VK_EXECUTE_MAX_CODE_SIZE", 60000))
+    RETRY_ATTEMPTS = int(os.environ.get("VK_SEND_RETRY_ATTEMPTS", 3))  # всего попыток для временных ошибок
+    RETRY_DELAY = float(os.environ.get("VK_SEND_RETRY_DELAY", 1))  # задержка перед первым повтором, дальше вдвое больше
+
+
+class IngressSettings(NamedTuple):
+    MODE = os.environ.get("VK_INGRESS", "user_longpoll")  # user_longpoll, bots_longpoll, callback, fake
+    WORKERS = int(os.environ.get("VK_WORKERS", 1))  # больше 1 - сообщения обрабатываются в нескольких процессах
+    QUEUE_SIZE = int(os.environ.get("VK_WORKER_QUEUE_SIZE", 1000))
+    MAX_ATTEMPTS = int(os.environ.get("VK_WORKER_MAX_ATTEMPTS", 3))
+    RESTART_DELAY = float(os.environ.get("VK_WORKER_RESTART_DELAY", 1))
+    GROUP_ID = os.environ.get("VK_GROUP_ID")
+    CALLBACK_HOST = os.environ.get("VK_CALLBACK_HOST", "0.0.0.0")
+    CALLBACK_PORT = int(os.environ.get("VK_CALLBACK_PORT", 8080))
+    CALLBACK_CONFIRMATION = os.environ.get("VK_CALLBACK_CONFIRMATION")
+    CALLBACK_SECRET = os.environ.get("VK_CALLBACK_SECRET")
+
+
+class BroadcastSettings(NamedTuple):
+    CHUNK_SIZE = int(os.environ.get("BROADCAST_CHUNK_SIZE", 100))  # не больше 100 получателей в messages.send
+    PROGRESS_EVERY = int(os.environ.get("BROADCAST_PROGRESS_EVERY", 1000))
+
+
 class VKTableName(NamedTuple):
     REG_INFO = os.environ.get("DB_VK_REG_INFO")
     USERS = os.environ.get("DB_VK_USERS")
@@ -70,8 +205,13 @@ class VKTableName(NamedTuple):
     CUSTOM_ANSWERS = os.environ.get("DB_CUSTOM")
     COMMANDS = os.environ.get("DB_COMMANDS")
     PHOTO_LINKS = os.environ.get("DB_PHOTO")
+    PHOTO_ATTACHMENTS = os.environ.get("DB_VK_PHOTO_ATTACHMENTS")
+    BROADCASTS = os.environ.get("DB_VK_BROADCASTS")
     USER_STATUS = os.environ.get("DB_VK_USER_STATUS")
     BAN_LIST = os.environ.get("DB_VK_BAN")
+    STATS_DAILY = os.environ.get("DB_VK_STATS_DAILY")
+    STATS_DAILY_USERS = os.environ.get("DB_VK_STATS_DAILY_USERS")
+    STATS_COMMANDS = os.environ.get("DB_VK_STATS_COMMANDS")
 
 
 class VKKeyboardName(NamedTuple):
@@ -103,6 +243,60 @@ class PlatformVK(NamedTuple):
     table_name = VKTableName
 
 
+class TGSettings(NamedTuple):
+    ADMINS = [int(item) for item in os.environ.get("TG_ADMINS", "").split(',') if item]
+    TOKEN = os.environ.get("TG_TOKEN")
+    RATE = float(os.environ.get("TG_RATE_LIMIT", 30))  # сообщений в секунду для всех чатов
+    WORKERS = int(os.environ.get("TG_WORKERS", 8))
+    BATCH_SIZE = int(os.environ.get("TG_BATCH_SIZE", 100))  # не больше 100 обновлений в getUpdates
+    POLL_TIMEOUT = int(os.environ.get("TG_POLL_TIMEOUT", 25))
+
+
+class TGTableName(NamedTuple):
+    REG_INFO = os.environ.get("DB_TG_REG_INFO")
+    USERS = os.environ.get("DB_TG_USERS")
+    MESSAGES = os.environ.get("DB_TG_MESSAGES")
+    CUSTOM_ANSWERS = os.environ.get("DB_CUSTOM")
+    COMMANDS = os.environ.get("DB_COMMANDS")
+    PHOTO_LINKS = os.environ.get("DB_PHOTO")
+    PHOTO_ATTACHMENTS = os.environ.get("DB_TG_PHOTO_ATTACHMENTS")
+    BROADCASTS = os.environ.get("DB_TG_BROADCASTS")
+    USER_STATUS = os.environ.get("DB_TG_USER_STATUS")
+    BAN_LIST = os.environ.get("DB_TG_BAN")
+    STATS_DAILY = os.environ.get("DB_TG_STATS_DAILY")
+    STATS_DAILY_USERS = os.environ.get("DB_TG_STATS_DAILY_USERS")
+    STATS_COMMANDS = os.environ.get("DB_TG_STATS_COMMANDS")
+
+
+class TGKeyboardName(NamedTuple):
+    START = {
+        "start1": "tg_start_keyboard.json",
+        "start2": "tg_other_keyboard.json"
+    }
+    COURSES = "tg_courses_keyboard.json"
+    GROUPS = {
+        "1 курс": "tg_course1_keyboard.json",
+        "2 курс": "tg_course2_keyboard.json",
+        "3 курс": "tg_course3_keyboard.json",
+        "4 курс": "tg_course4_keyboard.json"
+    }
+    LECTURES = {
+        "1 курс": "tg_lectures_keyboard1.json",
+        "2 курс": "tg_lectures_keyboard2.json",
+        "3 курс": "tg_lectures_keyboard3.json",
+        "4 курс": "tg_lectures_keyboard4.json"
+    }
+    DAYS = "tg_days_keyboard.json"
+    VAR_NUM = "tg_dimensions.json"
+
+
+class PlatformTG(NamedTuple):
+    settings = TGSettings
+    keyboard = TgKeyboard
+    keyboard_name = TGKeyboardName
+    table_name = TGTableName
+
+
 class UserStatus(NamedTuple):
     ANY = "any"
     REG_COURSE = "reg_course"
@@ -134,7 +328,11 @@ class TextToAnswer(NamedTuple):
     QUERY = "запрос"
     GRAPH = "график"
     BAN = "ban "
+    UNBAN = "unban "
     TEACH = "обучить бота"
+    BROADCAST = "рассылка"
+    PROFILE = "профиль"
+    STATS = "статистика"
 
 
 class AnswerKey(NamedTuple):
@@ -143,6 +341,9 @@ class AnswerKey(NamedTuple):
     PHOTO_LINK = "photo_link"
     DEFAULT_KEYBOARD = "default_keyboard"
     PHOTO_FILE = "photo_file"
+    PHOTO_DATA = "photo_data"
+    BACKGROUND_TASK = "background_task"
+    HANDLER = "handler"
 
 
 class AnswerValue(NamedTuple):
@@ -200,3 +401,20 @@ class AnswerValue(NamedTuple):
     CUSTOM_ANSWER = "Напишите фразу, которой бот будет отвечать на введённую вами ранее"
     CUSTOM_FINISH = "Вы успешно обучили бота"
 
+    # broadcast
+    BROADCAST_USAGE = "Формат рассылки:\nрассылка <все / курс / группа>\n<текст сообщения>"
+    BROADCAST_WRONG_TARGET = "Курс или группа не найдены"
+    BROADCAST_STARTED = "Рассылка {} запущена"
+    BROADCAST_PROGRESS = "Рассылка {}: отправлено {} сообщений"
+    BROADCAST_FINISH = "Рассылка {} завершена, отправлено {} сообщений"
+    PROFILE_USAGE = "Формат:\nпрофиль <секунды, не больше {}>"
+    PROFILE_STARTED = "Профилирование запущено на {} с"
+    PROFILE_BUSY = "Профилирование уже выполняется"
+    PROFILE_FINISH = "Профилирование завершено, замеров: {}\n\nФункции:\n{}\n\nПамять:\n{}\n\nФайлы:\n{}\n{}"
+    STATS_USAGE = "Формат:\nстатистика <количество дней, не больше {}>"
+    STATS_DAY = "{}: {} польз., {} сообщ."
+    STATS_ANSWER = "Статистика за {} дн.\n\n{}\n\nЧастые команды:\n{}"
+    STATS_EMPTY = "нет данных"
+    SLOW_DOWN = "Вы отправляете сообщения слишком часто, подождите несколько секунд"
+    SERVICE_UNAVAILABLE = "Сервис временно недоступен, попробуйте позже"
+
@@ -0,0 +1,240 @@
+"""
+Статистика использования бота
+
+Каждое сообщение учитывается в памяти процесса (StatsCollector.record), а фоновый поток
+раз в FLUSH_INTERVAL секунд добавляет накопленные значения в таблицы по дням одним запросом:
+STATS_DAILY (сообщения и активные пользователи за день), STATS_DAILY_USERS (кто писал в этот день,
+нужна для подсчета уникальных пользователей) и STATS_COMMANDS (ответы обработчиков за день).
+Отчет администратору читает только строки за запрошенные дни, а не журнал сообщений.
+"""
+import collections
+import datetime
+import multiprocessing.util
+import os
+import threading
+
+from psycopg2 import sql
+
+from metrics import Counter, Gauge
+from postgres import PostgreSQL
+from settings import StatsSettings, logger
+
+
+MESSAGES = Counter("bot_messages_total", "Incoming messages", ("platform",))
+COMMANDS = Counter("bot_commands_total", "Incoming messages by Answerer handler that answered", ("platform", "command"))
+DAILY_ACTIVE_USERS = Gauge("bot_daily_active_users", "Users who wrote to the bot today (UTC)", ("platform",))
+
+NO_ANSWER = "not_found"
+
+
+class StatsCollector:
+    """Накопление статистики в памяти процесса и пакетная запись в базу данных
+
+    Для каждой платформы в процессе используется один объект (см. get)
+
+    Attributes
+    ----------
+    TableName: VKTableName или TGTableName
+        Названия таблиц платформы
+    platform: str
+        Название платформы в метриках
+    flush_interval: float
+        Период записи в базу данных в секундах
+    """
+    collectors = {}
+    _collectors_lock = threading.Lock()
+
+    def __init__(self, table_name, platform: str, flush_interval: float = StatsSettings.FLUSH_INTERVAL):
+        self.SQL = PostgreSQL
+        self.TableName = table_name
+        self.platform = platform
+        self.flush_interval = flush_interval
+        self.messages = collections.Counter()
+        self.users = set()
+        self.commands = collections.Counter()
+        self.active_users = 0
+        self.pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        DAILY_ACTIVE_USERS.set_function(platform, function=lambda: self.active_users)
+
+    @classmethod
+    def get(cls, table_name, platform: str) -> "StatsCollector":
+        with cls._collectors_lock:
+            if (collector := cls.collectors.get(platform)) is None:
+                collector = cls.collectors[platform] = cls(table_name, platform)
+            return collector
+
+    def record(self, user_id: int, command: str = None) -> None:
+        """
+        Учет входящего сообщения
+
+        Parameters
+        ----------
+        user_id: int
+            id пользователя
+        command: str, default None
+            Обработчик Answerer, ответивший на сообщение, None - ответа не было
+
+        Returns
+        -------
+        None
+        """
+        day = datetime.datetime.now(datetime.timezone.utc).date()
+        command = command or NO_ANSWER
+        MESSAGES.inc(self.platform)
+        COMMANDS.inc(self.platform, command)
+        with self._lock:
+            self.messages[day] += 1
+            self.users.add((day, user_id))
+            self.commands[day, command] += 1
+        self.start()
+
+    def start(self) -> None:
+        # поток записи создается при первом сообщении и заново в каждом процессе после fork
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            if self.pid is not None:  # накопленное родительским процессом записывает родитель
+                self.messages, self.users, self.commands = collections.Counter(), set(), collections.Counter()
+            self.pid = os.getpid()
+        threading.Thread(target=self.loop, name=f"stats-{self.platform}", daemon=True).start()
+        # процессы multiprocessing завершаются без atexit, поэтому запись при выходе регистрируется финализатором
+        multiprocessing.util.Finalize(self, self.try_flush, exitpriority=10)
+
+    def loop(self) -> None:
+        stop = threading.Event()
+        while not stop.wait(self.flush_interval):
+            self.try_flush()
+
+    def try_flush(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.error("StatsCollector.flush(): Exception occurred", exc_info=True)
+
+    def flush(self) -> None:
+        """
+        Запись накопленной статистики
+
+        Счетчики дня увеличиваются одним запросом INSERT ... ON CONFLICT DO UPDATE, а число активных
+        пользователей увеличивается только на тех, кого еще не было в STATS_DAILY_USERS за этот день.
+        Если запись не удалась, значения возвращаются в счетчики и записываются при следующей попытке.
+
+        Returns
+        -------
+        None
+        """
+        with self._flush_lock:
+            with self._lock:
+                messages, users, commands = self.messages, self.users, self.commands
+                self.messages, self.users, self.commands = collections.Counter(), set(), collections.Counter()
+            if not messages:
+                return
+            try:
+                self.write(messages, users, commands)
+            except Exception:
+                with self._lock:
+                    self.messages.update(messages)
+                    self.users.update(users)
+                    self.commands.update(commands)
+                raise
+            self.active_users = self.get_active_users(datetime.datetime.now(datetime.timezone.utc).date())
+
+    def write(self, messages: collections.Counter, users: set, commands: collections.Counter) -> None:
+        self.SQL().execute_query(sql.SQL("""
+        WITH new_users AS (
+            INSERT INTO {daily_users} (day, user_id)
+            VALUES {user_rows}
+            ON CONFLICT DO NOTHING
+            RETURNING day
+        ), user_counts AS (
+            SELECT day, COUNT(*) AS users FROM new_users GROUP BY day
+        ), message_counts (day, messages) AS (
+            VALUES {message_rows}
+        ), daily_counts AS (
+            INSERT INTO {daily} (day, messages, active_users)
+            SELECT message_counts.day::DATE, message_counts.messages, COALESCE(user_counts.users, 0)
+            FROM message_counts LEFT JOIN user_counts ON user_counts.day = message_counts.day::DATE
+            ON CONFLICT (day) DO UPDATE SET
+                messages = {daily}.messages + EXCLUDED.messages,
+                active_users = {daily}.active_users + EXCLUDED.active_users
+        )
+        INSERT INTO {commands} (day, command, count)
+        VALUES {command_rows}
+        ON CONFLICT (day, command) DO UPDATE SET count = {commands}.count + EXCLUDED.count;
+        """).format(
+            daily=sql.Identifier(self.TableName.STATS_DAILY),
+            daily_users=sql.Identifier(self.TableName.STATS_DAILY_USERS),
+            commands=sql.Identifier(self.TableName.STATS_COMMANDS),
+            user_rows=sql.SQL(", ").join(
+                sql.SQL("({}, {})").format(sql.Literal(day), sql.Literal(user_id)) for day, user_id in users),
+            message_rows=sql.SQL(", ").join(
+                sql.SQL("({}, {})").format(sql.Literal(day), sql.Literal(count)) for day, count in messages.items()),
+            command_rows=sql.SQL(", ").join(
+                sql.SQL("({}, {}, {})").format(sql.Literal(day), sql.Literal(command), sql.Literal(count))
+                for (day, command), count in commands.items())
+        ))
+
+    def get_active_users(self, day: datetime.date) -> int:
+        query = sql.SQL("SELECT active_users FROM {daily} WHERE day = {day};").format(
+            daily=sql.Identifier(self.TableName.STATS_DAILY),
+            day=sql.Literal(day)
+        )
+        row = self.SQL().execute_read_query(query, one=True)
+        return row[0] if row else 0
+
+
+class SQLStats:
+    """Чтение статистики для отчета администратору"""
+    def __init__(self, table_name):
+        self.SQL = PostgreSQL
+        self.TableName = table_name
+
+    def get_daily(self, days: int) -> list:
+        """
+        Сообщения и активные пользователи по дням
+
+        Parameters
+        ----------
+        days: int
+            Количество последних дней, включая сегодняшний
+
+        Returns
+        -------
+        list
+            Кортежи (день, активные пользователи, сообщения) по убыванию дня
+        """
+        query = sql.SQL("""
+        SELECT day, active_users, messages FROM {daily}
+        WHERE day > (NOW() AT TIME ZONE 'UTC')::DATE - {days}
+        ORDER BY day DESC;
+        """).format(
+            daily=sql.Identifier(self.TableName.STATS_DAILY),
+            days=sql.Literal(days)
+        )
+        return self.SQL().execute_read_query(query) or []
+
+    def get_top_commands(self, days: int, limit: int = StatsSettings.TOP_COMMANDS) -> list:
+        """
+        Самые частые обработчики за последние дни
+
+        Returns
+        -------
+        list
+            Кортежи (обработчик, количество) по убыванию количества
+        """
+        query = sql.SQL("""
+        SELECT command, SUM(count) AS total FROM {commands}
+        WHERE day > (NOW() AT TIME ZONE 'UTC')::DATE - {days}
+        GROUP BY command
+        ORDER BY total DESC
+        LIMIT {limit};
+        """).format(
+            commands=sql.Identifier(self.TableName.STATS_COMMANDS),
+            days=sql.Literal(days),
+            limit=sql.Literal(limit)
+        )
+        return self.SQL().execute_read_query(query) or []
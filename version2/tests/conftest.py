@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# модули бота импортируются по имени из папки version2, settings требует список администраторов
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("VK_ADMINS", "1")
+os.environ.setdefault("LOG_FILENAME", os.path.join(tempfile.gettempdir(), "bot_tests_debug.log"))
+os.environ.setdefault("LOG_ERRORS_FILENAME", os.path.join(tempfile.gettempdir(), "bot_tests_errors.log"))
+os.environ.setdefault("METRICS_PORT", "0")
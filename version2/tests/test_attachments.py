@@ -0,0 +1,59 @@
+import pytest
+
+from attachments import SQLAttachments
+from cache import MemoryCache
+
+
+class TableVK:
+    PHOTO_ATTACHMENTS = "vk_photo_attachments"
+
+
+class TableTG:
+    PHOTO_ATTACHMENTS = "tg_photo_attachments"
+
+
+class FakeSQL:
+    """База данных без сохраненных вложений, считающая запросы на чтение"""
+    reads = 0
+
+    def execute_query(self, query) -> None:
+        pass
+
+    def execute_read_query(self, query, one: bool = False):
+        FakeSQL.reads += 1
+        return None
+
+
+@pytest.fixture(autouse=True)
+def memory(monkeypatch):
+    memory = MemoryCache(max_size=100)
+    monkeypatch.setattr(SQLAttachments, "memory", memory)
+    monkeypatch.setattr(FakeSQL, "reads", 0)
+    return memory
+
+
+def make_attachments(table) -> SQLAttachments:
+    attachments = SQLAttachments(table)
+    attachments.SQL = FakeSQL
+    return attachments
+
+
+def test_platforms_do_not_share_cached_attachments():
+    vk, tg = make_attachments(TableVK), make_attachments(TableTG)
+    key = SQLAttachments.url_key("https://example.com/schedule.png")
+    vk.add_attachment(key, "photo1_2")
+    tg.add_attachment(key, "AgACAgIAAxkBAAI")
+    assert vk.get_attachment(key) == "photo1_2"
+    assert tg.get_attachment(key) == "AgACAgIAAxkBAAI"
+    assert FakeSQL.reads == 0
+
+
+def test_delete_keeps_other_platform():
+    vk, tg = make_attachments(TableVK), make_attachments(TableTG)
+    key = SQLAttachments.data_key(b"image")
+    vk.add_attachment(key, "photo1_2")
+    tg.add_attachment(key, "AgACAgIAAxkBAAI")
+    vk.delete_attachment(key)
+    assert vk.get_attachment(key) is None
+    assert FakeSQL.reads == 1
+    assert tg.get_attachment(key) == "AgACAgIAAxkBAAI"
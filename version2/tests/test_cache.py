@@ -0,0 +1,54 @@
+import threading
+
+from cache import MemoryCache, SQLiteCache, TieredCache, normalize_key
+
+
+def test_normalize_key_collapses_whitespace():
+    assert normalize_key("  integrate   x^2\n dx ") == "integrate x^2 dx"
+
+
+def test_normalize_key_keeps_case():
+    assert normalize_key("Convert 5 Mm to km") != normalize_key("convert 5 mm to km")
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_sqlite_cache_delete(tmp_path):
+    cache = SQLiteCache(filename=str(tmp_path / "cache.sqlite3"))
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    cache.delete("key")
+    assert cache.get("key") is None
+
+
+def test_sqlite_cache_delete_logs_error(tmp_path):
+    cache = SQLiteCache(filename=str(tmp_path / "missing" / "cache.sqlite3"))
+    cache.delete("key")  # файл не открывается, ошибка только пишется в лог
+
+
+def test_tiered_cache_counts_concurrent_requests(tmp_path):
+    cache = TieredCache(memory=MemoryCache(), disk=SQLiteCache(filename=str(tmp_path / "cache.sqlite3")))
+    cache.set("hit", 1)
+
+    def worker():
+        for _ in range(500):
+            cache.get("hit")
+            cache.get("miss")
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats["hits"] == 2000
+    assert stats["misses"] == 2000
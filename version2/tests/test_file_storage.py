@@ -0,0 +1,57 @@
+import os
+
+import pytest
+from googleapiclient import http
+
+import file_storage
+from file_storage import GoogleAPI
+from resilience import Dependency
+
+
+class FakeFiles:
+    def get_media(self, fileId: str) -> str:
+        return fileId
+
+
+class FakeService:
+    def files(self) -> FakeFiles:
+        return FakeFiles()
+
+
+class FakeDownload:
+    """Записывает содержимое по частям, на части "error" падает как оборвавшееся соединение"""
+    chunks = {"new": [b"new ", b"content"], "broken": [b"partial ", "error"]}
+
+    def __init__(self, fh, request: str):
+        self.fh = fh
+        self.chunks = list(FakeDownload.chunks[request])
+
+    def next_chunk(self):
+        chunk = self.chunks.pop(0)
+        if chunk == "error":
+            raise ConnectionResetError
+        self.fh.write(chunk)
+        return None, not self.chunks
+
+
+@pytest.fixture
+def storage(monkeypatch, tmp_path):
+    monkeypatch.setattr(http, "MediaIoBaseDownload", FakeDownload)
+    monkeypatch.setattr(file_storage, "GOOGLE_DRIVE", Dependency("google_drive_test", 1, 1))
+    storage = GoogleAPI.__new__(GoogleAPI)
+    storage.service = FakeService()
+    (tmp_path / "schedule.xlsx").write_bytes(b"old content")
+    return storage
+
+
+def test_download_replaces_file(storage, tmp_path):
+    storage.download_media("new", str(tmp_path / "schedule.xlsx"))
+    assert (tmp_path / "schedule.xlsx").read_bytes() == b"new content"
+    assert os.listdir(tmp_path) == ["schedule.xlsx"]
+
+
+def test_failed_download_keeps_old_file(storage, tmp_path):
+    with pytest.raises(ConnectionResetError):
+        storage.download_media("broken", str(tmp_path / "schedule.xlsx"))
+    assert (tmp_path / "schedule.xlsx").read_bytes() == b"old content"
+    assert os.listdir(tmp_path) == ["schedule.xlsx"]
@@ -0,0 +1,32 @@
+import pytest
+
+from ingress import Message, parse_event, parse_group_id
+
+
+def test_parse_event_message_new():
+    raw = {"type": "message_new", "object": {"message": {"peer_id": 5, "id": 7, "text": "привет"}}}
+    assert parse_event(raw) == Message(peer_id=5, message_id=7, text="привет")
+
+
+def test_parse_event_old_api_version():
+    raw = {"type": "message_new", "object": {"user_id": 5, "id": 7, "text": "привет"}}
+    assert parse_event(raw) == Message(peer_id=5, message_id=7, text="привет")
+
+
+@pytest.mark.parametrize("raw", [
+    {"type": "message_reply", "object": {"message": {"peer_id": 5, "id": 7, "text": "привет"}}},
+    {"type": "message_new", "object": {"message": {"peer_id": 5, "id": 7, "text": ""}}},
+    {"type": "message_new"},
+])
+def test_parse_event_skips_other_events(raw):
+    assert parse_event(raw) is None
+
+
+def test_parse_group_id():
+    assert parse_group_id(" 123 ") == 123
+
+
+@pytest.mark.parametrize("value", [None, "", "club123", "-123", "0"])
+def test_parse_group_id_invalid(value):
+    with pytest.raises(ValueError, match="VK_GROUP_ID"):
+        parse_group_id(value)
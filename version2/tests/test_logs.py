@@ -0,0 +1,66 @@
+import logging
+import os
+import subprocess
+import sys
+
+from logs import OWNER_VARIABLE, SamplingFilter, parse_rates, process_filename
+
+
+def make_record(level: int, func: str = "handler") -> logging.LogRecord:
+    record = logging.LogRecord("bot", level, __file__, 1, "message", None, None, func=func)
+    return record
+
+
+def test_parse_rates():
+    assert parse_rates("get_answer_text=0.01, settings=0.5,") == {"get_answer_text": 0.01, "settings": 0.5}
+    assert parse_rates("") == {}
+
+
+def test_sampling_filter_keeps_warnings():
+    sampling = SamplingFilter(default_rate=0)
+    assert not sampling.filter(make_record(logging.DEBUG))
+    assert sampling.filter(make_record(logging.WARNING))
+
+
+def test_sampling_filter_rate_by_function():
+    sampling = SamplingFilter(rates={"noisy": 0}, default_rate=1)
+    assert not sampling.filter(make_record(logging.DEBUG, func="noisy"))
+    assert sampling.filter(make_record(logging.DEBUG, func="quiet"))
+
+
+def test_process_filename():
+    assert process_filename("logs/debug.log", 1234) == os.path.join("logs", "debug.1234.log")
+    assert process_filename("debug", 1234) == "debug.1234"
+
+
+CHILD_PROCESS_SCRIPT = """
+import logging, multiprocessing, os, sys
+sys.path.insert(0, {path!r})
+from logs import setup_logging
+
+class Settings:
+    LEVEL, FILENAME, ERRORS_FILENAME = "INFO", "debug.log", "errors.log"
+    MAX_BYTES, BACKUP_COUNT, QUEUE_SIZE, SAMPLE, SAMPLE_DEFAULT = 1024 * 1024, 1, 100, "", 1.0
+
+def child():
+    logging.getLogger("bot").warning("child %s", os.getpid())
+
+setup_logging(Settings)
+logging.getLogger("bot").info("parent")
+process = multiprocessing.get_context("fork").Process(target=child)
+process.start()
+process.join()
+print(process.pid)
+"""
+
+
+def test_forked_process_writes_own_files(tmp_path):
+    environment = {key: value for key, value in os.environ.items() if key != OWNER_VARIABLE}
+    script = CHILD_PROCESS_SCRIPT.format(path=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    process = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env=environment,
+                             capture_output=True, text=True, check=True)
+    pid = process.stdout.strip()
+    assert "parent" in (tmp_path / "debug.log").read_text(encoding="utf-8")
+    assert "child" not in (tmp_path / "debug.log").read_text(encoding="utf-8")
+    assert f"child {pid}" in (tmp_path / f"debug.{pid}.log").read_text(encoding="utf-8")
+    assert f"child {pid}" in (tmp_path / f"errors.{pid}.log").read_text(encoding="utf-8")
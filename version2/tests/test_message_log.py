@@ -0,0 +1,74 @@
+import pytest
+
+from cache import MemoryCache
+from message_log import MessageLogWriter, RecentMessages
+from settings import VKTableName
+
+
+def test_memory_cache_add():
+    cache = MemoryCache(max_size=10)
+    assert cache.add("key")
+    assert not cache.add("key")
+    assert cache.get("key") is True
+
+
+def test_recent_messages_drops_duplicates():
+    recent = RecentMessages("vk", max_size=10)
+    assert not recent.is_duplicate(1, 100)
+    assert recent.is_duplicate(1, 100)
+    assert not recent.is_duplicate(2, 100)  # тот же id от другого пользователя
+    assert not recent.is_duplicate(1, 101)
+
+
+def test_recent_messages_forgets_old_ids():
+    recent = RecentMessages("vk", max_size=2)
+    recent.is_duplicate(1, 1), recent.is_duplicate(1, 2), recent.is_duplicate(1, 3)
+    assert not recent.is_duplicate(1, 1)
+    assert recent.is_duplicate(1, 3)
+
+
+class FakeMessages:
+    batches = []
+    fail = False
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+
+    def log_messages(self, rows: list) -> None:
+        if FakeMessages.fail:
+            raise ConnectionError("database is unavailable")
+        FakeMessages.batches.append([row[0] for row in rows])
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    FakeMessages.batches, FakeMessages.fail = [], False
+    writer = MessageLogWriter(VKTableName, batch_size=2, flush_interval=60, max_pending=3)
+    writer.Messages = FakeMessages
+    monkeypatch.setattr(writer, "start", lambda: None)  # без фонового потока, запись вызывается в тесте
+    return writer
+
+
+def test_flush_in_batches(writer):
+    for message_id in range(5):
+        writer.add(message_id, 1, "привет")
+    writer.flush()
+    assert FakeMessages.batches == [[0, 1], [2, 3], [4]]
+    assert writer.rows == []
+
+
+def test_failed_flush_keeps_newest_messages(writer):
+    FakeMessages.fail = True
+    for message_id in range(5):
+        writer.add(message_id, 1, "привет")
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    assert [row[0] for row in writer.rows] == [2, 3, 4]
+    FakeMessages.fail = False
+    writer.add(5, 1, "привет")
+    writer.flush()
+    assert FakeMessages.batches == [[2, 3], [4, 5]]
+
+
+def test_get_returns_one_writer_per_table():
+    assert MessageLogWriter.get(VKTableName) is MessageLogWriter.get(VKTableName)
@@ -0,0 +1,25 @@
+import datetime
+
+import pytest
+
+from partitions import month_start, BOUND_PATTERN
+
+
+UTC = datetime.timezone.utc
+
+
+@pytest.mark.parametrize("moment, months, expected", [
+    (datetime.datetime(2024, 5, 17, 13, 45, tzinfo=UTC), 0, datetime.datetime(2024, 5, 1, tzinfo=UTC)),
+    (datetime.datetime(2024, 5, 17), 1, datetime.datetime(2024, 6, 1, tzinfo=UTC)),
+    (datetime.datetime(2024, 12, 31, 23, 59), 1, datetime.datetime(2025, 1, 1, tzinfo=UTC)),
+    (datetime.datetime(2024, 1, 1), -1, datetime.datetime(2023, 12, 1, tzinfo=UTC)),
+    (datetime.datetime(2024, 3, 10), -14, datetime.datetime(2023, 1, 1, tzinfo=UTC)),
+    (datetime.datetime(2024, 3, 10), 22, datetime.datetime(2026, 1, 1, tzinfo=UTC)),
+])
+def test_month_start(moment, months, expected):
+    assert month_start(moment, months) == expected
+
+
+def test_bound_pattern():
+    bounds = "FOR VALUES FROM ('2024-05-01 00:00:00+00') TO ('2024-06-01 00:00:00+00')"
+    assert BOUND_PATTERN.search(bounds).groups() == ("'2024-05-01 00:00:00+00'", "'2024-06-01 00:00:00+00'")
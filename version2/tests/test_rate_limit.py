@@ -0,0 +1,65 @@
+import pytest
+
+import rate_limit
+from rate_limit import PeerThrottle, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_burst_then_notify_once(clock):
+    throttle = PeerThrottle(rate=1, capacity=3, max_peers=10)
+    assert [throttle.check(1) for _ in range(5)] == [
+        PeerThrottle.ALLOW, PeerThrottle.ALLOW, PeerThrottle.ALLOW, PeerThrottle.NOTIFY, PeerThrottle.DROP]
+
+
+def test_refill(clock):
+    throttle = PeerThrottle(rate=2, capacity=2, max_peers=10)
+    throttle.check(1), throttle.check(1)
+    assert throttle.check(1) == PeerThrottle.NOTIFY
+    clock.now += 0.5  # один токен
+    assert throttle.check(1) == PeerThrottle.ALLOW
+    assert throttle.check(1) == PeerThrottle.NOTIFY  # после разрешенного сообщения уведомление снова возможно
+
+
+def test_refill_is_capped(clock):
+    throttle = PeerThrottle(rate=1, capacity=2, max_peers=10)
+    throttle.check(1)
+    clock.now += 100
+    assert [throttle.check(1) for _ in range(3)] == [PeerThrottle.ALLOW, PeerThrottle.ALLOW, PeerThrottle.NOTIFY]
+
+
+def test_peers_are_independent(clock):
+    throttle = PeerThrottle(rate=1, capacity=1, max_peers=10)
+    assert throttle.check(1) == PeerThrottle.ALLOW
+    assert throttle.check(1) == PeerThrottle.NOTIFY
+    assert throttle.check(2) == PeerThrottle.ALLOW
+
+
+def test_least_recently_used_peer_is_evicted(clock):
+    throttle = PeerThrottle(rate=1, capacity=1, max_peers=2)
+    throttle.check(1), throttle.check(2)
+    throttle.check(1)  # 1 используется чаще и остается
+    throttle.check(3)
+    assert list(throttle.buckets) == [1, 3]
+    assert throttle.check(2) == PeerThrottle.ALLOW  # вытесненный пользователь начинает с полного ведра
+
+
+def test_token_bucket_try_acquire(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now += 0.1
+    assert bucket.try_acquire()
@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+from reserved import ReservedIndex, edit_distance, normalize
+from settings import TextToAnswer
+
+
+@pytest.mark.parametrize("first, second, expected", [
+    ("расписание", "расписание", 0),
+    ("расписание", "расписане", 1),  # удаление
+    ("расписание", "расписанние", 1),  # вставка
+    ("расписание", "распесание", 1),  # замена
+    ("расписание", "рапсисание", 1),  # перестановка соседних символов
+    ("", "abc", 3),
+])
+def test_edit_distance(first, second, expected):
+    assert edit_distance(first, second, limit=5) == expected
+
+
+def test_edit_distance_stops_at_limit():
+    assert edit_distance("расписание", "лекции", limit=1) == 2
+    assert edit_distance("a", "abcdef", limit=2) == 3
+
+
+def test_normalize():
+    assert normalize("  Ещё   РАЗ!! ") == "еще раз"
+
+
+def write_keyboard(path, *labels):
+    buttons = [[{"action": {"type": "text", "label": label}} for label in labels]]
+    path.write_text(json.dumps({"buttons": buttons}, ensure_ascii=False), encoding="utf-8")
+
+
+@pytest.fixture
+def keyboard(tmp_path):
+    path = tmp_path / "keyboard.json"
+    write_keyboard(path, "Консультация", "Кафедра")
+
+    class KeyboardName:
+        START = str(path)
+
+    return path, KeyboardName
+
+
+def make_index(keyboard_name, **kwargs) -> ReservedIndex:
+    return ReservedIndex(vocabulary=["1 курс"], keyboard_names=(keyboard_name,), **kwargs)
+
+
+def test_exact_phrases(keyboard):
+    index = make_index(keyboard[1], max_distance=0)
+    assert index.is_reserved("консультация")
+    assert index.is_reserved("Кафедра!")
+    assert index.is_reserved("1   курс")
+    assert index.is_reserved(TextToAnswer.PROFILE)
+    assert not index.is_reserved("консультаця")
+    assert not index.is_reserved("как дела")
+
+
+def test_commands_with_arguments(keyboard):
+    index = make_index(keyboard[1])
+    assert index.is_reserved(f"{TextToAnswer.BROADCAST} всем привет")
+
+
+def test_one_typo(keyboard):
+    index = make_index(keyboard[1], max_distance=1, min_fuzzy_length=8)
+    assert index.is_reserved("консультаця")
+    assert index.is_reserved("конусльтация")
+    assert not index.is_reserved("кнсультаця")  # две опечатки
+    assert index.is_reserved("кафедра")
+    assert not index.is_reserved("кафедрa")  # короткие фразы только точно
+
+
+def test_rebuilds_when_keyboard_changes(keyboard):
+    path, keyboard_name = keyboard
+    index = make_index(keyboard_name, max_distance=0, check_interval=0)
+    assert not index.is_reserved("семинары")
+    write_keyboard(path, "Семинары")
+    os.utime(path, ns=(index.mtimes[str(path)] + 10 ** 9,) * 2)
+    assert index.is_reserved("семинары")
+    assert not index.is_reserved("кафедра")
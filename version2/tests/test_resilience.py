@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+import requests
+
+import resilience
+from resilience import (Bulkhead, BulkheadFullError, CircuitBreaker, CircuitOpenError, Dependency,
+                        with_timeout)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker("test_open", failure_threshold=2, reset_timeout=30)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_failures(clock):
+    breaker = CircuitBreaker("test_reset", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe(clock):
+    breaker = CircuitBreaker("test_probe", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()  # пробный запрос
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # второй запрос во время пробного отклоняется
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_probe_is_retried(clock):
+    breaker = CircuitBreaker("test_cancel", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+    breaker.cancel_probe()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_bulkhead_rejects_when_full():
+    bulkhead = Bulkhead("test_bulkhead", max_concurrent=1, max_wait=0.01)
+    bulkhead.acquire()
+    with pytest.raises(BulkheadFullError):
+        bulkhead.acquire()
+    bulkhead.release()
+    bulkhead.acquire()
+
+
+def test_guard_records_failure():
+    dependency = Dependency("test_guard", timeout=1, max_concurrent=1, failure_threshold=1, reset_timeout=30)
+    with pytest.raises(ValueError):
+        with dependency.guard("method"):
+            raise ValueError
+    with pytest.raises(CircuitOpenError):
+        with dependency.guard("method"):
+            pass
+
+
+def test_guard_releases_slot():
+    dependency = Dependency("test_guard_slot", timeout=1, max_concurrent=1, max_wait=0.01)
+    for _ in range(3):
+        with dependency.guard("method"):
+            pass
+
+
+def test_call_returns_result_and_raises_errors():
+    dependency = Dependency("test_call", timeout=1, max_concurrent=1, failure_threshold=5)
+    assert dependency.call("method", lambda x: x * 2, 21) == 42
+    with pytest.raises(ZeroDivisionError):
+        dependency.call("method", lambda: 1 / 0)
+    assert dependency.breaker.failures == 1
+
+
+def test_call_timeout_holds_slot_until_function_ends():
+    dependency = Dependency("test_call_timeout", timeout=0.05, max_concurrent=1, max_wait=0.01)
+    finished = threading.Event()
+    with pytest.raises(TimeoutError):
+        dependency.call("method", lambda: (time.sleep(0.3), finished.set()))
+    with pytest.raises(BulkheadFullError):  # зависший вызов еще занимает место
+        dependency.call("method", lambda: None)
+    finished.wait(1)
+    time.sleep(0.01)
+    assert dependency.call("method", lambda: "ok") == "ok"
+
+
+def test_with_timeout_sets_default():
+    calls = []
+    session = requests.Session()
+    session.request = lambda method, url, **kwargs: calls.append(kwargs)
+    with_timeout(session, 7)
+    session.get("http://example.invalid")
+    session.get("http://example.invalid", timeout=1)
+    assert [kwargs["timeout"] for kwargs in calls] == [7, 1]
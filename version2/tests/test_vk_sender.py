@@ -0,0 +1,86 @@
+import json
+import re
+import threading
+
+import vk_api
+
+from vk_sender import VkSender
+
+CALL = re.compile(r"API\.([\w.]+)\((\{.*?\})\)(?=,API\.|\];$)")
+
+
+class FakeVk:
+    """Отвечает ошибкой с заданным кодом на первые failures[text] попыток отправить сообщение text"""
+
+    def __init__(self, failures: dict, code: int = 6):
+        self.failures = dict(failures)
+        self.code = code
+        self.delivered = []
+        self.executes = 0
+        self.lock = threading.Lock()
+
+    def error(self, method: str) -> dict:
+        return {"method": method, "error_code": self.code, "error_msg": "Too many requests per second"}
+
+    def send(self, method: str, params: dict):
+        with self.lock:
+            if self.failures.get(params["message"], 0) > 0:
+                self.failures[params["message"]] -= 1
+                return False
+            self.delivered.append(params["message"])
+            return 1
+
+    def method(self, method: str, params: dict, raw: bool = False):
+        if method != "execute":
+            if self.send(method, params) is False:
+                raise vk_api.ApiError(self, method, params, raw, self.error(method))
+            return 1
+        self.executes += 1
+        calls = [(name, json.loads(params_json)) for name, params_json in CALL.findall(params["code"])]
+        results = [self.send(name, call_params) for name, call_params in calls]
+        return {"response": results,
+                "execute_errors": [self.error(name) for (name, _), result in zip(calls, results) if result is False]}
+
+
+def make_sender(vk: FakeVk) -> VkSender:
+    sender = VkSender(vk, rate=1000)
+    sender.linger = 0.05
+    sender.retry_delay = 0.01
+    return sender
+
+
+def test_transient_errors_in_execute_are_retried():
+    vk = FakeVk({"b": 1, "c": 2})
+    sender = make_sender(vk)
+    errors = []
+    for text in "abcd":
+        sender.send("messages.send", on_error=errors.append, peer_id=1, message=text, random_id=0)
+    sender.join()
+    assert vk.executes >= 1
+    assert sorted(vk.delivered) == ["a", "b", "c", "d"]
+    assert errors == []
+
+
+def test_on_error_after_attempts_exhausted():
+    vk = FakeVk({"a": 100})
+    sender = make_sender(vk)
+    errors = []
+    sender.send("messages.send", on_error=errors.append, peer_id=1, message="a", random_id=0)
+    sender.join()
+    sender.callbacks.shutdown(wait=True)
+    assert vk.failures["a"] == 100 - sender.retry_attempts
+    assert [error["error_code"] for error in errors] == [6]
+    assert vk.delivered == []
+
+
+def test_other_errors_are_not_retried():
+    vk = FakeVk({"a": 100}, code=901)
+    sender = make_sender(vk)
+    errors = []
+    sender.send("messages.send", on_error=errors.append, peer_id=1, message="a", random_id=0)
+    sender.send("messages.send", on_error=errors.append, peer_id=1, message="b", random_id=0)
+    sender.join()
+    sender.callbacks.shutdown(wait=True)
+    assert vk.failures["a"] == 99
+    assert [error["error_code"] for error in errors] == [901]
+    assert vk.delivered == ["b"]
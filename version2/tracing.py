@@ -0,0 +1,346 @@
+"""
+Трассировка обработки сообщений
+
+Каждое входящее сообщение получает trace id (start_trace), внутри него записываются вложенные
+интервалы (span): обработчики Answerer, запросы к базе данных, вызовы внешних API, отправка ответа.
+Текущая трасса хранится в contextvars, поэтому вне трассы span почти ничего не стоит.
+После завершения трассы решается, сохранять ли ее (tail sampling): сохраняются медленные трассы,
+трассы с ошибками и доля sample_rate остальных. Сохраненные трассы экспортируются фоновым потоком
+в файл JSON lines или в OTLP/HTTP коллектор.
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from abc import ABCMeta, abstractmethod, ABC
+
+from settings import TracingSettings, logger
+
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+
+
+def new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+class Span:
+    """Интервал трассы
+
+    Attributes
+    ----------
+    name: str
+        Название операции
+    attributes: dict
+        Дополнительные сведения (таблица, метод API, id пользователя)
+    span_id: str
+        id интервала
+    parent_id: str
+        id родительского интервала, None для корневого
+    start: float
+        Время начала (unix time)
+    duration: float
+        Длительность в секундах
+    error: str
+        Исключение, если операция завершилась ошибкой
+    """
+    __slots__ = ("name", "attributes", "trace", "span_id", "parent_id", "start", "duration", "error",
+                 "_perf_start", "_token")
+
+    def __init__(self, name: str, trace: "Trace", attributes: dict):
+        self.name = name
+        self.trace = trace
+        self.attributes = attributes
+        self.span_id = new_id(8)
+        self.parent_id = None
+        self.start = 0.0
+        self.duration = 0.0
+        self.error = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self._perf_start
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc_value}"
+            self.trace.error = True
+        _current_span.reset(self._token)
+        self.trace.add(self)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Интервал вне трассы: ничего не записывает"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Трасса обработки одного сообщения
+
+    Attributes
+    ----------
+    trace_id: str
+        id трассы
+    spans: list
+        Завершенные интервалы (не больше max_spans)
+    error: bool
+        True, если в трассе была ошибка
+    """
+    def __init__(self, max_spans: int):
+        self.trace_id = new_id(16)
+        self.spans = []
+        self.max_spans = max_spans
+        self.dropped = 0
+        self.error = False
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+
+class _TraceScope:
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict):
+        self.tracer = tracer
+        self.trace = Trace(tracer.max_spans)
+        self.root = Span(name, self.trace, attributes)
+
+    def __enter__(self) -> Span:
+        self._token = _current_trace.set(self.trace)
+        return self.root.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.root.__exit__(exc_type, exc_value, traceback)
+        _current_trace.reset(self._token)
+        self.tracer.finish(self.trace, self.root)
+        return False
+
+
+class IExporter(ABC):
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def export(self, traces: list) -> None:
+        raise NotImplementedError
+
+
+class JsonLinesExporter(IExporter):
+    """Запись интервалов в файл, по одному json объекту на строку"""
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def export(self, traces: list) -> None:
+        with open(self.filename, "a", encoding="utf-8") as file:
+            for trace in traces:
+                for span in trace.spans:
+                    file.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+class OTLPExporter(IExporter):
+    """Отправка трасс в коллектор OpenTelemetry по протоколу OTLP/HTTP (json)
+
+    https://opentelemetry.io/docs/specs/otlp/#otlphttp
+    """
+    def __init__(self, endpoint: str, service_name: str = "bot"):
+        self.endpoint = endpoint
+        self.service_name = service_name
+
+    @staticmethod
+    def attribute(key: str, value) -> dict:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def to_otlp(self, trace: Trace, span: Span) -> dict:
+        start = int(span.start * 1e9)
+        result = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(span.duration * 1e9)),
+            "attributes": [self.attribute(key, value) for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            result["parentSpanId"] = span.parent_id
+        return result
+
+    def export(self, traces: list) -> None:
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [self.attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "bot.tracing"},
+                "spans": [self.to_otlp(trace, span) for trace in traces for span in trace.spans],
+            }],
+        }]}
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(body, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        urllib.request.urlopen(request, timeout=5).close()
+
+
+class Tracer:
+    """Создание трасс, tail sampling и фоновый экспорт
+
+    Attributes
+    ----------
+    exporter: IExporter
+        Куда сохраняются трассы, None - трассировка выключена
+    slow: float
+        Трассы не короче slow секунд сохраняются всегда
+    sample_rate: float
+        Доля сохраняемых быстрых трасс без ошибок
+    max_spans: int
+        Максимальное количество интервалов в трассе
+    """
+    def __init__(self, exporter: IExporter = None, slow: float = 1.0, sample_rate: float = 0.0,
+                 max_spans: int = 500, batch_size: int = 100):
+        self.exporter = exporter
+        self.slow = slow
+        self.sample_rate = sample_rate
+        self.max_spans = max_spans
+        self.batch_size = batch_size
+        self.queue = None
+        self.pid = None
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def start_trace(self, name: str, **attributes):
+        """
+        Начало трассы (используется в with)
+
+        Parameters
+        ----------
+        name: str
+            Название корневого интервала
+        attributes:
+            Сведения о трассе, например peer_id
+
+        Returns
+        -------
+        contextmanager
+            Корневой интервал
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+        return _TraceScope(self, name, attributes)
+
+    def finish(self, trace: Trace, root: Span) -> None:
+        if not (root.duration >= self.slow or trace.error or random.random() < self.sample_rate):
+            return
+        root.attributes["spans_dropped"] = trace.dropped
+        try:
+            self.get_queue().put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def get_queue(self) -> queue.Queue:
+        # поток экспорта создается при первой сохраненной трассе и заново в каждом процессе после fork
+        if self.pid != os.getpid():
+            with self._lock:
+                if self.pid != os.getpid():
+                    self.queue = queue.Queue(1000)
+                    threading.Thread(target=self.worker, args=(self.queue,), name="Tracer", daemon=True).start()
+                    self.pid = os.getpid()
+        return self.queue
+
+    def worker(self, traces: queue.Queue) -> None:
+        while True:
+            batch = [traces.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(traces.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.exporter.export(batch)
+            except Exception:
+                logger.warning("Tracer: export of %s traces failed", len(batch), exc_info=True)
+
+
+def make_exporter(settings):
+    if settings.EXPORTER == "jsonl":
+        return JsonLinesExporter(settings.FILENAME)
+    if settings.EXPORTER == "otlp":
+        return OTLPExporter(settings.OTLP_ENDPOINT, settings.SERVICE_NAME)
+    return None
+
+
+tracer = Tracer(
+    exporter=make_exporter(TracingSettings),
+    slow=TracingSettings.SLOW_MS / 1000,
+    sample_rate=TracingSettings.SAMPLE_RATE,
+    max_spans=TracingSettings.MAX_SPANS
+)
+
+
+def start_trace(name: str, **attributes):
+    return tracer.start_trace(name, **attributes)
+
+
+def span(name: str, **attributes):
+    """
+    Интервал внутри текущей трассы (используется в with)
+
+    Parameters
+    ----------
+    name: str
+        Название операции
+    attributes:
+        Дополнительные сведения
+
+    Returns
+    -------
+    contextmanager
+        Интервал, если есть текущая трасса, иначе пустой контекст
+    """
+    if (trace := _current_trace.get()) is None:
+        return NOOP_SPAN
+    return Span(name, trace, attributes)
+
+
+def current_trace_id() -> str:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else ""
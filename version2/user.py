@@ -63,7 +63,7 @@ class SQLUser(IUser):
 
     def log_user(self, user_id, name, surname):
         query = sql.SQL("""
-        INSERT INTO {table_name}
+        INSERT INTO {table_name} (user_id, name, surname, datetime)
         VALUES ({user_id}, {name}, {surname}, {time})
         ON CONFLICT (user_id) DO NOTHING;
         """).format(
@@ -71,7 +71,7 @@ class SQLUser(IUser):
             user_id=sql.Literal(user_id),
             name=sql.Literal(name),
             surname=sql.Literal(surname),
-            time=sql.Literal(datetime.datetime.now())
+            time=sql.Literal(datetime.datetime.now(datetime.timezone.utc))
         )
         self.SQL().execute_query(query)
 
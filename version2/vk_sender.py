@@ -0,0 +1,251 @@
+import heapq
+import itertools
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import vk_api
+
+from metrics import QUEUE_DEPTH, external_call
+from rate_limit import TokenBucket
+from settings import VKSenderSettings, logger
+
+
+class VkSender:
+    """Класс для отправки запросов к VkAPI с учетом ограничения на частоту запросов
+
+    Все запросы проходят через общее ведро токенов (не больше rate запросов в секунду).
+    Запросы, поставленные в очередь методом send, отправляет фоновый поток: накопившиеся
+    запросы (до 25) объединяются в один вызов метода execute. Запросы выполняются
+    в порядке постановки в очередь, поэтому сообщения одному пользователю приходят по порядку.
+    Обработчики ошибок выполняются в отдельном потоке, чтобы повторная загрузка вложения
+    не задерживала отправку остальных запросов.
+    Запросы, не выполненные из-за временной ошибки VkAPI (коды 6, 9, 10), повторяются
+    с нарастающей задержкой; обработчик ошибки вызывается, только когда попытки исчерпаны.
+
+    https://vk.com/dev/execute
+
+    Attributes
+    ----------
+    vk: vk_api.VkApi
+        Авторизация вк
+    limiter: TokenBucket
+        Ограничитель частоты запросов
+    queue: queue.Queue
+        Очередь запросов, ожидающих отправки
+    delayed: list
+        Куча запросов, ожидающих повторной отправки, упорядоченная по времени отправки
+    callbacks: ThreadPoolExecutor
+        Поток, в котором выполняются обработчики ошибок
+    """
+    MAX_BATCH = 25  # ограничение VkAPI на количество вызовов в одном execute
+    RETRY_CODES = (6, 9, 10)  # слишком много запросов в секунду, flood control, внутренняя ошибка сервера
+
+    def __init__(self, vk: vk_api.VkApi, rate: float = VKSenderSettings.RATE):
+        self.vk = vk
+        self.limiter = TokenBucket(rate=rate)
+        self.queue = queue.Queue()
+        self.linger = VKSenderSettings.LINGER
+        self.max_code_size = VKSenderSettings.MAX_CODE_SIZE
+        self.postponed = None
+        self.retry_attempts = VKSenderSettings.RETRY_ATTEMPTS
+        self.retry_delay = VKSenderSettings.RETRY_DELAY
+        self.delayed = []  # используется только фоновым потоком
+        self.delayed_counter = itertools.count()
+        self.callbacks = ThreadPoolExecutor(max_workers=1, thread_name_prefix="VkSender-callbacks")
+        QUEUE_DEPTH.set_function("vk_sender", function=self.queue.qsize)
+        self.thread = threading.Thread(target=self.worker, name="VkSender", daemon=True)
+        self.thread.start()
+
+    def call(self, method: str, **params):
+        """
+        Синхронный вызов метода VkAPI с учетом ограничения частоты
+
+        Parameters
+        ----------
+        method: str
+            Название метода, например "photos.getMessagesUploadServer"
+        params:
+            Параметры метода
+
+        Returns
+        -------
+        Ответ VkAPI
+        """
+        self.limiter.acquire()
+        with external_call("vk", method):
+            return self.vk.method(method, params)
+
+    def send(self, method: str, on_error=None, **params) -> None:
+        """
+        Постановка вызова метода VkAPI в очередь на отправку
+
+        Parameters
+        ----------
+        method: str
+            Название метода, например "messages.send"
+        on_error: callable, default None
+            Функция, вызываемая с описанием ошибки, если вызов не удался
+        params:
+            Параметры метода
+
+        Returns
+        -------
+        None
+        """
+        self.queue.put((method, params, on_error, 1))
+
+    def join(self) -> None:
+        """
+        Ожидание отправки всех запросов из очереди
+
+        Returns
+        -------
+        None
+        """
+        self.queue.join()
+
+    def next_item(self) -> tuple:
+        """
+        Ожидание следующего запроса: из очереди или среди отложенных для повтора
+
+        Returns
+        -------
+        tuple
+            Запрос (метод, параметры, обработчик ошибки, номер попытки)
+        """
+        while True:
+            if self.delayed:
+                timeout = self.delayed[0][0] - time.monotonic()
+                if timeout <= 0:
+                    return heapq.heappop(self.delayed)[2]
+            else:
+                timeout = None
+            try:
+                return self.queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+    def next_batch(self) -> list:
+        """
+        Получение из очереди следующей пачки запросов
+
+        Первый запрос ожидается без ограничения времени (с учетом отложенных для повтора),
+        остальные - не дольше linger секунд.
+        Запрос, не поместившийся в ограничение на размер кода execute, откладывается в начало следующей пачки.
+
+        Returns
+        -------
+        list
+            Список запросов (метод, параметры, обработчик ошибки, номер попытки)
+        """
+        if self.postponed is not None:
+            batch, self.postponed = [self.postponed], None
+        else:
+            batch = [self.next_item()]
+        code_size = len(self.to_vkscript(*batch[0][:2]))
+        while len(batch) < self.MAX_BATCH:
+            try:
+                item = self.queue.get(timeout=self.linger)
+            except queue.Empty:
+                break
+            item_size = len(self.to_vkscript(*item[:2]))
+            if code_size + item_size > self.max_code_size:
+                self.postponed = item
+                break
+            code_size += item_size
+            batch.append(item)
+        return batch
+
+    @staticmethod
+    def to_vkscript(method: str, params: dict) -> str:
+        return f"API.{method}({json.dumps(params, ensure_ascii=False)})"
+
+    def execute(self, batch: list) -> int:
+        """
+        Отправка пачки запросов
+
+        Один запрос отправляется напрямую, несколько - одним вызовом execute
+
+        Parameters
+        ----------
+        batch: list
+            Список запросов (метод, параметры, обработчик ошибки, номер попытки)
+
+        Returns
+        -------
+        int
+            Количество запросов, отложенных для повтора
+        """
+        self.limiter.acquire()
+        if len(batch) == 1:
+            method, params, *_ = batch[0]
+            try:
+                with external_call("vk", method):
+                    self.vk.method(method, params)
+            except vk_api.ApiError as e:
+                return int(self.fail(batch[0], e.error))
+            return 0
+        code = "return [" + ",".join(self.to_vkscript(method, params) for method, params, *_ in batch) + "];"
+        try:
+            with external_call("vk", "execute"):
+                response = self.vk.method("execute", {"code": code}, raw=True)
+        except vk_api.ApiError as e:  # ошибка всего execute: не выполнен ни один запрос пачки
+            return sum(self.fail(item, e.error) for item in batch)
+        results = response.get("response") or [False] * len(batch)
+        errors = iter(response.get("execute_errors", []))
+        return sum(self.fail(item, next(errors, None)) for item, result in zip(batch, results) if result is False)
+
+    def fail(self, item, error) -> bool:
+        """
+        Обработка неудавшегося запроса
+
+        Запрос с временной ошибкой откладывается для повтора, пока не исчерпаны попытки,
+        иначе вызывается обработчик ошибки
+
+        Parameters
+        ----------
+        item: tuple
+            Запрос (метод, параметры, обработчик ошибки, номер попытки)
+        error: dict or None
+            Описание ошибки от VkAPI
+
+        Returns
+        -------
+        bool
+            True, если запрос отложен для повтора
+        """
+        method, params, on_error, attempt = item
+        code = error.get("error_code") if isinstance(error, dict) else None
+        if code in self.RETRY_CODES and attempt < self.retry_attempts:
+            delay = self.retry_delay * 2 ** (attempt - 1)
+            logger.warning("VkSender: %s failed with code %s, retry %s in %s s", method, code, attempt, delay)
+            heapq.heappush(self.delayed, (time.monotonic() + delay, next(self.delayed_counter),
+                                          (method, params, on_error, attempt + 1)))
+            return True
+        logger.error("VkSender: %s failed: %s", method, error)
+        if on_error is not None:
+            self.callbacks.submit(self.run_callback, on_error, error)
+        return False
+
+    @staticmethod
+    def run_callback(on_error, error) -> None:
+        try:
+            on_error(error)
+        except Exception:
+            logger.error("VkSender: on_error callback failed", exc_info=True)
+
+    def worker(self) -> None:
+        while True:
+            batch = self.next_batch()
+            retried = 0
+            try:
+                retried = self.execute(batch)
+            except Exception:
+                logger.error("VkSender: batch of %s requests failed", len(batch), exc_info=True)
+            finally:
+                # отложенный для повтора запрос остается незавершенным, чтобы join дождался его отправки
+                for _ in range(len(batch) - retried):
+                    self.queue.task_done()
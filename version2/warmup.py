@@ -0,0 +1,130 @@
+"""
+Прогрев бота перед началом обработки сообщений
+
+После перезапуска первые пользователи ждали бы скачивания файлов с Google диска, разбора xlsx и csv,
+подключения к базе данных и построения индексов. Прогрев выполняет все это параллельно до того,
+как бот начнет получать события, и затем сообщает о готовности: /ready http сервера метрик
+начинает отвечать 200, и, если задан READY_FILE, создается файл готовности.
+Ошибка одной из задач прогрева не останавливает запуск: эти данные загрузятся при первом сообщении.
+"""
+import atexit
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from attachments import SQLAttachments
+from metrics import READY
+from postgres import PostgreSQL
+from settings import FileName, WarmupSettings, logger
+
+
+class Warmup:
+    """Прогрев процесса
+
+    Attributes
+    ----------
+    config: Config
+        Реализации, которые использует Answerer
+    platform: PlatformVK или PlatformTG
+        Платформа, для которой прогреваются база данных и кэши
+    files: bool
+        Скачивать файлы и готовить ссылки, расписания и индекс зарезервированных фраз
+    database: bool
+        Открывать соединения с базой данных и загружать кэш вложений. Процесс, который потом
+        запускает процессы-обработчики (fork), не должен открывать соединения до их запуска
+    before_fork: bool
+        Прогрев перед fork: run дожидается завершения всех запущенных задач даже после timeout,
+        чтобы fork не скопировал поток, который держит блокировку (логов, http соединения)
+    """
+    def __init__(self, config, platform, files: bool = True, database: bool = True, before_fork: bool = False,
+                 workers: int = WarmupSettings.WORKERS, timeout: float = WarmupSettings.TIMEOUT):
+        self.config = config
+        self.platform = platform
+        self.files = files
+        self.database = database
+        self.before_fork = before_fork
+        self.workers = workers
+        self.timeout = timeout
+
+    def tasks(self) -> dict:
+        tasks = {}
+        if self.database:
+            tasks["database"] = lambda: PostgreSQL().execute_read_query("SELECT 1;", one=True)
+            tasks["attachments"] = lambda: SQLAttachments(self.platform.table_name).preload()
+        if self.files:
+            messages = self.config.messages(self.platform.table_name)
+            tasks["reserved"] = lambda: messages.is_reserved("")
+            for course, file_name in FileName.LINKS.items():
+                tasks[f"links {course}"] = lambda file_name=file_name: len(self.config.links(file_name).subjects)
+            # страницы одного файла расписания читаются по очереди, чтобы файл скачивался один раз
+            tasks["schedule"] = lambda: sum(self.config.schedule.compile(FileName.SCHEDULE, course, groups)
+                                            for course, groups in zip(messages.courses, messages.groups))
+        return tasks
+
+    def run(self) -> dict:
+        """
+        Параллельное выполнение задач прогрева
+
+        Returns
+        -------
+        dict
+            Задача -> время выполнения в секундах или None, если задача не выполнена
+        """
+        if not WarmupSettings.ENABLED:
+            return {}
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="Warmup")
+        futures = {executor.submit(self.timed, name, task): name for name, task in self.tasks().items()}
+        done, not_done = wait(futures, timeout=self.timeout)
+        if not_done:
+            logger.warning("Warmup.run(): %s not finished in %s s", [futures[future] for future in not_done],
+                           self.timeout)
+        # не начатые задачи отменяются, уже выполняемые перед fork дожидаются
+        executor.shutdown(wait=self.before_fork, cancel_futures=True)
+        results = {}
+        for future, name in futures.items():
+            results[name] = future.result() if future.done() and not future.cancelled() else None
+        logger.info("Warmup.run(): finished in %.2f s: %s", time.monotonic() - started,
+                    ", ".join(f"{name} {seconds:.2f} s" if seconds is not None else f"{name} failed"
+                              for name, seconds in results.items()))
+        return results
+
+    @staticmethod
+    def timed(name: str, task):
+        started = time.monotonic()
+        try:
+            task()
+        except Exception:
+            logger.error("Warmup.run(): %s failed", name, exc_info=True)
+            return None
+        return time.monotonic() - started
+
+
+def remove_ready_file(ready_file: str = WarmupSettings.READY_FILE) -> None:
+    if ready_file:
+        try:
+            os.remove(ready_file)
+        except FileNotFoundError:
+            pass
+
+
+def mark_ready(ready_file: str = WarmupSettings.READY_FILE) -> None:
+    """
+    Сообщение о готовности процесса к обработке сообщений
+
+    Parameters
+    ----------
+    ready_file: str
+        Файл готовности, пустая строка - только /ready. Файл удаляется при завершении процесса
+
+    Returns
+    -------
+    None
+    """
+    READY.set()
+    if ready_file:
+        with open(ready_file + ".tmp", "w", encoding="utf-8") as file:
+            file.write(f"{os.getpid()} {time.time():.0f}\n")
+        os.replace(ready_file + ".tmp", ready_file)
+        atexit.register(remove_ready_file, ready_file)
+    logger.info("mark_ready(): process %s is ready", os.getpid())